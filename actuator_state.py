@@ -0,0 +1,550 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import metrics
+from file_utils import write_json
+from latency import LatencyStats
+
+# Last commanded state of every actuator topic, survives restarts
+ACTUATOR_STATE = os.getenv("ACTUATOR_STATE", ".config/actuators.json")
+# A change within this many seconds of the previous send waits for the window
+# to close; flapping back in the meantime sends nothing at all
+ACTUATOR_WINDOW = float(os.getenv("ACTUATOR_WINDOW", "2"))
+ACTUATOR_QOS = int(os.getenv("ACTUATOR_QOS", "1"))
+ACTUATOR_ACK_TIMEOUT = float(os.getenv("ACTUATOR_ACK_TIMEOUT", "10"))
+# Devices echo their state on <topic><suffix> (e.g. "Pump/LEFT/status"), unset = off
+ACTUATOR_STATUS_SUFFIX = os.getenv("ACTUATOR_STATUS_SUFFIX")
+ACTUATOR_CONFIRM_TIMEOUT = float(os.getenv("ACTUATOR_CONFIRM_TIMEOUT", "15"))
+ACTUATOR_MAX_RESENDS = int(os.getenv("ACTUATOR_MAX_RESENDS", "3"))
+
+log = logging.getLogger("actuator_state")
+
+ACK_SECONDS = metrics.histogram(
+    "garden_actuator_ack_seconds", "Command publish to broker PUBACK"
+)
+CONFIRM_SECONDS = metrics.histogram(
+    "garden_actuator_confirm_seconds", "Command publish to matching device status"
+)
+
+
+def _count(topic, result):
+    metrics.counter(
+        "garden_actuator_commands_total",
+        "Actuator commands by outcome (sent, resent, duplicate, coalesced)",
+        actuator=topic,
+        result=result,
+    ).inc()
+
+
+#! ---------------------------- ACTUATOR STATE ----------------------------
+
+
+# * Single point every actuator command goes through:
+# - the last sent state per topic is persisted, so a restart does not
+#   re-command every device, and repeats of the current state are dropped
+# - a change inside `window` seconds of the previous send is held back until
+#   the window closes; flapping back to the sent state cancels it
+# - QoS 1 (retained) publishes, PUBACKs tracked per message id
+# - optional device status topics confirm the state; silence or drift resends
+class ActuatorState:
+    def __init__(
+        self,
+        client,
+        path=ACTUATOR_STATE,
+        window=ACTUATOR_WINDOW,
+        qos=ACTUATOR_QOS,
+        retain=True,
+        ack_timeout=ACTUATOR_ACK_TIMEOUT,
+        confirm_timeout=ACTUATOR_CONFIRM_TIMEOUT,
+        max_resends=ACTUATOR_MAX_RESENDS,
+        clock=time.monotonic,
+    ):
+        self.client = client
+        self.path = path
+        self.window = window
+        self.qos = qos
+        self.retain = retain
+        self.ack_timeout = ack_timeout
+        self.confirm_timeout = confirm_timeout
+        self.max_resends = max_resends
+        self.clock = clock
+        # dispatch(func, *args) runs the publish elsewhere, e.g. on the event
+        # loop that owns the client (None: publish from the calling thread)
+        self.dispatch = None
+
+        # topic -> {"state", "at" (epoch), "confirmed"}: what gets persisted
+        self.actuators = {}
+        # topic -> (value, send at, retain) held back by the window
+        self._pending = {}
+        self._last_sent = {}
+        # mid -> (topic, value, sent at)
+        self._inflight = {}
+        # topic -> (value, deadline, resends) waiting for a device status
+        self._awaiting = {}
+        self._watched = set()
+        self.counts = {
+            "sent": 0,
+            "resent": 0,
+            "duplicate": 0,
+            "coalesced": 0,
+            "acked": 0,
+            "ack_timeouts": 0,
+            "confirmed": 0,
+            "drift": 0,
+        }
+        self.ack_latency = LatencyStats()
+        self.confirm_latency = LatencyStats()
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._dirty = False
+        self._stop = False
+        self._thread = None
+        self.load()
+
+        # paho has one on_publish slot: keep whoever had it before us
+        self._chained = getattr(client, "on_publish", None)
+        if hasattr(client, "on_publish"):
+            client.on_publish = self.on_publish
+        metrics.gauge(
+            "garden_actuator_inflight", "Unacked QoS 1 commands", self._inflight.__len__
+        )
+
+    #! ---------------------------- STATE ----------------------------
+
+    # path=None: in-memory only (benchmarks)
+    def load(self):
+        self.actuators = {}
+        if not self.path:
+            return self
+        try:
+            with open(self.path) as f:
+                self.actuators = json.load(f)
+        except FileNotFoundError:
+            self.actuators = {}
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable %s: %s", self.path, e)
+            self.actuators = {}
+        return self
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            snapshot = {topic: dict(entry) for topic, entry in self.actuators.items()}
+        with self._save_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            write_json(self.path, snapshot)
+
+    # * Last sent state of `topic` (None: never commanded)
+    def state(self, topic):
+        entry = self.actuators.get(topic)
+        return entry["state"] if entry else None
+
+    def states(self):
+        with self._lock:
+            return {topic: entry["state"] for topic, entry in self.actuators.items()}
+
+    #! ---------------------------- COMMANDs ----------------------------
+
+    # * Request `value` on `topic`. Returns "sent", "deferred" (held by the
+    # window), "duplicate" (already in that state) or "coalesced" (cancelled
+    # a held-back change). window / retain override the defaults per call.
+    def command(self, topic, value, window=None, retain=None):
+        value = str(value)
+        window = self.window if window is None else window
+        retain = self.retain if retain is None else retain
+        now = self.clock()
+        with self._lock:
+            pending = self._pending.pop(topic, None)
+            if pending is not None:
+                # The held-back change never goes out
+                self.counts["coalesced"] += 1
+                _count(topic, "coalesced")
+            if value == self.state(topic):
+                if pending is None:
+                    self.counts["duplicate"] += 1
+                    _count(topic, "duplicate")
+                    return "duplicate"
+                return "coalesced"
+            last = self._last_sent.get(topic)
+            if last is not None and now - last < window:
+                self._pending[topic] = (value, last + window, retain)
+                self._kick()
+                return "deferred"
+            self._mark_sent(topic, value, now)
+        self._send(topic, value, retain)
+        return "sent"
+
+    # Under the lock: the state moves before the publish, so concurrent
+    # callers de-duplicate against it
+    def _mark_sent(self, topic, value, now, result="sent"):
+        entry = self.actuators.setdefault(topic, {"confirmed": None})
+        entry["state"] = value
+        entry["at"] = round(time.time(), 3)
+        self._last_sent[topic] = now
+        if topic in self._watched:
+            resends = self._awaiting.get(topic, (None, None, 0))[2]
+            resends = resends + 1 if result == "resent" else 0
+            self._awaiting[topic] = (value, now + self.confirm_timeout, resends)
+            self._kick()
+        self.counts[result] += 1
+        _count(topic, result)
+
+    # Under the lock: new deadline for the worker
+    def _kick(self):
+        self._dirty = True
+        self._wakeup.notify()
+
+    # Outside the lock: paho calls on_publish holding its own mutex
+    def _send(self, topic, value, retain):
+        if self.dispatch is None:
+            self._publish(topic, value, retain)
+        else:
+            self.dispatch(self._publish, topic, value, retain)
+        self.save()
+
+    def _publish(self, topic, value, retain):
+        info = self.client.publish(topic, value, qos=self.qos, retain=retain)
+        mid = getattr(info, "mid", None)
+        if not self.qos or mid is None:
+            return
+        with self._lock:
+            self._inflight[mid] = (topic, value, self.clock())
+            self._kick()
+        # PUBACK may have beaten the registration above
+        if info.is_published():
+            self._acked(mid)
+
+    def on_publish(self, client, userdata, mid, *args):
+        self._acked(mid)
+        if self._chained is not None:
+            self._chained(client, userdata, mid, *args)
+
+    def _acked(self, mid):
+        with self._lock:
+            entry = self._inflight.pop(mid, None)
+            if entry is None:
+                return
+            self.counts["acked"] += 1
+        latency = self.clock() - entry[2]
+        self.ack_latency.add(latency)
+        ACK_SECONDS.observe(latency)
+
+    #! ---------------------------- DEVICE STATUS ----------------------------
+
+    # * Confirm `topic` from the device's own status messages
+    def watch_status(self, topic, status_topic):
+        with self._lock:
+            self._watched.add(topic)
+
+        def on_status(client, userdata, msg):
+            self.on_status(topic, msg.payload)
+
+        self.client.message_callback_add(status_topic, on_status)
+        self.client.subscribe(status_topic, qos=1)
+
+    def on_status(self, topic, payload):
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", "replace")
+        value = payload.strip().upper()
+        now = self.clock()
+        resend = None
+        with self._lock:
+            entry = self.actuators.get(topic)
+            if entry is None:
+                return
+            entry["confirmed"] = value
+            awaiting = self._awaiting.get(topic)
+            if awaiting is not None:
+                if value == awaiting[0]:
+                    del self._awaiting[topic]
+                    self.counts["confirmed"] += 1
+                    latency = now - (awaiting[1] - self.confirm_timeout)
+                    self.confirm_latency.add(latency)
+                    CONFIRM_SECONDS.observe(latency)
+                # Otherwise a stale status: the confirm timeout decides
+            elif (
+                value != entry["state"]
+                and topic not in self._pending
+                and now - self._last_sent.get(topic, now) >= self.confirm_timeout
+            ):
+                # Device changed on its own (reboot, manual switch): re-command.
+                # Right after a send, a mismatch is a late or reordered echo.
+                self.counts["drift"] += 1
+                _count(topic, "drift")
+                resend = entry["state"]
+                self._mark_sent(topic, resend, now, "resent")
+        if resend is not None:
+            log.warning("%s reports %s, re-sending %s", topic, value, resend)
+            self._send(topic, resend, self.retain)
+
+    #! ---------------------------- BACKGROUND ----------------------------
+
+    # * Send held-back changes that are due, expire acks, resend unconfirmed
+    # commands. Returns the next deadline (None: nothing waiting).
+    def poll(self, now=None):
+        now = self.clock() if now is None else now
+        sends = []
+        with self._lock:
+            for topic, (value, due, retain) in list(self._pending.items()):
+                if due <= now:
+                    del self._pending[topic]
+                    self._mark_sent(topic, value, now)
+                    sends.append((topic, value, retain))
+
+            for mid, (topic, value, sent_at) in list(self._inflight.items()):
+                if now - sent_at >= self.ack_timeout:
+                    # paho keeps retrying the QoS 1 message itself
+                    del self._inflight[mid]
+                    self.counts["ack_timeouts"] += 1
+                    log.warning(
+                        "No PUBACK for %s=%s after %.0fs", topic, value, now - sent_at
+                    )
+
+            for topic, (value, deadline, resends) in list(self._awaiting.items()):
+                if deadline > now:
+                    continue
+                if resends >= self.max_resends:
+                    del self._awaiting[topic]
+                    log.warning("%s never confirmed %s, giving up", topic, value)
+                    continue
+                self._mark_sent(topic, value, now, "resent")
+                sends.append((topic, value, self.retain))
+
+            deadlines = [due for _, due, _ in self._pending.values()]
+            deadlines += [
+                sent + self.ack_timeout for _, _, sent in self._inflight.values()
+            ]
+            deadlines += [deadline for _, deadline, _ in self._awaiting.values()]
+        for topic, value, retain in sends:
+            self._send(topic, value, retain)
+        return min(deadlines) if deadlines else None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="actuator-state", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    # * Stop the worker; a held-back change is the latest intent, send it now
+    def stop(self):
+        with self._lock:
+            self._stop = True
+            self._kick()
+            for topic, (value, due, retain) in self._pending.items():
+                self._pending[topic] = (value, 0, retain)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.poll()
+        if getattr(self.client, "on_publish", None) == self.on_publish:
+            self.client.on_publish = self._chained
+
+    def _run(self):
+        while True:
+            deadline = self.poll()
+            with self._lock:
+                if self._stop:
+                    return
+                # Something changed while poll() ran: poll again right away
+                if self._dirty:
+                    self._dirty = False
+                    continue
+                timeout = None if deadline is None else max(0, deadline - self.clock())
+                self._wakeup.wait(timeout)
+                self._dirty = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counts,
+                "pending": len(self._pending),
+                "inflight": len(self._inflight),
+                "awaiting": len(self._awaiting),
+            }
+
+
+# One manager per (client, state file): restarted workers reuse it instead of
+# stacking more on_publish hooks onto a shared client
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared(client, path=ACTUATOR_STATE, **kwargs):
+    with _shared_lock:
+        key = (id(client), path)
+        manager = _shared.get(key)
+        if manager is None or manager.client is not client or manager._stop:
+            manager = _shared[key] = ActuatorState(client, path, **kwargs).start()
+        return manager
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+class _Clock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+class _RecordingClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published.append((topic, payload))
+
+
+# Soil moisture drifting around the ON threshold with sensor noise: the rules'
+# hysteresis band is narrower than the noise, so the pump flaps
+def _flapping_commands(seconds, interval, seed=0):
+    from zone_rules import RuleTable, default_zones
+
+    rng = random.Random(seed)
+    table = RuleTable(default_zones("Pump/LEFT", "Pump/RIGHT"))
+    zone = table.zones[0]
+    centre = (zone.on_below + zone.off_above) / 2
+    band = zone.off_above - zone.on_below
+    state = {}
+    t = 0.0
+    while t < seconds:
+        value = centre + band * (0.8 * rng.gauss(0, 1) + 0.3 * (t % 600 > 300))
+        for zone, command in table.evaluate(zone.sensor, value, state):
+            state[f"pump_{zone.name}"] = command
+            yield t, zone.pump, command
+        t += interval
+
+
+def benchmark_coalescing(hours=24, interval=1.0, windows=(0.0, 2.0, 10.0, 30.0)):
+    commands = list(_flapping_commands(hours * 3600, interval))
+    print(f"[BENCH] {hours}h flapping pump, rule commands issued: {len(commands)}")
+    for window in windows:
+        clock = _Clock()
+        client = _RecordingClient()
+        manager = ActuatorState(client, path=None, window=window, qos=0, clock=clock)
+        for t, topic, value in commands:
+            manager.poll(t)
+            clock.t = t
+            manager.command(topic, value)
+        manager.poll(float("inf"))
+        stats = manager.stats()
+        final = client.published[-1][1] if client.published else None
+        print(
+            f"[BENCH]   window {window:4.0f}s: {len(client.published):5d} published, "
+            f"{stats['coalesced']} coalesced, {stats['duplicate']} duplicate, "
+            f"final state {final} (rules: {commands[-1][2]})"
+        )
+
+
+# Restart: the rules start with an empty last_executed and re-command every
+# actuator; the persisted state recognises those as repeats
+def benchmark_restart(actuators=("Pump/LEFT", "Pump/RIGHT", "Lights", "Fans")):
+    workdir = tempfile.mkdtemp(prefix="actuators_")
+    path = os.path.join(workdir, "actuators.json")
+    try:
+        client = _RecordingClient()
+        first = ActuatorState(client, path=path, qos=0)
+        for topic in actuators:
+            first.command(topic, "ON")
+        before = len(client.published)
+
+        restarted = ActuatorState(client, path=path, qos=0)
+        for topic in actuators:
+            restarted.command(topic, "ON")
+        resent = len(client.published) - before
+        print(
+            f"[BENCH] restart: {len(actuators)} actuators re-commanded by the rules, "
+            f"{resent} published (without persisted state: {len(actuators)})"
+        )
+    finally:
+        shutil.rmtree(workdir)
+
+
+# Real paho client against fake_broker: QoS 1 PUBACK latency, plus a device
+# that echoes every command on its status topic
+def benchmark_acks(count=2000):
+    from fake_broker import FakeBroker
+    from mqtt_client import make_client
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    broker = asyncio.run_coroutine_threadsafe(FakeBroker().start(), loop).result()
+
+    def connected():
+        client = make_client()
+        client.connect("127.0.0.1", broker.port, 60)
+        client.loop_start()
+        return client
+
+    device = connected()
+    device.on_message = lambda c, u, msg: c.publish(msg.topic + "/status", msg.payload)
+    device.subscribe("Pump/+")
+    controller = connected()
+    time.sleep(0.3)
+
+    manager = ActuatorState(controller, path=None, window=0.0).start()
+    topics = [f"Pump/{i}" for i in range(4)]
+    for topic in topics:
+        manager.watch_status(topic, topic + "/status")
+    time.sleep(0.3)
+
+    start = time.perf_counter()
+    for i in range(count):
+        manager.command(topics[i % len(topics)], "ON" if (i // 4) % 2 else "OFF")
+        if i % 50 == 49:
+            time.sleep(0.01)
+    deadline = time.monotonic() + 10
+    while (manager._inflight or manager._awaiting) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    manager.stop()
+
+    print(
+        f"[BENCH] QoS1 via fake_broker: {count} commands in {elapsed:.2f}s, "
+        f"{manager.stats()}"
+    )
+    print(
+        f"[BENCH]   PUBACK {manager.ack_latency.summary()} | "
+        f"device status confirm {manager.confirm_latency.summary()}"
+    )
+    for client in (device, controller):
+        client.loop_stop()
+        client.disconnect()
+    asyncio.run_coroutine_threadsafe(broker.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def benchmark():
+    benchmark_coalescing()
+    benchmark_restart()
+    benchmark_acks()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Actuator state / command pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("bench", help="coalescing, restart and QoS 1 ack benchmarks")
+    show = sub.add_parser("show", help="print the persisted actuator state")
+    show.add_argument("--path", default=ACTUATOR_STATE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.command == "bench":
+        benchmark()
+    else:
+        with open(args.path) as f:
+            print(json.dumps(json.load(f), indent=2))
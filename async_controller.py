@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from fake_broker import FakeBroker
+from mqtt_client import make_client
+from mqtt_controller import MQTTController
+from zone_rules import default_zones
+
+#! ---------------------------- ASYNCIO <-> PAHO ----------------------------
+
+
+# paho drives its socket through these callbacks, so no loop()/loop_start() thread.
+# connect() runs in an executor thread: its callbacks hop onto the loop first.
+class AsyncioHelper:
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self._thread = threading.get_ident()
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+        self.misc = None
+
+    def _on_loop(self, func, *args):
+        if threading.get_ident() == self._thread:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self._on_loop(self._open, client, sock)
+
+    def _open(self, client, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self._on_loop(self._close, sock)
+
+    def _close(self, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+            self.misc = None
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self._on_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self._on_loop(self.loop.remove_writer, sock)
+
+    # Keepalive pings and retries
+    async def misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+#! ---------------------------- CONTROLLER ----------------------------
+
+
+class AsyncMQTTController(MQTTController):
+    def __init__(
+        self,
+        host,
+        port,
+        keep_alive,
+        firebase_key_path,
+        db_url,
+        backoff_min=1.0,
+        backoff_max=60.0,
+        max_pending=1000,
+    ):
+        self.loop = None
+        self.connected = None
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.subscriptions = []
+        self.reconnects = 0
+        # Publishes made while disconnected, flushed in order on reconnect
+        self.pending = deque(maxlen=max_pending)
+        self._loop_thread = None
+        self._helper = None
+        self._closing = False
+        # Set by stop(): run() returns
+        self._closed = None
+
+        super().__init__(host, port, keep_alive, firebase_key_path, db_url)
+
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+
+    # * The socket is opened from run(), not from __init__
+    def connect(self):
+        pass
+
+    # * Connect (with backoff) and keep the connection alive until stop()
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.connected = asyncio.Event()
+        self._loop_thread = threading.get_ident()
+        self._helper = AsyncioHelper(self.loop, self.client)
+        self._closed = asyncio.Event()
+        if self._closing:
+            self._closed.set()
+        await self._connect_with_backoff()
+        await self._closed.wait()
+
+    async def stop(self):
+        self._closing = True
+        self.client.disconnect()
+        if self._closed is not None:
+            self._closed.set()
+
+    # * Run blocking work (Firebase GETs/listeners) off the event loop
+    async def run_blocking(self, func, *args):
+        return await self.loop.run_in_executor(None, func, *args)
+
+    async def _connect_with_backoff(self):
+        delay = self.backoff_min
+        while not self._closing:
+            try:
+                # DNS + TCP handshake block: off the loop, like run_blocking
+                await self.loop.run_in_executor(
+                    None, self.client.connect, self.host, self.port, self.keep_alive
+                )
+                # stop() ran while the handshake was in flight
+                if self._closing:
+                    self.client.disconnect()
+                return
+            except OSError as e:
+                wait = delay * random.uniform(0.5, 1.0)
+                print(f"[MQTT] Connect failed ({e}), retrying in {wait:.1f}s")
+                try:
+                    await asyncio.wait_for(self._closed.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, self.backoff_max)
+
+    #! ---------------------------- CALLBACKs ----------------------------
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"[MQTT] Connection refused (rc={rc})")
+            return
+        print(f"[MQTT] Connected to {self.host}:{self.port}")
+        for topic in self.subscriptions:
+            self.client.subscribe(topic)
+        self.connected.set()
+        while self.pending and self.connected.is_set():
+            topic, msg = self.pending.popleft()
+            self._publish_now(topic, msg)
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        if self._closing:
+            return
+        self.reconnects += 1
+        print(f"[MQTT] Disconnected (rc={rc}), reconnecting")
+        self.loop.create_task(self._connect_with_backoff())
+
+    #! ---------------------------- OVERRIDEs ----------------------------
+
+    def subscribe_to_topics(self, topics):
+        self.subscriptions = list(topics)
+        for topic in self.subscriptions:
+            self.add_route(topic, self.save_sensor)
+        self.client.on_message = self.on_message
+        if self.connected is not None and self.connected.is_set():
+            for topic in self.subscriptions:
+                self.client.subscribe(topic)
+
+    # * Actuator commands are de-duplicated and persisted by the manager; its
+    # publishes hop onto the event loop like any other
+    def use_actuators(self, actuators, topics, status_suffix=None):
+        actuators.dispatch = self.call_soon
+        if status_suffix:
+            # Re-subscribed on every (re)connect
+            self.subscriptions += [topic + status_suffix for topic in topics.values()]
+        return super().use_actuators(actuators, topics, status_suffix)
+
+    # * Run func on the event loop: paho is not thread-safe without loop_start
+    def call_soon(self, func, *args):
+        if self.loop is not None and threading.get_ident() != self._loop_thread:
+            self.loop.call_soon_threadsafe(func, *args)
+        else:
+            func(*args)
+
+    # * Thread-safe: engine/timer threads hop onto the event loop first
+    def publish_to_topics(self, topic, msg):
+        if self.actuators is not None:
+            self.actuators.command(topic, msg)
+            self.publish_count += 1
+            return
+        if self.loop is not None and threading.get_ident() != self._loop_thread:
+            self.loop.call_soon_threadsafe(self.publish_to_topics, topic, msg)
+            return
+        if self.connected is None or not self.connected.is_set():
+            self.pending.append((topic, msg))
+            return
+        self._publish_now(topic, msg)
+
+    def _publish_now(self, topic, msg):
+        self.client.publish(topic, msg)
+        self.publish_count += 1
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+async def benchmark(num_messages=20000):
+    broker = await FakeBroker().start()
+    controller = AsyncMQTTController("127.0.0.1", broker.port, 60, None, None)
+    controller.subscribe_to_topics(["Soil/Moisture_LEFT", "Soil/Moisture_RIGHT"])
+    controller.load_rules(default_zones("Pump/LEFT", "Pump/RIGHT"))
+
+    received = {"count": 0}
+    done = asyncio.Event()
+    handle = controller.on_message
+
+    def on_message(client, userdata, msg):
+        handle(client, userdata, msg)
+        received["count"] += 1
+        if received["count"] >= num_messages:
+            done.set()
+
+    controller.client.on_message = on_message
+    controller.on_sensor_update = lambda topic, value, t: controller.evaluate_sensor(
+        topic
+    )
+    task = asyncio.create_task(controller.run())
+    await controller_connected(controller)
+
+    # Publisher: a second paho client on its own thread, like a real ESP node
+    publisher = make_client()
+    publisher.connect("127.0.0.1", broker.port, 60)
+    publisher.loop_start()
+
+    def publish_all():
+        for i in range(num_messages):
+            topic = "Soil/Moisture_LEFT" if i % 2 else "Soil/Moisture_RIGHT"
+            publisher.publish(topic, str(20 + (i * 7) % 60))
+
+    start = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, publish_all)
+    await asyncio.wait_for(done.wait(), timeout=120)
+    elapsed = time.perf_counter() - start
+
+    publisher.loop_stop()
+    publisher.disconnect()
+    await controller.stop()
+    task.cancel()
+    await broker.stop()
+
+    print(
+        f"[BENCH] {num_messages} messages in {elapsed:.2f}s -> "
+        f"{num_messages / elapsed:,.0f} msg/s, {controller.publish_count} pump commands"
+    )
+
+
+async def controller_connected(controller, timeout=10):
+    while controller.connected is None:
+        await asyncio.sleep(0.01)
+    await asyncio.wait_for(controller.connected.wait(), timeout)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Async controller benchmark")
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.messages))
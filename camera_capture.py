@@ -0,0 +1,276 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from latency import LatencyStats
+
+#! ---------------------------- FAKE SOURCE ----------------------------
+
+
+# Stand-in for cv2.VideoCapture: synthetic (or looped) frames at a fixed fps
+class FakeFrameSource:
+    def __init__(self, width=640, height=480, fps=30.0, frames=None, limit=None):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = frames
+        self.limit = limit
+        self.count = 0
+        self._opened = True
+        self._next = time.monotonic()
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened or (self.limit is not None and self.count >= self.limit):
+            return False, None
+        if self.fps:
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next = max(self._next + 1 / self.fps, time.monotonic())
+
+        if self.frames is not None:
+            frame = self.frames[self.count % len(self.frames)].copy()
+        else:
+            frame = np.zeros((self.height, self.width, 3), np.uint8)
+            # Frame number burned into the pixels so tests can tell frames apart
+            frame[:, :, 0] = self.count % 256
+            frame[:, :, 1] = (self.count // 256) % 256
+        self.count += 1
+        return True, frame
+
+    def release(self):
+        self._opened = False
+
+
+# Recorded clip played back at its own fps, so slow consumers drop frames
+# exactly like they would on the live camera
+class VideoFileSource:
+    def __init__(self, path, fps=None, realtime=True):
+        self.capture = cv2.VideoCapture(path)
+        self.fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.realtime = realtime
+        self.count = 0
+        self.started_at = None
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        if self.realtime:
+            delay = self.started_at + self.count / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        ret, frame = self.capture.read()
+        if ret:
+            self.count += 1
+        return ret, frame
+
+    def release(self):
+        self.capture.release()
+
+
+#! ---------------------------- GRABBER ----------------------------
+
+
+class FrameGrabber:
+    def __init__(self, source, slots=4, name="camera"):
+        # Device index / path / URL (reopened by run() restarts), or anything
+        # with read() & release()
+        self.device = source if isinstance(source, (int, str)) else None
+        if self.device is not None:
+            source = cv2.VideoCapture(source)
+        self.source = source
+        self.name = name
+        self.slots = max(3, slots)
+
+        self._ring = None
+        self._seq = 0
+        self._slot = -1
+        self._captured_at = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        # stop() is final: a run() restart racing it does not undo it
+        self._closed = False
+
+        self.readers = {}
+        self.frames_captured = 0
+        self.read_failures = 0
+        self.ended = False
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name=f"{self.name}-grabber", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    # * Capture in the calling thread until stop() or the source ends, e.g. as
+    # a supervisor worker that restarts it. A restart after the source ended
+    # reopens the device; readers keep their grabber and resume.
+    def run(self):
+        if self.ended and self.device is not None:
+            self.source.release()
+            self.source = cv2.VideoCapture(self.device)
+        with self._cond:
+            if self._closed:
+                self.source.release()
+                return
+            self.ended = False
+            self._running = True
+        self._run()
+
+    def stop(self):
+        with self._cond:
+            self._closed = True
+            self._running = False
+        if self._thread is not None:
+            self._thread.join(2)
+        self.source.release()
+        with self._cond:
+            self._cond.notify_all()
+
+    # * One reader per consumer: each keeps its own position and counters
+    def reader(self, name="reader"):
+        reader = FrameReader(self, name)
+        # Latest reader per name, so a supervisor can report per-consumer stats
+        self.readers[name] = reader
+        return reader
+
+    def stats(self):
+        return {
+            "captured": self.frames_captured,
+            "read_failures": self.read_failures,
+            "ended": self.ended,
+        }
+
+    # * Newest frame after `after_seq`: (seq, slot array, captured_at) or None
+    def wait_latest(self, after_seq, timeout=None):
+        with self._cond:
+            ready = self._cond.wait_for(
+                lambda: self._seq > after_seq or self.ended or not self._running,
+                timeout,
+            )
+            if not ready or self._seq <= after_seq:
+                return None
+            return self._seq, self._ring[self._slot], self._captured_at
+
+    # * True once the grabber may have started writing over frame `seq`'s slot.
+    # Slots are reused `slots` frames later, and the write of frame
+    # seq + slots only starts after frame seq + slots - 1 was published.
+    def overwritten(self, seq):
+        return self._seq >= seq + self.slots - 1
+
+    def _run(self):
+        failures_in_row = 0
+        while self._running:
+            ret, frame = self.source.read()
+            if not ret:
+                self.read_failures += 1
+                failures_in_row += 1
+                # A file/fake source that ran out, or a camera that is gone
+                if failures_in_row >= 10 or not self.source.isOpened():
+                    break
+                time.sleep(0.01)
+                continue
+            failures_in_row = 0
+            captured_at = time.perf_counter()
+
+            if self._ring is None or self._ring[0].shape != frame.shape:
+                self._ring = [np.empty_like(frame) for _ in range(self.slots)]
+            slot = (self._slot + 1) % self.slots
+            # The slot being written is never the one readers were handed last
+            np.copyto(self._ring[slot], frame)
+
+            with self._cond:
+                self._slot = slot
+                self._seq += 1
+                self._captured_at = captured_at
+                self.frames_captured += 1
+                self._cond.notify_all()
+
+        with self._cond:
+            self.ended = True
+            self._cond.notify_all()
+
+
+#! ---------------------------- READER ----------------------------
+
+
+class FrameReader:
+    def __init__(self, grabber, name):
+        self.grabber = grabber
+        self.name = name
+        self.last_seq = 0
+        self.captured_at = None
+        self.frames = 0
+        self.dropped = 0
+        self.overruns = 0
+        self.latency = LatencyStats()
+        self._buffer = None
+
+    # * cv2.VideoCapture-style read() of the NEWEST frame (older ones are dropped).
+    # copy=False hands out the ring slot itself: only safe for quick consumers.
+    def read(self, timeout=2.0, copy=True):
+        while True:
+            latest = self.grabber.wait_latest(self.last_seq, timeout)
+            if latest is None:
+                return False, None
+            seq, frame, captured_at = latest
+            if not copy:
+                break
+
+            # Copied outside the grabber's lock: a reader preempted for several
+            # frame periods can lose its slot mid-copy, then takes a newer frame
+            if self._buffer is None or self._buffer.shape != frame.shape:
+                self._buffer = np.empty_like(frame)
+            np.copyto(self._buffer, frame)
+            if not self.grabber.overwritten(seq):
+                frame = self._buffer
+                break
+            self.overruns += 1
+
+        if self.last_seq:
+            self.dropped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.captured_at = captured_at
+        self.frames += 1
+        return True, frame
+
+    # * Mark the last frame as processed (records capture-to-process latency)
+    def done(self):
+        if self.captured_at is not None:
+            self.latency.add(time.perf_counter() - self.captured_at)
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "overruns": self.overruns,
+            "latency": self.latency.summary(),
+        }
+
+
+if __name__ == "__main__":
+    # Self-check with a fake 60 fps camera and a slow (~10 fps) consumer
+    grabber = FrameGrabber(FakeFrameSource(fps=60, limit=120)).start()
+    reader = grabber.reader("slow")
+    while True:
+        ok, frame = reader.read()
+        if not ok:
+            break
+        time.sleep(0.1)
+        reader.done()
+    grabber.stop()
+    print(f"[CAMERA] grabber={grabber.stats()} reader={reader.stats()}")
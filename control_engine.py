@@ -0,0 +1,208 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+import metrics
+from latency import LatencyStats
+from mqtt_controller import TIMER_ACTIONS
+
+# Sensor msg received -> pump command published
+DECISION_SECONDS = metrics.histogram(
+    "garden_decision_seconds", "Sensor message to pump command latency"
+)
+
+#! ---------------------------- HELPERs ----------------------------
+
+
+# * Next wall-clock time (epoch seconds) a "HH:MM" timer should fire
+def next_occurrence(hhmm, now):
+    try:
+        hour, minute = (int(part) for part in str(hhmm).split(":"))
+        due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    except ValueError:
+        return None
+    # Still inside the programmed minute -> fire right away, like the old poll did
+    if due <= now < due + timedelta(minutes=1):
+        return now.timestamp()
+    if due <= now:
+        due = (due + timedelta(days=1)).replace(hour=hour, minute=minute)
+    return due.timestamp()
+
+
+#! ---------------------------- DEADLINE SCHEDULER ----------------------------
+
+
+class DeadlineScheduler:
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._live = {}
+
+    # * (Re)schedule a job; an older entry with the same key is dropped lazily
+    def schedule(self, key, deadline, callback):
+        seq = next(self._seq)
+        self._live[key] = seq
+        heapq.heappush(self._heap, (deadline, seq, key, callback))
+
+    def cancel(self, key):
+        self._live.pop(key, None)
+
+    def next_deadline(self):
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    # * Pop every job whose deadline has passed
+    def pop_due(self, now):
+        due = []
+        self._discard_stale()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, seq, key, callback = heapq.heappop(self._heap)
+            if self._live.get(key) == seq:
+                del self._live[key]
+                due.append((key, deadline, callback))
+            self._discard_stale()
+        return due
+
+    def __len__(self):
+        return len(self._live)
+
+    def _discard_stale(self):
+        while self._heap and self._live.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+
+#! ---------------------------- CONTROL ENGINE ----------------------------
+
+
+class ControlEngine:
+    def __init__(
+        self,
+        controller,
+        topic_pump_left,
+        topic_pump_right,
+        topic_lights,
+        topic_fans,
+        timer_paths,
+        stats_interval=60,
+        now=datetime.now,
+    ):
+        self.controller = controller
+        self.topics = (topic_pump_left, topic_pump_right, topic_lights, topic_fans)
+        # {action: firebase path}, e.g. {"pumps_on": "/timers/pumps/on", ...}
+        self.timer_paths = dict(zip(TIMER_ACTIONS, timer_paths))
+        self.stats_interval = stats_interval
+        self.now = now
+
+        self.scheduler = DeadlineScheduler()
+        self._timer_values = {}
+        self.latency = LatencyStats()
+        self.timers_fired = 0
+        self.evaluations = 0
+
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        # Set by stop() only: a stop() that beats run_forever() still sticks
+        self._stopped = False
+
+        metrics.counter(
+            "garden_engine_evaluations_total",
+            "Sensor rule evaluations",
+            lambda: self.evaluations,
+        )
+        metrics.counter(
+            "garden_engine_timers_total",
+            "TIMER actions fired",
+            lambda: self.timers_fired,
+        )
+        metrics.gauge(
+            "garden_engine_deadlines",
+            "Pending scheduler deadlines",
+            self.scheduler.__len__,
+        )
+
+    # * Hook into the controller: sensor msgs + schedule changes wake the engine
+    def attach(self):
+        self.controller.ensure_rules(self.topics[0], self.topics[1])
+        self.controller.on_sensor_update = self.on_sensor
+        schedule = self.controller.schedule
+        if schedule is not None:
+            schedule.subscribe(self._on_schedule_change)
+            values = schedule.snapshot()
+            with self._lock:
+                for action, path in self.timer_paths.items():
+                    self._schedule_timer(action, values.get(path))
+        with self._lock:
+            self.scheduler.schedule(
+                "stats", time.time() + self.stats_interval, self._report_stats
+            )
+        return self
+
+    # * Sensor value saved -> evaluate the pump rules right now (MQTT thread)
+    def on_sensor(self, topic, value, received_at):
+        with self._lock:
+            published = self.controller.publish_count
+            self.controller.evaluate_sensor(topic)
+            self.evaluations += 1
+            if self.controller.publish_count != published:
+                latency = time.perf_counter() - received_at
+                self.latency.add(latency)
+                DECISION_SECONDS.observe(latency)
+
+    # * Sleep until the next deadline (or a wakeup), then run the due jobs
+    def run_forever(self):
+        with self._wakeup:
+            while not self._stopped:
+                deadline = self.scheduler.next_deadline()
+                timeout = None if deadline is None else max(0, deadline - time.time())
+                if timeout is None or timeout > 0:
+                    self._wakeup.wait(timeout)
+                for key, _, callback in self.scheduler.pop_due(time.time()):
+                    callback(key)
+
+    def stop(self):
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify()
+
+    #! ---------------------------- INTERNALs ----------------------------
+
+    def _schedule_timer(self, action, hhmm):
+        self._timer_values[action] = hhmm
+        deadline = next_occurrence(hhmm, self.now()) if hhmm else None
+        if deadline is None:
+            self.scheduler.cancel(action)
+            return
+        self.scheduler.schedule(action, deadline, self._fire_timer)
+        self._wakeup.notify()
+
+    def _fire_timer(self, action):
+        self.timers_fired += 1
+        self.controller.run_timer(action, *self.topics)
+        # Re-arm for the same minute tomorrow (the current minute is already done)
+        hhmm = self._timer_values.get(action)
+        if hhmm:
+            deadline = next_occurrence(hhmm, self.now() + timedelta(minutes=1))
+            if deadline is not None:
+                self.scheduler.schedule(action, deadline, self._fire_timer)
+
+    def _on_schedule_change(self, path, old, new):
+        with self._lock:
+            for action, timer_path in self.timer_paths.items():
+                if timer_path == path:
+                    self._schedule_timer(action, new)
+
+    def _report_stats(self, key):
+        schedule = self.controller.schedule
+        reads = schedule.reads_per_minute() if schedule is not None else 0
+        print(
+            f"[ENGINE] evaluations={self.evaluations} timers={self.timers_fired} "
+            f"latency {self.latency.summary()} firebase_reads/min={reads}"
+        )
+        telemetry = self.controller.telemetry
+        if telemetry is not None:
+            print(f"[TELEMETRY] {telemetry.stats()}")
+        self.scheduler.schedule(
+            key, time.time() + self.stats_interval, self._report_stats
+        )
@@ -0,0 +1,396 @@
+import argparse
+import heapq
+import json
+import os
+import pickle
+import struct
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from file_utils import write_json
+
+# File layout: 64-byte header, then `capacity` float32 rows of `dim` values.
+# Names/keys live next to it: a <path>.names.json snapshot plus an append-only
+# <path>.names.log of [slot, name, key] lines ([slot, null, null] = removed).
+# The snapshot is rewritten once the log outgrows the gallery.
+MAGIC = b"SGFACES\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")  # magic, version, dim, capacity, count
+HEADER_SIZE = 64
+LOG_COMPACT_MIN = 1024
+
+
+class StoreError(Exception):
+    pass
+
+
+#! ---------------------------- STORE ----------------------------
+
+
+class EncodingStore:
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.names_path = self._names_file(path)
+        self.log_path = self._log_file(path)
+        self.writable = writable
+        self._file = open(path, "r+b" if writable else "rb")
+        self._read_header()
+        self._map()
+        self._read_names()
+
+    @classmethod
+    def create(cls, path, dim=128, capacity=1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, dim, capacity, 0).ljust(HEADER_SIZE))
+            f.truncate(HEADER_SIZE + capacity * dim * 4)
+        write_json(cls._names_file(path), {"version": VERSION, "entries": []})
+        if os.path.exists(cls._log_file(path)):
+            os.remove(cls._log_file(path))
+        return cls(path, writable=True)
+
+    @classmethod
+    def open(cls, path, writable=False, dim=128):
+        if writable and not os.path.exists(path):
+            return cls.create(path, dim=dim)
+        return cls(path, writable=writable)
+
+    @staticmethod
+    def _names_file(path):
+        return path + ".names.json"
+
+    @staticmethod
+    def _log_file(path):
+        return path + ".names.log"
+
+    def close(self):
+        self.rows = None
+        self._file.close()
+
+    def __len__(self):
+        return sum(entry is not None for entry in self.entries)
+
+    def _read_header(self):
+        raw = self._file.read(HEADER_SIZE)
+        if len(raw) < HEADER.size:
+            raise StoreError(f"{self.path}: truncated header")
+        magic, version, dim, capacity, count = HEADER.unpack_from(raw)
+        if magic != MAGIC:
+            raise StoreError(f"{self.path}: not an encodings store")
+        if version != VERSION:
+            raise StoreError(f"{self.path}: unsupported version {version}")
+        self.dim, self.capacity, self.count = dim, capacity, count
+
+    def _write_header(self):
+        header = HEADER.pack(MAGIC, VERSION, self.dim, self.capacity, self.count)
+        os.pwrite(self._file.fileno(), header, 0)
+
+    def _map(self):
+        self.rows = np.memmap(
+            self._file,
+            dtype=np.float32,
+            mode="r+" if self.writable else "r",
+            offset=HEADER_SIZE,
+            shape=(self.capacity, self.dim),
+        )
+
+    def _read_names(self):
+        with open(self.names_path) as f:
+            entries = json.load(f)["entries"]
+        entries = [tuple(e) if e is not None else None for e in entries]
+        # Records are absolute slot assignments: replaying ones the snapshot
+        # already holds (crash between compaction steps) changes nothing
+        self.log_records, torn = 0, False
+        if os.path.exists(self.log_path):
+            with open(self.log_path) as f:
+                for line in f:
+                    try:
+                        if not line.endswith("\n"):
+                            raise ValueError("unterminated record")
+                        slot, name, key = json.loads(line)
+                    except ValueError:
+                        # Crash mid-append: the batch never got its header count
+                        torn = True
+                        break
+                    entries += [None] * (slot + 1 - len(entries))
+                    entries[slot] = (name, key) if name is not None else None
+                    self.log_records += 1
+        # The header count is authoritative: entries past it are from a crashed append
+        entries = entries[: self.count]
+        entries += [None] * (self.count - len(entries))
+        self.entries = entries
+        # Free slots, lowest first (sorted lists are valid heaps)
+        self._free = [i for i, e in enumerate(entries) if e is None]
+        if torn and self.writable:
+            self._compact()
+
+    # * One appended line per changed slot, one fsync per batch
+    def _log_slots(self, slots):
+        lines = "".join(
+            json.dumps([slot, *(self.entries[slot] or (None, None))]) + "\n"
+            for slot in slots
+        )
+        with open(self.log_path, "a") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.log_records += len(slots)
+
+    def _maybe_compact(self):
+        if self.log_records > max(LOG_COMPACT_MIN, self.count):
+            self._compact()
+
+    # Snapshot first, then the log: a crash in between only replays old records
+    def _compact(self):
+        write_json(self.names_path, {"version": VERSION, "entries": self.entries})
+        with open(self.log_path, "w") as f:
+            os.fsync(f.fileno())
+        self.log_records = 0
+
+    #! ---------------------------- READ ----------------------------
+
+    # * (encodings, names) for FaceMatcher: a zero-copy view of the mapped rows.
+    # Removed slots are zeroed and named "Unknown", so they can never match.
+    def gallery(self):
+        names = [e[0] if e is not None else "Unknown" for e in self.entries]
+        return self.rows[: self.count], names
+
+    def keys(self):
+        return {e[1]: i for i, e in enumerate(self.entries) if e is not None and e[1]}
+
+    def names(self):
+        return [e[0] for e in self.entries if e is not None]
+
+    #! ---------------------------- WRITE ----------------------------
+
+    # * Add encodings in place: free slots first, then append (doubling capacity)
+    def enroll(self, name, encoding, key=None):
+        return self.enroll_many([name], [encoding], [key])[0]
+
+    def enroll_many(self, names, encodings, keys=None):
+        self._check_writable()
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        keys = keys or [None] * len(names)
+        needed = self.count + max(0, len(names) - len(self._free))
+        if needed > self.capacity:
+            self._grow(needed)
+
+        slots = [
+            heapq.heappop(self._free) for _ in range(min(len(names), len(self._free)))
+        ]
+        slots += range(self.count, self.count + len(names) - len(slots))
+        self.entries += [None] * (slots[-1] + 1 - len(self.entries)) if slots else []
+        for slot, encoding in zip(slots, encodings):
+            self.rows[slot] = encoding
+        self.rows.flush()
+
+        # Rows first, then names, then the count: a crash leaves the old gallery
+        for slot, name, key in zip(slots, names, keys):
+            self.entries[slot] = (name, key)
+        self._log_slots(slots)
+        self.count = len(self.entries)
+        self._write_header()
+        self._maybe_compact()
+        return slots
+
+    # Removal zeroes the row before dropping the name (a crash in between leaves
+    # a row that cannot match anyone); the slot is reused by the next enroll
+    def remove(self, index):
+        return self.remove_many([index]) == 1
+
+    # * Batch removal: one row flush and one log append for all of `indexes`
+    def remove_many(self, indexes):
+        self._check_writable()
+        slots = sorted(
+            {i for i in indexes if i < self.count and self.entries[i] is not None}
+        )
+        if not slots:
+            return 0
+        self.rows[slots] = 0
+        self.rows.flush()
+        for slot in slots:
+            self.entries[slot] = None
+            heapq.heappush(self._free, slot)
+        self._log_slots(slots)
+        self._maybe_compact()
+        return len(slots)
+
+    def remove_key(self, key):
+        return self.remove_keys([key]) == 1
+
+    # * Batch removal by key: one key lookup, one row flush, one log append
+    def remove_keys(self, keys):
+        index = self.keys()
+        return self.remove_many([index[key] for key in keys if key in index])
+
+    def remove_name(self, name):
+        return self.remove_many(
+            [i for i, e in enumerate(self.entries) if e and e[0] == name]
+        )
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self.rows.flush()
+        self.rows = None
+        # Extending the file keeps existing rows where they are
+        self._file.truncate(HEADER_SIZE + capacity * self.dim * 4)
+        self.capacity = capacity
+        self._write_header()
+        self._map()
+
+    def _check_writable(self):
+        if not self.writable:
+            raise StoreError(f"{self.path}: opened read-only")
+
+
+# * One-off import of the legacy encodings.pickle (trusted, produced locally)
+def convert_pickle(pickle_path, store_path):
+    with open(pickle_path, "rb") as f:
+        data = pickle.loads(f.read())
+    encodings = np.asarray(data["encodings"], dtype=np.float32)
+    capacity = max(1024, 1 << max(0, len(encodings) - 1).bit_length())
+    store = EncodingStore.create(
+        store_path, dim=encodings.shape[1] if len(encodings) else 128, capacity=capacity
+    )
+    store.enroll_many(list(data["names"]), encodings)
+    store.close()
+    return len(encodings)
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+def _rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+# Runs in a fresh interpreter so startup time and RSS are not polluted
+def _probe(kind, path):
+    from face_matcher import FaceMatcher
+
+    before = _rss_kb()
+    start = time.perf_counter()
+    if kind == "pickle":
+        with open(path, "rb") as f:
+            data = pickle.loads(f.read())
+        matcher = FaceMatcher(data["encodings"], data["names"], index="flat")
+    else:
+        encodings, names = EncodingStore.open(path).gallery()
+        matcher = FaceMatcher(encodings, names, index="flat")
+    elapsed = time.perf_counter() - start
+    matcher.match(np.zeros((1, 128), np.float32))
+    print(json.dumps({"seconds": elapsed, "rss_kb": _rss_kb() - before}))
+
+
+def benchmark(sizes, workdir="/tmp/encodings_bench"):
+    os.makedirs(workdir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        # face_recognition hands out float64 arrays, one per image
+        encodings = list(rng.normal(0, 0.1, (size, 128)))
+        names = [f"person_{i % max(1, size // 5)}" for i in range(size)]
+        pickle_path = os.path.join(workdir, f"{size}.pickle")
+        store_path = os.path.join(workdir, f"{size}.bin")
+        with open(pickle_path, "wb") as f:
+            f.write(pickle.dumps({"encodings": encodings, "names": names}))
+        convert_pickle(pickle_path, store_path)
+
+        line = f"[BENCH] gallery={size:>6}"
+        for kind, path in (("pickle", pickle_path), ("store", store_path)):
+            out = subprocess.run(
+                [sys.executable, __file__, "probe", kind, path],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            size_kb = os.path.getsize(path) // 1024
+            line += (
+                f" | {kind} {result['seconds'] * 1000:7.1f}ms "
+                f"+{result['rss_kb'] / 1024:6.1f}MB RSS ({size_kb} KB file)"
+            )
+        print(line)
+
+
+# Single enroll + remove on a large gallery: appended log lines vs rewriting
+# the whole names index on every call (the previous behaviour)
+def benchmark_updates(sizes, rounds=50, workdir="/tmp/encodings_bench"):
+    os.makedirs(workdir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        path = os.path.join(workdir, f"updates_{size}.bin")
+        store = EncodingStore.create(path, capacity=size + rounds)
+        store.enroll_many(
+            [f"person_{i // 5}" for i in range(size)],
+            rng.normal(0, 0.1, (size, 128)),
+            [f"photo_{i}:0" for i in range(size)],
+        )
+        encoding = rng.normal(0, 0.1, 128)
+        # Snapshot after the bulk load; later compactions come every ~`size`
+        # log records, so they are reported apart from the per-call cost
+        start = time.perf_counter()
+        store._compact()
+        compact = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(rounds):
+            slot = store.enroll("visitor", encoding, f"visitor_{i}:0")
+            store.remove(slot)
+        logged = (time.perf_counter() - start) / (2 * rounds)
+
+        start = time.perf_counter()
+        for _ in range(2 * rounds):
+            write_json(store.names_path, {"version": VERSION, "entries": store.entries})
+        rewrite = (time.perf_counter() - start) / (2 * rounds)
+        store.close()
+        print(
+            f"[BENCH] gallery={size:>6}: enroll/remove {logged * 1000:6.2f}ms per call "
+            f"(full index rewrite {rewrite * 1000:6.2f}ms, "
+            f"{os.path.getsize(store.names_path) // 1024} KB), compaction every "
+            f"~{max(LOG_COMPACT_MIN, size)} records {compact * 1000:.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face encodings store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="import a legacy encodings.pickle")
+    convert.add_argument("pickle", nargs="?", default=".config/encodings.pickle")
+    convert.add_argument("store", nargs="?", default=".config/encodings.bin")
+    info = sub.add_parser("info")
+    info.add_argument("store", nargs="?", default=".config/encodings.bin")
+    bench = sub.add_parser("bench", help="startup time / RSS vs gallery size")
+    bench.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    updates = sub.add_parser("bench-updates", help="enroll/remove cost per call")
+    updates.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    probe = sub.add_parser("probe")
+    probe.add_argument("kind", choices=["pickle", "store"])
+    probe.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        count = convert_pickle(args.pickle, args.store)
+        print(f"[STORE] {count} encodings -> {args.store}")
+    elif args.command == "info":
+        store = EncodingStore.open(args.store)
+        print(
+            f"[STORE] v{VERSION} dim={store.dim} capacity={store.capacity} "
+            f"slots={store.count} enrolled={len(store)} "
+            f"people={len(set(store.names()))}"
+        )
+    elif args.command == "bench":
+        benchmark(args.sizes)
+    elif args.command == "bench-updates":
+        benchmark_updates(args.sizes)
+    else:
+        _probe(args.kind, args.path)
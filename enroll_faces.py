@@ -0,0 +1,215 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import cv2
+import face_recognition
+import numpy as np
+
+from encodings_store import EncodingStore
+from file_utils import write_json
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+_max_side = None
+
+
+#! ---------------------------- WORKER ----------------------------
+
+
+def _init_worker(max_side):
+    global _max_side
+    # The pool already spreads photos over every core
+    cv2.setNumThreads(1)
+    _max_side = max_side
+
+
+def encode_image(job):
+    path, sha = job
+    try:
+        return path, sha, _encode_image(path), None
+    except Exception as e:
+        return path, sha, [], str(e)
+
+
+def _encode_image(path):
+    image = face_recognition.load_image_file(path)
+    # Phone photos are 12MP+: HOG on a ~1000px copy finds the same faces
+    scale = _max_side / max(image.shape[:2]) if _max_side else 1.0
+    if scale < 1.0:
+        image = cv2.resize(image, (0, 0), fx=scale, fy=scale)
+    boxes = face_recognition.face_locations(image)
+    # Same landmark model as face_recog_door, so distances are comparable
+    encodings = face_recognition.face_encodings(image, boxes, model="large")
+    return [np.asarray(e, dtype=np.float32).tolist() for e in encodings]
+
+
+#! ---------------------------- SCAN ----------------------------
+
+
+# * dataset/<person>/<photo> -> [(relative path, person)]
+def find_photos(dataset):
+    photos = []
+    for person in sorted(os.listdir(dataset)):
+        folder = os.path.join(dataset, person)
+        if not os.path.isdir(folder):
+            continue
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    photos.append((os.path.relpath(path, dataset), person))
+    return photos
+
+
+def sha256_file(path, chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)["files"]
+
+
+# Store keys are "<sha256>:<face #>": group the enrolled rows per image hash
+def _enrolled_by_hash(store):
+    by_hash = {}
+    for key, index in store.keys().items():
+        sha = key.split(":", 1)[0]
+        by_hash.setdefault(sha, []).append((key, index))
+    return by_hash
+
+
+#! ---------------------------- MAIN ----------------------------
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enroll faces into the store")
+    parser.add_argument("dataset", nargs="?", default="dataset")
+    parser.add_argument("--store", default=".config/encodings.bin")
+    parser.add_argument("--manifest", default=".config/enroll_manifest.json")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-side", type=int, default=1024)
+    parser.add_argument(
+        "--keep-removed",
+        action="store_true",
+        help="keep encodings of photos deleted from the dataset",
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    manifest = load_manifest(args.manifest)
+    if args.dry_run and not os.path.exists(args.store):
+        store, enrolled = None, {}
+    else:
+        store = EncodingStore.open(args.store, writable=not args.dry_run)
+        enrolled = _enrolled_by_hash(store)
+
+    # Only photos whose size/mtime changed are re-hashed
+    files, todo, moved, queued = {}, [], [], set()
+    unchanged = hashed = 0
+    for rel, person in find_photos(args.dataset):
+        path = os.path.join(args.dataset, rel)
+        stat = os.stat(path)
+        entry = manifest.get(rel)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            sha = entry["sha256"]
+        else:
+            sha = sha256_file(path)
+            hashed += 1
+        files[rel] = {
+            "sha256": sha,
+            "person": person,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "faces": entry["faces"] if entry and entry["sha256"] == sha else None,
+        }
+
+        rows = enrolled.get(sha)
+        if rows and all(store.entries[i][0] == person for _, i in rows):
+            unchanged += 1
+        elif rows:
+            # Same photo moved to another person's folder: relabel, no re-encode
+            moved.append((rel, person, rows))
+        elif files[rel]["faces"] == 0 or sha in queued:
+            # No face last time, or an identical copy is already being encoded
+            unchanged += 1
+        else:
+            queued.add(sha)
+            todo.append((rel, person, sha))
+
+    seen = {info["sha256"] for info in files.values()}
+    stale = [
+        key
+        for sha, rows in enrolled.items()
+        if sha not in seen and not args.keep_removed
+        for key, _ in rows
+    ]
+    print(
+        f"[ENROLL] {len(files)} photos ({hashed} hashed): {unchanged} unchanged, "
+        f"{len(todo)} to encode, {len(moved)} moved, {len(stale)} stale encodings"
+    )
+    if args.dry_run:
+        for rel, person, _ in todo:
+            print(f"[ENROLL] would encode {rel} ({person})")
+        return
+
+    # Moved photos are relabelled and stale encodings dropped in one batch:
+    # a single names-log append per step, however many rows change
+    names, encodings, keys = [], [], []
+    for rel, person, rows in moved:
+        names += [person] * len(rows)
+        encodings += [np.array(store.rows[index]) for _, index in rows]
+        keys += [key for key, _ in rows]
+        files[rel]["faces"] = len(rows)
+    store.remove_keys(keys + stale)
+    if keys:
+        store.enroll_many(names, encodings, keys)
+
+    start = time.perf_counter()
+    faces = failed = 0
+    if todo:
+        jobs = [(os.path.join(args.dataset, rel), sha) for rel, _, sha in todo]
+        people = {os.path.join(args.dataset, rel): (rel, p) for rel, p, _ in todo}
+        with Pool(args.workers, _init_worker, (args.max_side,)) as pool:
+            for path, sha, encodings, error in pool.imap_unordered(
+                encode_image, jobs, chunksize=1
+            ):
+                rel, person = people[path]
+                if error:
+                    failed += 1
+                    files.pop(rel)
+                    print(f"[ENROLL] {rel}: {error}")
+                    continue
+                if encodings:
+                    keys = [f"{sha}:{i}" for i in range(len(encodings))]
+                    store.enroll_many([person] * len(keys), encodings, keys)
+                else:
+                    print(f"[ENROLL] {rel}: no face found")
+                files[rel]["faces"] = len(encodings)
+                faces += len(encodings)
+
+    # The store is the source of truth; the manifest only saves re-hashing
+    write_json(args.manifest, {"version": 1, "files": files})
+    elapsed = time.perf_counter() - start
+    print(
+        f"[ENROLL] Encoded {len(todo) - failed} photos ({faces} faces, {failed} "
+        f"failed) in {elapsed:.1f}s with {args.workers} workers; "
+        f"{len(store)} encodings of {len(set(store.names()))} people in {args.store}"
+    )
+    store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
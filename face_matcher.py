@@ -0,0 +1,193 @@
+import argparse
+import time
+
+import numpy as np
+
+# face_recognition encodings are 128-d
+ENCODING_DIM = 128
+
+#! ---------------------------- MATCHER ----------------------------
+
+
+class FaceMatcher:
+    def __init__(
+        self,
+        encodings,
+        names,
+        tolerance=0.45,
+        index="auto",
+        nlist=None,
+        nprobe=8,
+        dim=ENCODING_DIM,
+    ):
+        self.names = list(names)
+        self.tolerance = tolerance
+        self.nprobe = nprobe
+        self.dim = dim
+        self.matrix = np.zeros((0, dim), np.float32)
+        self.sq_norms = np.zeros(0, np.float32)
+        self.centroids = None
+        self.lists = None
+        self.set_gallery(encodings, self.names, index=index, nlist=nlist)
+
+    # * Contiguous float32 gallery (+ optional partitioned index for big galleries)
+    def set_gallery(self, encodings, names, index="auto", nlist=None):
+        # (-1, dim): an empty gallery (fresh store, everyone removed) is (0, dim)
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if len(matrix) != len(names):
+            raise ValueError(f"{len(matrix)} encodings for {len(names)} names")
+        self.matrix = np.ascontiguousarray(matrix)
+        self.names = list(names)
+        self.sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+
+        use_ivf = index == "ivf" or (index == "auto" and len(self.names) >= 20000)
+        if use_ivf and len(self.names) > 0:
+            self._build_ivf(nlist or int(np.sqrt(len(self.names))))
+        else:
+            self.centroids = None
+            self.lists = None
+
+    def __len__(self):
+        return len(self.names)
+
+    # * Squared L2 distances for a batch of faces: one (M, N) matrix product
+    def distances(self, faces):
+        faces = np.asarray(faces, dtype=np.float32).reshape(-1, self.matrix.shape[1])
+        d2 = faces @ self.matrix.T
+        d2 *= -2
+        d2 += self.sq_norms
+        d2 += np.einsum("ij,ij->i", faces, faces)[:, None]
+        np.maximum(d2, 0, out=d2)
+        return d2
+
+    # * [(name, distance, gallery index)] per face; "Unknown" above tolerance
+    def match(self, faces):
+        if len(faces) == 0:
+            return []
+        if len(self.names) == 0:
+            return [("Unknown", float("inf"), -1) for _ in range(len(faces))]
+        if self.centroids is not None:
+            return self._match_ivf(faces)
+
+        d2 = self.distances(faces)
+        best = np.argmin(d2, axis=1)
+        best_d = np.sqrt(d2[np.arange(len(best)), best])
+        return [self._result(int(i), float(d)) for i, d in zip(best, best_d)]
+
+    def _result(self, index, distance):
+        if distance <= self.tolerance:
+            return self.names[index], distance, index
+        return "Unknown", distance, index
+
+    #! ---------------------------- PARTITIONED INDEX ----------------------------
+
+    # Coarse k-means (IVF): a query is only compared with the nprobe closest lists
+    def _build_ivf(self, nlist, iterations=10, seed=0):
+        rng = np.random.default_rng(seed)
+        n = len(self.matrix)
+        nlist = max(1, min(nlist, n))
+        centroids = self.matrix[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._nearest_centroid(centroids, self.matrix)
+            counts = np.bincount(assign, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, self.matrix)
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+        assign = self._nearest_centroid(centroids, self.matrix)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.centroids = centroids
+        self.lists = [order[bounds[i] : bounds[i + 1]] for i in range(nlist)]
+
+    @staticmethod
+    def _nearest_centroid(centroids, points, batch=65536):
+        c_norms = np.einsum("ij,ij->i", centroids, centroids)
+        assign = np.empty(len(points), np.int64)
+        for start in range(0, len(points), batch):
+            chunk = points[start : start + batch]
+            assign[start : start + batch] = np.argmin(
+                c_norms - 2 * (chunk @ centroids.T), axis=1
+            )
+        return assign
+
+    def _match_ivf(self, faces):
+        faces = np.asarray(faces, dtype=np.float32).reshape(-1, self.matrix.shape[1])
+        c_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        c_d2 = c_norms - 2 * (faces @ self.centroids.T)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(c_d2, nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for face, lists in zip(faces, probes):
+            candidates = np.concatenate([self.lists[i] for i in lists])
+            if len(candidates) == 0:
+                results.append(("Unknown", float("inf"), -1))
+                continue
+            diff = self.matrix[candidates] - face
+            d2 = np.einsum("ij,ij->i", diff, diff)
+            best = int(np.argmin(d2))
+            results.append(
+                self._result(int(candidates[best]), float(np.sqrt(d2[best])))
+            )
+        return results
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+# What process_frame did before: compare_faces + face_distance = two full scans
+def _double_scan(known_encodings, known_names, face, tolerance=0.45):
+    matches = list(
+        np.linalg.norm(np.array(known_encodings) - face, axis=1) <= tolerance
+    )
+    distances = np.linalg.norm(np.array(known_encodings) - face, axis=1)
+    best = np.argmin(distances)
+    return known_names[best] if matches[best] else "Unknown"
+
+
+def synthetic_gallery(size, people=None, seed=0):
+    rng = np.random.default_rng(seed)
+    people = people or max(1, size // 5)
+    centers = rng.normal(0, 0.09, (people, 128)).astype(np.float32)
+    owner = rng.integers(0, people, size)
+    encodings = centers[owner] + rng.normal(0, 0.02, (size, 128)).astype(np.float32)
+    return encodings, [f"person_{i}" for i in owner], centers
+
+
+def benchmark(sizes=(100, 1000, 10000, 100000), faces=3, repeat=20):
+    for size in sizes:
+        encodings, names, centers = synthetic_gallery(size)
+        rng = np.random.default_rng(1)
+        queries = centers[rng.integers(0, len(centers), faces)] + rng.normal(
+            0, 0.02, (faces, 128)
+        ).astype(np.float32)
+
+        known_list = list(encodings)
+        baseline_repeat = max(1, repeat // (10 if size >= 10000 else 1))
+        start = time.perf_counter()
+        for _ in range(baseline_repeat):
+            expected = [_double_scan(known_list, names, q) for q in queries]
+        baseline = (time.perf_counter() - start) / baseline_repeat
+
+        line = f"[BENCH] gallery={size:>6} faces={faces}: double scan {baseline * 1000:8.2f}ms"
+        for index in ("flat", "ivf"):
+            matcher = FaceMatcher(encodings, names, index=index)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                got = [name for name, _, _ in matcher.match(queries)]
+            elapsed = (time.perf_counter() - start) / repeat
+            agree = sum(g == e for g, e in zip(got, expected))
+            line += f" | {index} {elapsed * 1000:7.3f}ms ({agree}/{faces} agree)"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face match latency vs gallery size")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000]
+    )
+    parser.add_argument("--faces", type=int, default=3)
+    args = parser.parse_args()
+    benchmark(args.sizes, args.faces)
@@ -1,34 +1,62 @@
+import argparse
 import os
 import pickle
+import threading
 import time
 
 import cv2
 import face_recognition
-import numpy as np
-import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
+import actuator_state
+import metrics
+from camera_capture import FrameGrabber, VideoFileSource
+from encodings_store import EncodingStore
+from face_matcher import FaceMatcher
+from face_tracker import FaceTracker
+from motion_gate import MotionGate
+from mqtt_client import make_client
+
 #! ---------------------------- VARIABLEs & SETUP ----------------------------
 MQTT_HOST = os.getenv("MQTT_HOST")
 MQTT_POST = int(os.getenv("MQTT_POST"))
 KEEP_ALIVE = int(os.getenv("KEEP_ALIVE"))
 TOPIC_PUB = os.getenv("TOPIC_DOOR")
+# Last door command, persisted: a door left OPEN by a crash is closed at startup
+DOOR_STATE = os.getenv("DOOR_STATE", ".config/door_state.json")
 
-# Load pre-trained face encodings
+# Load pre-trained face encodings: memory-mapped store, legacy pickle fallback
+ENCODINGS_STORE = os.getenv("ENCODINGS_STORE", ".config/encodings.bin")
 print("[INFO] loading encodings...")
-with open(".config/encodings.pickle", "rb") as f:
-    data = pickle.loads(f.read())
+if os.path.exists(ENCODINGS_STORE):
+    known_face_encodings, known_face_names = EncodingStore.open(
+        ENCODINGS_STORE
+    ).gallery()
+else:
+    print(
+        f"[INFO] {ENCODINGS_STORE} missing, reading .config/encodings.pickle "
+        "(convert it with: python encodings_store.py convert)"
+    )
+    with open(".config/encodings.pickle", "rb") as f:
+        data = pickle.loads(f.read())
 
-known_face_encodings = data["encodings"]
-known_face_names = data["names"]
+    known_face_encodings = data["encodings"]
+    known_face_names = data["names"]
 
-# Initialize the USB Camera
-print("[INFO] initializing USB camera...")
-cap = cv2.VideoCapture(2)
+# Contiguous float32 gallery: one batched distance pass per frame
+matcher = FaceMatcher(known_face_encodings, known_face_names, tolerance=0.45)
 
-if not cap.isOpened():
-    print("Error: Could not open video stream.")
-    exit()
+CAMERA_INDEX = int(os.getenv("CAMERA_INDEX", "2"))
+# "track": detect + encode every FACE_DETECT_EVERY frames, follow boxes in between
+# "full": detect + encode on every frame
+FACE_MODE = os.getenv("FACE_MODE", "track")
+FACE_DETECT_EVERY = int(os.getenv("FACE_DETECT_EVERY", "10"))
+# No OpenCV window/event loop (supervisor, service)
+HEADLESS = os.getenv("HEADLESS", "0") == "1"
+# Skip face detection while the doorway is still (tiny gray frame differencing)
+MOTION_GATE = os.getenv("MOTION_GATE", "1") == "1"
+MOTION_WAKE_FRACTION = float(os.getenv("MOTION_WAKE_FRACTION", "0.01"))
+MOTION_SLEEP_AFTER = float(os.getenv("MOTION_SLEEP_AFTER", "5"))
 
 
 # Initialize variables
@@ -40,8 +68,34 @@ face_names = []
 last_open_time = 0
 is_open = False
 
+# Frames through handle_frame(): "processed" (face pipeline) or "idle" (gated)
+FRAMES = {
+    result: metrics.counter(
+        "garden_door_frames_total", "Door camera frames", result=result
+    )
+    for result in ("processed", "idle")
+}
+DOOR_OPENS = metrics.counter("garden_door_opens_total", "OPEN commands sent")
+
 
 #! ---------------------------- FUNCs ----------------------------
+@metrics.timed("garden_door_stage_seconds", "Face pipeline stage", stage="detect")
+def detect_faces(rgb):
+    return face_recognition.face_locations(rgb)
+
+
+@metrics.timed("garden_door_stage_seconds", "Face pipeline stage", stage="encode")
+def encode_faces(rgb, locations):
+    return face_recognition.face_encodings(rgb, locations, model="large")
+
+
+tracker = FaceTracker(
+    detect_faces, encode_faces, matcher.match, detect_every=FACE_DETECT_EVERY
+)
+gate = MotionGate(wake_fraction=MOTION_WAKE_FRACTION, sleep_after=MOTION_SLEEP_AFTER)
+
+
+@metrics.timed("garden_door_frame_seconds", "process_frame() duration")
 def process_frame(frame):
     global face_locations, face_encodings, face_names, last_open_time, is_open
 
@@ -51,41 +105,58 @@ def process_frame(frame):
     # Convert the image from BGR to RGB color space
     rgb_resized_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
 
-    # Detect faces and get face encodings
-    face_locations = face_recognition.face_locations(rgb_resized_frame)
-    face_encodings = face_recognition.face_encodings(
-        rgb_resized_frame, face_locations, model="large"
-    )
-
-    face_names = []
-
-    for face_encoding in face_encodings:
-        matches = face_recognition.compare_faces(
-            known_face_encodings, face_encoding, tolerance=0.45
-        )
-        name = "Unknown"
-
-        # Use the known face with the smallest distance
-        face_distances = face_recognition.face_distance(
-            known_face_encodings, face_encoding
-        )
-        best_match_index = np.argmin(face_distances)
-        if matches[best_match_index]:
-            name = known_face_names[best_match_index]
-
+    if FACE_MODE == "track":
+        # Known faces keep their name while the tracker follows them
+        face_locations, face_names = tracker.update(rgb_resized_frame)
+    else:
+        # Detect faces and get face encodings
+        face_locations = detect_faces(rgb_resized_frame)
+        face_encodings = encode_faces(rgb_resized_frame, face_locations)
+        face_names = [name for name, _, _ in matcher.match(face_encodings)]
+
+    for name in face_names:
+        if name != "Unknown":
             if not is_open or (time.time() - last_open_time > 3):
-                client.publish(TOPIC_PUB, "OPEN")
+                send_door("OPEN")
+                DOOR_OPENS.inc()
                 print(f"Hello, {name}")
                 last_open_time = time.time()
                 is_open = True
 
-        face_names.append(name)
+    close_door_if_due()
+    return frame
+
+
+def close_door_if_due():
+    global is_open
 
     if is_open and (time.time() - last_open_time > 3):
-        client.publish(TOPIC_PUB, "CLOSE")
+        send_door("CLOSE")
         print("Door closed")
         is_open = False
 
+
+# Door commands: never held back (window 0) and never retained, a device
+# reconnecting must not be handed a stale OPEN
+def send_door(command):
+    if actuators is not None:
+        actuators.command(TOPIC_PUB, command, window=0, retain=False)
+    else:
+        client.publish(TOPIC_PUB, command)
+
+
+# * Gate in front of process_frame: an idle doorway only costs the motion check
+def handle_frame(frame):
+    global face_locations, face_names
+
+    if not MOTION_GATE or gate.update(frame):
+        FRAMES["processed"].inc()
+        return process_frame(frame)
+
+    FRAMES["idle"].inc()
+    face_locations, face_names = [], []
+    tracker.reset()
+    close_door_if_due()
     return frame
 
 
@@ -106,23 +177,170 @@ def draw_results(frame):
     return frame
 
 
-client = mqtt.Client()
-client.connect(MQTT_HOST, MQTT_POST, KEEP_ALIVE)
+client = None
+actuators = None  # ActuatorState of main(), None in --bench runs
+# Set by stop(): the main loop exits after the current frame
+_stopping = threading.Event()
 
 
-#! ---------------------------- MAIN LOOP ----------------------------
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("[ERROR] Unable to capture video")
-        break
+# * Ask a running main() to return (supervisor stop hook)
+def stop():
+    _stopping.set()
+
 
-    processed_frame = process_frame(frame)
-    display_frame = draw_results(processed_frame)
+# Stands in for the MQTT client during --bench runs: records door commands
+class DoorEventLog:
+    def __init__(self):
+        self.events = []
 
-    if cv2.waitKey(1) == ord("q"):
-        break
+    def publish(self, topic, payload):
+        self.events.append((time.monotonic(), payload))
 
-# Clean up
-cap.release()
-cv2.destroyAllWindows()
+
+#! ---------------------------- MAIN LOOP ----------------------------
+def main(grabber=None, video=None, mqtt=None):
+    global client, actuators, is_open
+
+    # Shared connection from the supervisor, or our own
+    client = mqtt
+    if client is None:
+        client = make_client()
+        client.connect(MQTT_HOST, MQTT_POST, KEEP_ALIVE)
+        # Network loop: keepalive pings and QoS 1 acks
+        client.loop_start()
+    metrics.start(client)
+    actuators = actuator_state.shared(client, DOOR_STATE, window=0, retain=False)
+    if actuators.state(TOPIC_PUB) == "OPEN":
+        print("[INFO] door was left open, closing it")
+        send_door("CLOSE")
+    is_open = False
+
+    # Initialize the USB Camera / recorded clip (or use a shared grabber)
+    own_grabber = grabber is None
+    if own_grabber:
+        if video:
+            print(f"[INFO] playing {video}...")
+            grabber = FrameGrabber(VideoFileSource(video), name="door")
+        else:
+            print("[INFO] initializing USB camera...")
+            grabber = FrameGrabber(CAMERA_INDEX, name="door")
+        if not grabber.isOpened():
+            print("Error: Could not open video stream.")
+            return
+        grabber.start()
+    reader = grabber.reader("door")
+    print("[READY] door")
+
+    while not _stopping.is_set():
+        # Always the newest frame: stale ones are dropped by the grabber thread
+        ret, frame = reader.read()
+        if not ret:
+            print("[ERROR] Unable to capture video")
+            break
+
+        processed_frame = handle_frame(frame)
+        display_frame = draw_results(processed_frame)
+        reader.done()
+
+        if not HEADLESS and cv2.waitKey(1) == ord("q"):
+            break
+
+    # Clean up
+    print(f"[CAMERA] {reader.stats()}")
+    if MOTION_GATE:
+        print(f"[GATE] {gate.stats()}")
+    if own_grabber:
+        grabber.stop()
+    if not HEADLESS:
+        cv2.destroyAllWindows()
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+# * Clip time (s) of the first frame where a face is visible, from a full scan
+def first_face_time(video):
+    capture = cv2.VideoCapture(video)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            capture.release()
+            return None
+        small = cv2.resize(frame, (0, 0), fx=(1 / cv_scaler), fy=(1 / cv_scaler))
+        if detect_faces(cv2.cvtColor(small, cv2.COLOR_BGR2RGB)):
+            capture.release()
+            return index / fps
+        index += 1
+
+
+# * Replay the clip in real time per mode ("full", "track", "+gate" suffix):
+# FPS, CPU seconds and door-open latency
+def benchmark(
+    video,
+    modes=("full", "track", "track+gate"),
+    detect_every=FACE_DETECT_EVERY,
+):
+    global client, tracker, gate, FACE_MODE, MOTION_GATE, is_open, last_open_time
+
+    appears_at = first_face_time(video)
+    print(f"[BENCH] first face at {appears_at}s in {video}")
+
+    for mode in modes:
+        FACE_MODE, _, gated = mode.partition("+")
+        MOTION_GATE = bool(gated)
+        client = DoorEventLog()
+        tracker = FaceTracker(
+            detect_faces, encode_faces, matcher.match, detect_every=detect_every
+        )
+        gate = MotionGate(
+            wake_fraction=MOTION_WAKE_FRACTION, sleep_after=MOTION_SLEEP_AFTER
+        )
+        is_open, last_open_time = False, 0
+
+        source = VideoFileSource(video)
+        grabber = FrameGrabber(source, name="bench").start()
+        reader = grabber.reader(mode)
+        start = time.perf_counter()
+        cpu = time.process_time()
+        while True:
+            ret, frame = reader.read()
+            if not ret:
+                break
+            handle_frame(frame)
+            reader.done()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        grabber.stop()
+
+        opens = [t for t, payload in client.events if payload == "OPEN"]
+        if opens and appears_at is not None:
+            latency = f"{opens[0] - source.started_at - appears_at:.2f}s"
+        else:
+            latency = "never"
+        extra = f" {tracker.stats()}" if FACE_MODE == "track" else ""
+        extra += f" {gate.stats()}" if MOTION_GATE else ""
+        print(
+            f"[BENCH] mode={mode}: {reader.frames / elapsed:.1f} fps "
+            f"({reader.dropped} dropped), {cpu:.1f}s CPU, "
+            f"door open after {latency}{extra}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face recognition door")
+    parser.add_argument("--video", help="recorded clip instead of the camera")
+    parser.add_argument("--mode", choices=["full", "track"], default=FACE_MODE)
+    parser.add_argument("--detect-every", type=int, default=FACE_DETECT_EVERY)
+    parser.add_argument(
+        "--bench", action="store_true", help="compare the modes on --video"
+    )
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.video, detect_every=args.detect_every)
+    else:
+        FACE_MODE = args.mode
+        tracker.detect_every = args.detect_every
+        main(video=args.video)
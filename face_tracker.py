@@ -0,0 +1,249 @@
+import time
+
+import cv2
+import numpy as np
+
+#! ---------------------------- HELPERs ----------------------------
+
+
+# Boxes use the face_recognition layout: (top, right, bottom, left)
+def iou(a, b):
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    inter = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+# * Greedy IoU association: [(track_index, box_index)], highest overlap first
+def associate(tracks, boxes, threshold=0.3):
+    pairs = sorted(
+        (
+            (iou(track.box, box), t, b)
+            for t, track in enumerate(tracks)
+            for b, box in enumerate(boxes)
+        ),
+        reverse=True,
+    )
+    used_tracks, used_boxes, matches = set(), set(), []
+    for score, t, b in pairs:
+        if score < threshold:
+            break
+        if t in used_tracks or b in used_boxes:
+            continue
+        used_tracks.add(t)
+        used_boxes.add(b)
+        matches.append((t, b))
+    return matches
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.name = "Unknown"
+        self.distance = None
+        self.template = None
+        self.encoded_at = None
+        self.lost = False
+
+
+#! ---------------------------- TRACKER ----------------------------
+
+
+class FaceTracker:
+    def __init__(
+        self,
+        detect,
+        encode,
+        match,
+        detect_every=10,
+        iou_threshold=0.3,
+        min_score=0.6,
+        search=0.5,
+    ):
+        # detect(rgb) -> boxes, encode(rgb, boxes) -> encodings,
+        # match(encodings) -> [(name, distance, index)] (FaceMatcher.match)
+        self.detect = detect
+        self.encode = encode
+        self.match = match
+        self.detect_every = detect_every
+        self.iou_threshold = iou_threshold
+        self.min_score = min_score
+        self.search = search
+
+        self.tracks = []
+        self.frame_index = 0
+        self.last_detection = None
+        self._next_id = 0
+
+        self.detections = 0
+        self.encoded_faces = 0
+        self.followed = 0
+        self.lost = 0
+
+    def reset(self):
+        self.tracks = []
+        self.last_detection = None
+
+    # * One frame: (face boxes, names), same shape as the full pipeline output
+    def update(self, rgb):
+        self.frame_index += 1
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        if self._needs_detection():
+            self._detect(rgb, gray)
+        else:
+            self._follow(gray)
+        return [t.box for t in self.tracks], [t.name for t in self.tracks]
+
+    def _needs_detection(self):
+        return (
+            not self.tracks
+            or self.last_detection is None
+            or any(t.lost for t in self.tracks)
+            or self.frame_index - self.last_detection >= self.detect_every
+        )
+
+    # Detect, keep track ids of boxes that overlap a track, and re-encode every
+    # box: a stranger stepping into the box someone just left overlaps it too,
+    # so a name only carries over the template-followed frames in between
+    def _detect(self, rgb, gray):
+        self.detections += 1
+        self.last_detection = self.frame_index
+        boxes = [tuple(int(v) for v in box) for box in self.detect(rgb)]
+
+        tracks = []
+        for t, b in associate(self.tracks, boxes, self.iou_threshold):
+            track = self.tracks[t]
+            track.box = boxes[b]
+            track.lost = False
+            tracks.append(track)
+        matched = {track.box for track in tracks}
+        for box in boxes:
+            if box not in matched:
+                tracks.append(Track(self._new_id(), box))
+        self.tracks = tracks
+
+        if self.tracks:
+            encodings = self.encode(rgb, [t.box for t in self.tracks])
+            for track, (name, distance, _) in zip(self.tracks, self.match(encodings)):
+                track.name = name
+                track.distance = distance
+                track.encoded_at = self.frame_index
+            self.encoded_faces += len(self.tracks)
+
+        for track in self.tracks:
+            track.template = self._crop(gray, track.box)
+
+    # Between detections: follow each box with template matching near its last spot
+    def _follow(self, gray):
+        height, width = gray.shape
+        for track in self.tracks:
+            top, right, bottom, left = track.box
+            h, w = bottom - top, right - left
+            template = track.template
+            if template is None or template.size == 0:
+                track.lost = True
+                continue
+
+            pad_y, pad_x = int(h * self.search) + 1, int(w * self.search) + 1
+            y0, y1 = max(0, top - pad_y), min(height, bottom + pad_y)
+            x0, x1 = max(0, left - pad_x), min(width, right + pad_x)
+            window = gray[y0:y1, x0:x1]
+            if (
+                window.shape[0] < template.shape[0]
+                or window.shape[1] < template.shape[1]
+            ):
+                track.lost = True
+                self.lost += 1
+                continue
+
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (x, y) = cv2.minMaxLoc(scores)
+            if score < self.min_score:
+                track.lost = True
+                self.lost += 1
+                continue
+            top, left = y0 + y, x0 + x
+            track.box = (top, left + template.shape[1], top + template.shape[0], left)
+            self.followed += 1
+
+    @staticmethod
+    def _crop(gray, box):
+        top, right, bottom, left = box
+        top, left = max(0, top), max(0, left)
+        return gray[top:bottom, left:right].copy()
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def stats(self):
+        return {
+            "frames": self.frame_index,
+            "detections": self.detections,
+            "encoded_faces": self.encoded_faces,
+            "followed": self.followed,
+            "lost": self.lost,
+        }
+
+
+#! ---------------------------- SELF-CHECK ----------------------------
+
+
+# Textured "face" drifting over a noisy background; detector/encoder sleep to
+# mimic HOG + the large encoder on a Pi
+def synthetic_clip(frames=300, width=160, height=120, size=32, seed=0):
+    rng = np.random.default_rng(seed)
+    face = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+    clip = []
+    for i in range(frames):
+        frame = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+        x = int((width - size) / 2 + (width - size) / 3 * np.sin(i / 40))
+        y = int((height - size) / 2)
+        frame[y : y + size, x : x + size] = face
+        clip.append(frame)
+    return clip
+
+
+def _fake_pipeline(detect_cost=0.04, encode_cost=0.03):
+    def detect(rgb):
+        time.sleep(detect_cost)
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        x, y, w, h = cv2.boundingRect(cv2.findNonZero((gray > 60).astype(np.uint8)))
+        return [(y, x + w, y + h, x)] if w else []
+
+    def encode(rgb, boxes):
+        time.sleep(encode_cost * len(boxes))
+        return [np.zeros(128, np.float32) for _ in boxes]
+
+    def match(encodings):
+        return [("Alice", 0.3, 0) for _ in encodings]
+
+    return detect, encode, match
+
+
+if __name__ == "__main__":
+    clip = synthetic_clip()
+    detect, encode, match = _fake_pipeline()
+
+    start = time.perf_counter()
+    for frame in clip:
+        boxes = detect(frame)
+        match(encode(frame, boxes))
+    full = len(clip) / (time.perf_counter() - start)
+
+    tracker = FaceTracker(detect, encode, match, detect_every=10)
+    drift = []
+    start = time.perf_counter()
+    for i, frame in enumerate(clip):
+        boxes, names = tracker.update(frame)
+        if i % 25 == 0 and boxes:
+            drift.append(iou(boxes[0], detect(frame)[0]))
+    track = len(clip) / (time.perf_counter() - start - 0.04 * len(drift))
+
+    print(f"[TRACK] full {full:.1f} fps | track {track:.1f} fps | {tracker.stats()}")
+    print(f"[TRACK] min IoU vs detector while tracking: {min(drift):.2f}")
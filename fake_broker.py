@@ -0,0 +1,131 @@
+import asyncio
+import struct
+
+from topic_router import topic_matches
+
+# Minimal in-process MQTT 3.1.1 broker: CONNECT, SUBSCRIBE, PUBLISH (QoS 0/1),
+# PINGREQ and DISCONNECT. Enough to benchmark the controller without mosquitto.
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+#! ---------------------------- HELPERs ----------------------------
+
+
+def encode_length(length):
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        out.append(byte)
+        if not length:
+            return bytes(out)
+
+
+def packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + encode_length(len(body)) + body
+
+
+async def read_packet(reader):
+    header = await reader.readexactly(1)
+    multiplier, length = 1, 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    body = await reader.readexactly(length) if length else b""
+    return header[0] >> 4, header[0] & 0x0F, body
+
+
+#! ---------------------------- BROKER ----------------------------
+
+
+class FakeBroker:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.sessions = {}  # writer -> [topic filters]
+        self.published = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        for writer in list(self.sessions):
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    # * Drop every client connection (used to exercise reconnect)
+    def kick_all(self):
+        for writer in list(self.sessions):
+            writer.close()
+
+    async def _handle(self, reader, writer):
+        self.sessions[writer] = []
+        try:
+            while True:
+                packet_type, flags, body = await read_packet(reader)
+                if packet_type == CONNECT:
+                    writer.write(packet(CONNACK, 0, b"\x00\x00"))
+                elif packet_type == SUBSCRIBE:
+                    self._subscribe(writer, body)
+                elif packet_type == UNSUBSCRIBE:
+                    writer.write(packet(UNSUBACK, 0, body[:2]))
+                elif packet_type == PUBLISH:
+                    self._publish(writer, flags, body)
+                elif packet_type == PINGREQ:
+                    writer.write(packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.sessions.pop(writer, None)
+            writer.close()
+
+    def _subscribe(self, writer, body):
+        packet_id, pos = body[:2], 2
+        granted = bytearray()
+        while pos < len(body):
+            (size,) = struct.unpack("!H", body[pos : pos + 2])
+            topic_filter = body[pos + 2 : pos + 2 + size].decode("utf-8")
+            pos += 2 + size + 1
+            self.sessions[writer].append(topic_filter)
+            granted.append(0)
+        writer.write(packet(SUBACK, 0, packet_id + bytes(granted)))
+
+    def _publish(self, writer, flags, body):
+        (size,) = struct.unpack("!H", body[:2])
+        topic = body[2 : 2 + size].decode("utf-8")
+        payload_start = 2 + size
+        qos = (flags >> 1) & 0x03
+        if qos:
+            writer.write(packet(PUBACK, 0, body[payload_start : payload_start + 2]))
+            payload_start += 2
+        payload = body[payload_start:]
+        self.published += 1
+
+        # Deliver at QoS 0 to every matching subscriber
+        outgoing = packet(PUBLISH, 0, body[: 2 + size] + payload)
+        for subscriber, filters in self.sessions.items():
+            if any(topic_matches(f, topic) for f in filters):
+                subscriber.write(outgoing)
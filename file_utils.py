@@ -0,0 +1,13 @@
+import json
+import os
+
+
+# * Atomic JSON write: temp file, fsync, rename over the old one. Readers see
+# the previous or the new document, never a truncated one.
+def write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
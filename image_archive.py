@@ -0,0 +1,570 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# archive/<YYYY-MM-DD>/<session>/image_<n>.jpg + archive/index.sqlite
+SESSIONS = ("morning", "evening")
+# Legacy folders kept as symlinks into the archive (old URLs keep working)
+VIEWS = {
+    "today_morning": (0, "morning"),
+    "today_evening": (0, "evening"),
+    "yesterday": (-1, "evening"),
+}
+
+# Zones as horizontal bands of the camera image: "LEFT:0-0.5,RIGHT:0.5-1"
+DEFAULT_ZONES = os.getenv("IMAGE_ZONES", "LEFT:0-0.5,RIGHT:0.5-1")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    taken_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    session TEXT NOT NULL,
+    path TEXT,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    ndvi_mean REAL,
+    vegetation REAL,
+    weak_count INTEGER NOT NULL DEFAULT 0,
+    weak_px INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS captures_time ON captures (taken_at);
+CREATE INDEX IF NOT EXISTS captures_day ON captures (day, session);
+CREATE INDEX IF NOT EXISTS captures_files ON captures (taken_at) WHERE path IS NOT NULL;
+CREATE TABLE IF NOT EXISTS detections (
+    capture_id INTEGER NOT NULL,
+    taken_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    zone TEXT,
+    x INTEGER, y INTEGER, w INTEGER, h INTEGER
+);
+CREATE INDEX IF NOT EXISTS detections_lookup ON detections (kind, zone, taken_at);
+CREATE INDEX IF NOT EXISTS detections_capture ON detections (capture_id);
+"""
+
+
+def parse_zones(spec):
+    zones = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, band = item.split(":")
+        start, end = band.split("-")
+        zones.append((name, float(start), float(end)))
+    return zones
+
+
+# * Zone of a box (x, y, w, h) by the horizontal position of its centre
+def zone_of(box, width, zones):
+    centre = (box[0] + box[2] / 2) / max(width, 1)
+    for name, start, end in zones:
+        if start <= centre < end or (end == 1.0 and centre == 1.0):
+            return name
+    return None
+
+
+def day_of(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+
+
+def _timestamp(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+#! ---------------------------- ARCHIVE ----------------------------
+
+
+class ImageArchive:
+    def __init__(self, root, zones=DEFAULT_ZONES):
+        self.root = os.path.abspath(root)
+        self.zones = parse_zones(zones) if isinstance(zones, str) else list(zones)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._numbers = {}
+        # Shared by the capture loop and the HTTP server threads (behind _lock)
+        self._db = sqlite3.connect(
+            os.path.join(self.root, "index.sqlite"), check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def session_dir(self, day, session):
+        return os.path.join(self.root, day, session)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, args)]
+
+    #! ---------------------------- WRITE ----------------------------
+
+    # * Store one encoded image with its stats and boxes; returns its path.
+    # regions / weak_areas are (x, y, w, h) boxes in image coordinates.
+    def add(
+        self,
+        data,
+        session,
+        taken_at=None,
+        width=None,
+        ndvi_mean=None,
+        vegetation=None,
+        regions=(),
+        weak_areas=(),
+        ext=".jpg",
+    ):
+        taken_at = time.time() if taken_at is None else _timestamp(taken_at)
+        day = day_of(taken_at)
+        folder = self.session_dir(day, session)
+        os.makedirs(folder, exist_ok=True)
+
+        with self._lock:
+            number = self._reserve(day, session)
+        rel = os.path.join(day, session, f"image_{number}{ext}")
+        # The file is written outside the lock: writer threads overlap on disk I/O
+        if data is not None:
+            with open(os.path.join(self.root, rel), "wb") as f:
+                f.write(data)
+        with self._lock:
+            self._insert(
+                taken_at,
+                day,
+                session,
+                rel,
+                len(data) if data is not None else 0,
+                width,
+                ndvi_mean,
+                vegetation,
+                regions,
+                weak_areas,
+            )
+            self._db.commit()
+        return os.path.join(self.root, rel)
+
+    # Numbered per day/session: a second run the same day never overwrites
+    def _reserve(self, day, session):
+        key = (day, session)
+        if key not in self._numbers:
+            (count,) = self._db.execute(
+                "SELECT count(*) FROM captures WHERE day = ? AND session = ?", key
+            ).fetchone()
+            self._numbers[key] = count
+        self._numbers[key] += 1
+        return self._numbers[key]
+
+    def _insert(
+        self,
+        taken_at,
+        day,
+        session,
+        rel,
+        size,
+        width,
+        ndvi_mean,
+        vegetation,
+        regions,
+        weak_areas,
+    ):
+        weak_areas = [tuple(int(v) for v in box) for box in weak_areas or ()]
+        regions = [tuple(int(v) for v in box) for box in regions or ()]
+        cursor = self._db.execute(
+            "INSERT INTO captures (taken_at, day, session, path, bytes, ndvi_mean,"
+            " vegetation, weak_count, weak_px) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                taken_at,
+                day,
+                session,
+                rel,
+                size,
+                ndvi_mean,
+                vegetation,
+                len(weak_areas),
+                sum(w * h for _, _, w, h in weak_areas),
+            ),
+        )
+        capture_id = cursor.lastrowid
+        width = width or max((x + w for x, _, w, _ in regions + weak_areas), default=1)
+        self._db.executemany(
+            "INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (capture_id, taken_at, kind, zone_of(box, width, self.zones), *box)
+                for kind, boxes in (("region", regions), ("weak", weak_areas))
+                for box in boxes
+            ],
+        )
+        return capture_id
+
+    # * Bulk insert for imports/benchmarks: [(taken_at, session, kwargs), ...]
+    def add_many(self, captures):
+        with self._lock:
+            for taken_at, session, info in captures:
+                day = day_of(taken_at)
+                self._insert(
+                    taken_at,
+                    day,
+                    session,
+                    info.get("path"),
+                    info.get("bytes", 0),
+                    info.get("width"),
+                    info.get("ndvi_mean"),
+                    info.get("vegetation"),
+                    info.get("regions", ()),
+                    info.get("weak_areas", ()),
+                )
+            self._db.commit()
+
+    #! ---------------------------- QUERIES ----------------------------
+
+    def captures(self, since=None, until=None, session=None):
+        sql = "SELECT * FROM captures WHERE taken_at >= ? AND taken_at < ?"
+        args = [_timestamp(since) or 0, _timestamp(until) or float("inf")]
+        if session:
+            sql += " AND session = ?"
+            args.append(session)
+        return self._query(sql + " ORDER BY taken_at", args)
+
+    # * e.g. every weak area in zone LEFT over the last week
+    def detections(self, zone=None, since=None, until=None, kind="weak", limit=None):
+        sql = (
+            "SELECT d.kind, d.zone, d.x, d.y, d.w, d.h, d.taken_at, c.id AS capture,"
+            " c.day, c.session, c.path FROM detections d"
+            " JOIN captures c ON c.id = d.capture_id"
+            " WHERE d.kind = ? AND d.taken_at >= ? AND d.taken_at < ?"
+        )
+        args = [kind, _timestamp(since) or 0, _timestamp(until) or float("inf")]
+        if zone:
+            sql += " AND d.zone = ?"
+            args.append(zone)
+        sql += " ORDER BY d.taken_at"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._query(sql, args)
+
+    # Per day/session averages, for trend charts
+    def daily(self, since=None, until=None):
+        return self._query(
+            "SELECT day, session, count(*) AS images, avg(ndvi_mean) AS ndvi_mean,"
+            " avg(vegetation) AS vegetation, sum(weak_count) AS weak_count,"
+            " sum(weak_px) AS weak_px FROM captures"
+            " WHERE taken_at >= ? AND taken_at < ? GROUP BY day, session"
+            " ORDER BY day, session",
+            (_timestamp(since) or 0, _timestamp(until) or float("inf")),
+        )
+
+    def stats(self):
+        (row,) = self._query(
+            "SELECT count(*) AS captures, count(path) AS images,"
+            " coalesce(sum(bytes), 0) AS bytes, min(taken_at) AS oldest,"
+            " max(taken_at) AS newest, max(id) AS last_id FROM captures"
+        )
+        return row
+
+    #! ---------------------------- RETENTION ----------------------------
+
+    # * Age/size based compaction. Images go first (older than keep_images_days,
+    # then oldest-first until under max_bytes); the index rows with their stats
+    # and boxes stay until keep_index_days, so trends outlive the pictures.
+    def compact(
+        self, keep_images_days=30, keep_index_days=365, max_bytes=None, now=None
+    ):
+        now = time.time() if now is None else now
+        drop = []
+        with self._lock:
+            if keep_images_days is not None:
+                drop += self._db.execute(
+                    "SELECT id, path, bytes FROM captures"
+                    " WHERE path IS NOT NULL AND taken_at < ? ORDER BY taken_at",
+                    (now - keep_images_days * 86400,),
+                ).fetchall()
+            if max_bytes is not None:
+                (total,) = self._db.execute(
+                    "SELECT coalesce(sum(bytes), 0) FROM captures"
+                ).fetchone()
+                total -= sum(row["bytes"] for row in drop)
+                dropped = {row["id"] for row in drop}
+                rows = self._db.execute(
+                    "SELECT id, path, bytes FROM captures"
+                    " WHERE path IS NOT NULL ORDER BY taken_at"
+                )
+                for row in rows:
+                    if total <= max_bytes:
+                        break
+                    if row["id"] not in dropped:
+                        drop.append(row)
+                        total -= row["bytes"]
+
+            for row in drop:
+                try:
+                    os.remove(os.path.join(self.root, row["path"]))
+                except FileNotFoundError:
+                    pass
+            self._db.executemany(
+                "UPDATE captures SET path = NULL, bytes = 0 WHERE id = ?",
+                [(row["id"],) for row in drop],
+            )
+
+            removed_rows = 0
+            if keep_index_days is not None:
+                cutoff = now - keep_index_days * 86400
+                self._db.execute("DELETE FROM detections WHERE taken_at < ?", (cutoff,))
+                removed_rows = self._db.execute(
+                    "DELETE FROM captures WHERE taken_at < ?", (cutoff,)
+                ).rowcount
+            self._db.commit()
+
+        self._prune_dirs(keep=day_of(now - 86400))
+        return {
+            "removed_images": len(drop),
+            "freed_bytes": sum(row["bytes"] for row in drop),
+            "removed_rows": removed_rows,
+        }
+
+    # Empty day/session folders, except the ones the legacy views point at
+    def _prune_dirs(self, keep):
+        for day in os.listdir(self.root):
+            folder = os.path.join(self.root, day)
+            if not os.path.isdir(folder) or day >= keep:
+                continue
+            for session in os.listdir(folder):
+                path = os.path.join(folder, session)
+                if os.path.isdir(path) and not os.listdir(path):
+                    os.rmdir(path)
+            if not os.listdir(folder):
+                os.rmdir(folder)
+
+    #! ---------------------------- LEGACY FOLDERS ----------------------------
+
+    # * Point today_morning / today_evening / yesterday at the archive folders
+    def link_views(self, base_dir, now=None):
+        today = datetime.fromtimestamp(time.time() if now is None else now)
+        for name, (offset, session) in VIEWS.items():
+            day = (today + timedelta(days=offset)).strftime("%Y-%m-%d")
+            target = self.session_dir(day, session)
+            os.makedirs(target, exist_ok=True)
+            link = os.path.join(base_dir, name)
+            tmp = link + ".tmp"
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            os.symlink(os.path.relpath(target, base_dir), tmp)
+            # Atomic swap: the HTTP server never sees a missing folder
+            os.replace(tmp, link)
+
+    # * One-off import of the old fixed-name folders (file mtime = capture time)
+    def import_legacy(self, base_dir):
+        imported = 0
+        for name, (_, session) in VIEWS.items():
+            folder = os.path.join(base_dir, name)
+            if os.path.islink(folder) or not os.path.isdir(folder):
+                continue
+            detections = {}
+            sidecar = os.path.join(folder, "detections.jsonl")
+            if os.path.exists(sidecar):
+                with open(sidecar) as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            detections[record["image"]] = record
+            images = sorted(
+                (os.path.getmtime(os.path.join(folder, f)), f)
+                for f in os.listdir(folder)
+                if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+            )
+            for mtime, file in images:
+                path = os.path.join(folder, file)
+                record = detections.get(file, {})
+                with open(path, "rb") as f:
+                    data = f.read()
+                self.add(
+                    data,
+                    session,
+                    taken_at=mtime,
+                    regions=record.get("regions", ()),
+                    weak_areas=record.get("weak_areas", ()),
+                    ext=os.path.splitext(file)[1].lower(),
+                )
+                os.remove(path)
+                imported += 1
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+            if os.listdir(folder):
+                # Leftover non-image files: keep them, but out of the view's way
+                aside = folder + ".old"
+                n = 1
+                while os.path.lexists(aside):
+                    aside = f"{folder}.old{n}"
+                    n += 1
+                os.rename(folder, aside)
+                print(f"[ARCHIVE] Kept leftover files of {name} in {aside}")
+            else:
+                os.rmdir(folder)
+        return imported
+
+
+def ndvi_stats(ndvi_values, threshold=0.2):
+    return (
+        float(ndvi_values.mean()),
+        float(np.count_nonzero(ndvi_values > threshold)) / ndvi_values.size,
+    )
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+# A year of twice-daily sessions (15 images each) with a few boxes per image
+def synthetic_year(archive, days=365, per_session=15, image_bytes=2048, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 1).timestamp()
+    payload = bytes(image_bytes)
+    captures = []
+    for day in range(days):
+        for session, hour in (("morning", 7), ("evening", 18)):
+            base = start + day * 86400 + hour * 3600
+            folder = archive.session_dir(day_of(base), session)
+            os.makedirs(folder, exist_ok=True)
+            for n in range(per_session):
+                rel = os.path.join(day_of(base), session, f"image_{n + 1}.jpg")
+                with open(os.path.join(archive.root, rel), "wb") as f:
+                    f.write(payload)
+                regions = [
+                    (int(x), 40, 150, 200)
+                    for x in rng.integers(0, 480, rng.integers(1, 4))
+                ]
+                weak = [
+                    (int(x), int(y), 20, 20)
+                    for x, y in rng.integers(0, 600, (rng.integers(0, 5), 2))
+                ]
+                info = {
+                    "path": rel,
+                    "bytes": image_bytes,
+                    "width": 640,
+                    "ndvi_mean": float(rng.uniform(0.1, 0.6)),
+                    "vegetation": float(rng.uniform(0.2, 0.8)),
+                    "regions": regions,
+                    "weak_areas": weak,
+                }
+                captures.append((base + n, session, info))
+                # Old take_pics sidecar (nothing writes these any more): only
+                # the folder-scan baseline below reads it
+                with open(os.path.join(folder, "detections.jsonl"), "a") as f:
+                    f.write(json.dumps({"image": rel, "time": base + n, **info}) + "\n")
+    archive.add_many(captures)
+    return start, len(captures)
+
+
+# Baseline: what answering the same question takes without an index
+def _scan_folders(root, zone, since, until, zones):
+    hits = []
+    for day in sorted(os.listdir(root)):
+        for session in SESSIONS:
+            sidecar = os.path.join(root, day, session, "detections.jsonl")
+            if not os.path.exists(sidecar):
+                continue
+            with open(sidecar) as f:
+                for line in f:
+                    record = json.loads(line)
+                    if not since <= record["time"] < until:
+                        continue
+                    for box in record["weak_areas"]:
+                        if zone_of(box, record["width"], zones) == zone:
+                            hits.append((record["path"], box))
+    return hits
+
+
+def _timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def benchmark(days=365):
+    workdir = tempfile.mkdtemp(prefix="image_archive_")
+    try:
+        archive = ImageArchive(workdir)
+        start = time.perf_counter()
+        first, count = synthetic_year(archive, days)
+        print(f"[BENCH] built {count} captures in {time.perf_counter() - start:.1f}s")
+
+        last = first + days * 86400
+        week = (last - 7 * 86400, last)
+        ms, rows = _timed(lambda: archive.detections("LEFT", *week))
+        print(
+            f"[BENCH] weak areas, zone LEFT, last week (index):  {ms:7.2f}ms ({len(rows)} rows)"
+        )
+        ms, rows = _timed(
+            lambda: _scan_folders(workdir, "LEFT", *week, archive.zones), 1
+        )
+        print(
+            f"[BENCH] weak areas, zone LEFT, last week (scan):   {ms:7.2f}ms ({len(rows)} rows)"
+        )
+        ms, rows = _timed(lambda: archive.captures(last - 86400, last, "morning"))
+        print(
+            f"[BENCH] one day's morning captures:                {ms:7.2f}ms ({len(rows)} rows)"
+        )
+        ms, rows = _timed(lambda: archive.daily(last - 30 * 86400, last))
+        print(
+            f"[BENCH] 30-day trend (day x session):              {ms:7.2f}ms ({len(rows)} rows)"
+        )
+
+        before = archive.stats()["bytes"]
+        start = time.perf_counter()
+        result = archive.compact(
+            keep_images_days=90, keep_index_days=365, max_bytes=before // 8, now=last
+        )
+        ms = (time.perf_counter() - start) * 1000
+        print(
+            f"[BENCH] compaction (90 days / {before // 8 >> 10} KB cap): {ms:7.1f}ms {result}"
+        )
+        print(f"[BENCH] after: {archive.stats()}")
+        archive.close()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Captured image archive")
+    parser.add_argument("--root", default="data/archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    weak = sub.add_parser("weak", help="weak-area detections")
+    weak.add_argument("--zone")
+    weak.add_argument("--days", type=float, default=7)
+    sub.add_parser("daily")
+    compact = sub.add_parser("compact")
+    compact.add_argument("--keep-images-days", type=float, default=30)
+    compact.add_argument("--keep-index-days", type=float, default=365)
+    compact.add_argument("--max-mb", type=float)
+    bench = sub.add_parser("bench", help="queries/compaction on a synthetic year")
+    bench.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        benchmark(args.days)
+    else:
+        archive = ImageArchive(args.root)
+        if args.command == "weak":
+            for row in archive.detections(args.zone, time.time() - args.days * 86400):
+                print(json.dumps(row))
+        elif args.command == "daily":
+            for row in archive.daily():
+                print(json.dumps(row))
+        else:
+            max_bytes = int(args.max_mb * 1e6) if args.max_mb else None
+            print(
+                f"[ARCHIVE] "
+                f"{archive.compact(args.keep_images_days, args.keep_index_days, max_bytes)}"
+            )
@@ -0,0 +1,521 @@
+import argparse
+import email.utils
+import http.client
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import cv2
+import numpy as np
+
+from image_archive import ImageArchive
+
+DETECTIONS_FILE = "detections.jsonl"
+THUMB_WIDTHS = (160, 320, 640)
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+#! ---------------------------- CACHEs ----------------------------
+
+
+# Size-bounded LRU (bytes, not entries: thumbnails vary a lot in size)
+class LRUBytes:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+# * Per-folder <session>/detections.jsonl sidecars, the format take_pics wrote
+# before the archive. Nothing writes them any more: this is the benchmark
+# baseline, and the fallback for a root without an archive. Re-parsed only
+# when a file changes.
+class DetectionIndex:
+    def __init__(self, root):
+        self.root = root
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def sessions(self):
+        try:
+            names = sorted(os.listdir(self.root))
+        except OSError:
+            return []
+        return [n for n in names if os.path.isdir(os.path.join(self.root, n))]
+
+    def _load(self, session):
+        path = os.path.join(self.root, session, DETECTIONS_FILE)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return (), None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(session)
+            if cached is not None and cached[0] == version:
+                return cached[1], version
+        records = []
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    image = quote(f"{session}/{record['image']}")
+                    record.update(
+                        session=session, url=f"/{image}", thumb=f"/thumb/{image}"
+                    )
+                    records.append(record)
+        with self._lock:
+            self._cache[session] = (version, records)
+        return records, version
+
+    # * (records, etag) over every session or ?session=<name>
+    def query(self, params, weak_only=True):
+        session = params.get("session")
+        records, versions = [], []
+        for name in self.sessions():
+            if session and name != session:
+                continue
+            items, version = self._load(name)
+            versions.append((name, version))
+            records.extend(r for r in items if r.get("weak_areas") or not weak_only)
+        etag = '"d%x"' % (hash(tuple(versions)) & 0xFFFFFFFFFFFF)
+        return records, etag
+
+
+# * Same API backed by the image_archive index:
+# ?zone=LEFT&days=7 (or since/until as ISO dates) &session=morning
+class ArchiveDetections:
+    def __init__(self, archive, root):
+        self.archive = archive
+        self.prefix = "/" + quote(os.path.relpath(archive.root, root))
+
+    def query(self, params, weak_only=True):
+        if "since" in params:
+            since = params["since"]
+        else:
+            # Whole days back from today's midnight: the window moves once a day
+            days = float(params.get("days", 7))
+            midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            since = (midnight - timedelta(days=days)).timestamp()
+        kinds = ("weak",) if weak_only else ("weak", "region")
+        rows = []
+        for kind in kinds:
+            rows += self.archive.detections(
+                params.get("zone"), since, params.get("until"), kind=kind
+            )
+        session = params.get("session")
+        records = []
+        for row in sorted(rows, key=lambda r: r["taken_at"]):
+            if session and row["session"] != session:
+                continue
+            if row["path"]:
+                image = quote(row["path"])
+                row.update(
+                    url=f"{self.prefix}/{image}", thumb=f"/thumb{self.prefix}/{image}"
+                )
+            records.append(row)
+        stats = self.archive.stats()
+        # The computed window is part of the tag: after midnight the same
+        # ?days=N selects other rows even though the data has not changed
+        etag = '"a%x-%x-%x-%s"' % (
+            stats["last_id"] or 0,
+            stats["captures"],
+            stats["images"],
+            hash((tuple(sorted(params.items())), since)) & 0xFFFFFFFF,
+        )
+        return records, etag
+
+
+#! ---------------------------- HANDLER ----------------------------
+
+
+def parse_range(header, size):
+    match = RANGE_RE.match(header.strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if first == "":
+        if last == "":
+            return None
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def file_etag(stat):
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+class ImageRequestHandler(SimpleHTTPRequestHandler):
+    # Keep-alive: browsers/apps fetch many images over one connection
+    protocol_version = "HTTP/1.1"
+    server_version = "SmartGarden"
+    # Headers and small bodies go out as separate writes; without this
+    # Nagle + delayed ACK caps keep-alive clients at ~25 req/s each
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path in ("/api/weak", "/api/detections"):
+            return self._detections(url, weak_only=url.path == "/api/weak")
+        if url.path.startswith("/thumb/"):
+            return self._thumbnail(url)
+        return super().do_GET()
+
+    #! ---------------------------- FILEs ----------------------------
+
+    # Files get ETag / Last-Modified / Range; directories keep http.server listings
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            return super().send_head()
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        stat = os.fstat(f.fileno())
+        etag = file_etag(stat)
+        if self._not_modified(etag, stat.st_mtime):
+            f.close()
+            return None
+
+        start, end, status = 0, stat.st_size - 1, HTTPStatus.OK
+        requested = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if requested and (if_range is None or if_range == etag):
+            parsed = parse_range(requested, stat.st_size)
+            if parsed is None:
+                f.close()
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{stat.st_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            start, end = parsed
+            status = HTTPStatus.PARTIAL_CONTENT
+
+        self.send_response(status)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self._validators(etag, stat.st_mtime)
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+        self.end_headers()
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "_remaining", None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            chunk = source.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+        self._remaining = None
+
+    # image_N.jpg is overwritten every session: clients must revalidate
+    def _validators(self, etag, mtime):
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", self.date_time_string(mtime))
+        self.send_header("Cache-Control", "no-cache")
+
+    def _not_modified(self, etag, mtime):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            fresh = etag in [t.strip() for t in if_none_match.split(",")]
+        else:
+            since = self.headers.get("If-Modified-Since")
+            try:
+                fresh = (
+                    since is not None
+                    and int(mtime)
+                    <= email.utils.parsedate_to_datetime(since).timestamp()
+                )
+            except (TypeError, ValueError, IndexError, OverflowError):
+                fresh = False
+        if fresh:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._validators(etag, mtime)
+            self.end_headers()
+        return fresh
+
+    #! ---------------------------- THUMBNAILs / API ----------------------------
+
+    def _thumbnail(self, url):
+        rel = unquote(url.path[len("/thumb/") :])
+        path = self.translate_path("/" + rel)
+        try:
+            width = int(parse_qs(url.query).get("w", ["320"])[0])
+        except ValueError:
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Invalid thumbnail width")
+        # A few fixed sizes keep the cache small and the hit rate high
+        width = min(THUMB_WIDTHS, key=lambda w: abs(w - width))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+        etag = '"t%d-%x-%x"' % (width, stat.st_mtime_ns, stat.st_size)
+        if self._not_modified(etag, stat.st_mtime):
+            return
+
+        key = (path, width, stat.st_mtime_ns, stat.st_size)
+        body = self.server.thumbnails.get(key)
+        if body is None:
+            body = make_thumbnail(path, width)
+            if body is None:
+                return self.send_error(
+                    HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Not an image"
+                )
+            self.server.thumbnails.put(key, body)
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self._validators(etag, stat.st_mtime)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _detections(self, url, weak_only):
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            records, etag = self.server.detections.query(params, weak_only)
+        except ValueError as e:
+            return self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = json.dumps({"count": len(records), "detections": records}).encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_thumbnail(path, width, quality=80):
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    if image.shape[1] > width:
+        height = max(1, round(image.shape[0] * width / image.shape[1]))
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+
+#! ---------------------------- SERVER ----------------------------
+
+
+class ImageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, root, host="0.0.0.0", port=8080, cache_bytes=32 << 20, archive=None
+    ):
+        self.root = os.path.abspath(root)
+        self.verbose = False
+        self.thumbnails = LRUBytes(cache_bytes)
+        if archive is not None:
+            self.detections = ArchiveDetections(archive, self.root)
+        else:
+            self.detections = DetectionIndex(self.root)
+        handler = partial(ImageRequestHandler, directory=self.root)
+        super().__init__((host, port), handler)
+        self._thread = None
+
+    # * Serve from a background thread (take_pics / supervisor)
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="image-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+#! ---------------------------- LOAD TEST ----------------------------
+
+
+def load_test(url, concurrency=8, duration=5.0, headers=None):
+    parts = urlsplit(url)
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    counts = {"requests": 0, "bytes": 0, "errors": 0}
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+        done = size = errors = 0
+        seen = {}
+        while time.perf_counter() < deadline:
+            try:
+                conn.request("GET", target, headers=headers or {})
+                response = conn.getresponse()
+                size += len(response.read())
+                seen[response.status] = seen.get(response.status, 0) + 1
+                done += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+        conn.close()
+        with lock:
+            counts["requests"] += done
+            counts["bytes"] += size
+            counts["errors"] += errors
+            for status, n in seen.items():
+                statuses[status] = statuses.get(status, 0) + n
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "req_per_s": counts["requests"] / elapsed,
+        "mb_per_s": counts["bytes"] / elapsed / 1e6,
+        "errors": counts["errors"],
+        "statuses": statuses,
+    }
+
+
+# Synthetic data dir + in-process server: full images, revalidation, thumbs, API
+def benchmark(concurrency=8, duration=3.0):
+    root = tempfile.mkdtemp(prefix="image_server_")
+    session = os.path.join(root, "today_morning")
+    os.makedirs(session)
+    rng = np.random.default_rng(0)
+    with open(os.path.join(session, DETECTIONS_FILE), "w") as f:
+        for i in range(1, 16):
+            frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+            cv2.imwrite(os.path.join(session, f"image_{i}.jpg"), frame)
+            record = {"image": f"image_{i}.jpg", "weak_areas": [[10, 10, 20, 20]]}
+            f.write(json.dumps(record) + "\n")
+
+    server = ImageServer(root, host="127.0.0.1", port=0).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    image = f"{base}/today_morning/image_1.jpg"
+    etag = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+    etag.request("GET", "/today_morning/image_1.jpg")
+    response = etag.getresponse()
+    response.read()
+    tag = response.getheader("ETag")
+    etag.close()
+
+    cases = [
+        ("full image", image, None),
+        ("revalidate (304)", image, {"If-None-Match": tag}),
+        ("range 64KB", image, {"Range": "bytes=0-65535"}),
+        ("thumbnail w=320", f"{base}/thumb/today_morning/image_1.jpg?w=320", None),
+        ("/api/weak", f"{base}/api/weak", None),
+    ]
+    try:
+        for label, url, headers in cases:
+            result = load_test(url, concurrency, duration, headers)
+            print(
+                f"[BENCH] {label:>17}: {result['req_per_s']:8.0f} req/s "
+                f"{result['mb_per_s']:7.1f} MB/s statuses={result['statuses']} "
+                f"errors={result['errors']}"
+            )
+        cache = server.thumbnails
+        print(f"[BENCH] thumbnail cache: {cache.hits} hits / {cache.misses} misses")
+    finally:
+        server.stop()
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Captured image / results server")
+    sub = parser.add_subparsers(dest="command")
+    serve = sub.add_parser("serve")
+    serve.add_argument("--root", default="data")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("-v", "--verbose", action="store_true")
+    load = sub.add_parser("loadtest", help="hammer one URL")
+    load.add_argument("url")
+    load.add_argument("-c", "--concurrency", type=int, default=8)
+    load.add_argument("-d", "--duration", type=float, default=10.0)
+    bench = sub.add_parser("bench", help="load test against synthetic data")
+    bench.add_argument("-c", "--concurrency", type=int, default=8)
+    bench.add_argument("-d", "--duration", type=float, default=3.0)
+    args = parser.parse_args()
+
+    if args.command == "loadtest":
+        print(f"[LOAD] {load_test(args.url, args.concurrency, args.duration)}")
+    elif args.command == "bench":
+        benchmark(args.concurrency, args.duration)
+    else:
+        root = getattr(args, "root", "data")
+        # take_pics keeps its index in <root>/archive
+        archive_dir = os.path.join(root, "archive")
+        archive = None
+        if os.path.exists(os.path.join(archive_dir, "index.sqlite")):
+            archive = ImageArchive(archive_dir)
+        server = ImageServer(root, port=getattr(args, "port", 8080), archive=archive)
+        server.verbose = getattr(args, "verbose", False)
+        print(f"[HTTP] Serving {server.root} on port {server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,198 @@
+import argparse
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import metrics
+from image_archive import ImageArchive
+from latency import LatencyStats
+
+# format -> (extension, OpenCV quality flag)
+FORMATS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def encode_params(fmt, quality):
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown image format {fmt!r} (use {', '.join(FORMATS)})")
+    ext, flag = FORMATS[fmt]
+    return ext, [flag, int(quality)]
+
+
+# Process-wide counterparts of ImageWriter.timings / counts for /metrics
+STAGE_SECONDS = {
+    stage: metrics.histogram(
+        "garden_writer_stage_seconds", "Image writer stage duration", stage=stage
+    )
+    for stage in ("queue_wait", "encode", "write")
+}
+WRITES = {
+    result: metrics.counter(
+        "garden_writer_images_total", "Images stored", result=result
+    )
+    for result in ("written", "failed")
+}
+
+#! ---------------------------- WRITER ----------------------------
+
+
+# * Encodes and stores frames on background threads (cv2.imencode and file
+# writes release the GIL). The bounded queue applies back-pressure instead of
+# buffering a slow SD card's worth of frames in RAM.
+class ImageWriter:
+    def __init__(self, archive, workers=2, queue_size=8, fmt="jpg", quality=90):
+        self.archive = archive
+        self.ext, self.params = encode_params(fmt, quality)
+        self.queue = queue.Queue(queue_size)
+        self.timings = {
+            "queue_wait": LatencyStats(),
+            "encode": LatencyStats(),
+            "write": LatencyStats(),
+        }
+        self.written = 0
+        self.failed = 0
+        self.bytes = 0
+        self._threads = [
+            threading.Thread(target=self._run, name=f"image-writer-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # * Queue a frame for the archive. The writer keeps the array: pass a frame
+    # the caller will not reuse (e.g. the highlighted copy).
+    def submit(self, frame, session, **meta):
+        start = time.perf_counter()
+        self.queue.put((frame, session, time.time(), meta))
+        self._observe("queue_wait", time.perf_counter() - start)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            frame, session, taken_at, meta = item
+            try:
+                start = time.perf_counter()
+                ok, encoded = cv2.imencode(self.ext, frame, self.params)
+                if not ok:
+                    raise RuntimeError(f"could not encode {self.ext}")
+                encoded = encoded.tobytes()
+                written = time.perf_counter()
+                self._observe("encode", written - start)
+                self.archive.add(
+                    encoded, session, taken_at=taken_at, ext=self.ext, **meta
+                )
+                self._observe("write", time.perf_counter() - written)
+                self.written += 1
+                self.bytes += len(encoded)
+                WRITES["written"].inc()
+            except Exception as e:
+                self.failed += 1
+                WRITES["failed"].inc()
+                print(f"[WRITER] {session}: {type(e).__name__}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _observe(self, stage, seconds):
+        self.timings[stage].add(seconds)
+        STAGE_SECONDS[stage].observe(seconds)
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            **{name: stats.summary() for name, stats in self.timings.items()},
+        }
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+def _frames(count, size=(720, 1280)):
+    rng = np.random.default_rng(0)
+    base = cv2.GaussianBlur(rng.integers(0, 255, (*size, 3), np.uint8), (0, 0), 3)
+    return [np.roll(base, i * 7, axis=1) for i in range(count)]
+
+
+# Simulates an SD card stalling for `delay` seconds on every file
+class _StallingArchive:
+    def __init__(self, archive, delay):
+        self.archive = archive
+        self.delay = delay
+
+    def add(self, *args, **kwargs):
+        time.sleep(self.delay)
+        return self.archive.add(*args, **kwargs)
+
+
+# Capture loop stand-in: `analysis` seconds of work per frame, then store it
+def _session(archive, frames, mode, fmt, quality, analysis, write_delay):
+    archive = _StallingArchive(archive, write_delay)
+    writer = None
+    if mode == "async":
+        writer = ImageWriter(archive, fmt=fmt, quality=quality)
+    ext, params = encode_params(fmt, quality)
+
+    blocked = LatencyStats()
+    start = time.perf_counter()
+    for frame in frames:
+        time.sleep(analysis)
+        t0 = time.perf_counter()
+        if writer is not None:
+            writer.submit(frame, "bench")
+        else:
+            data = cv2.imencode(ext, frame, params)[1].tobytes()
+            archive.add(data, "bench", ext=ext)
+        blocked.add(time.perf_counter() - t0)
+    loop = time.perf_counter() - start
+    if writer is not None:
+        writer.close()
+    return loop, time.perf_counter() - start, blocked
+
+
+def benchmark(count=30, analysis=0.05, write_delay=0.08):
+    frames = _frames(count)
+    for fmt, quality in (("jpg", 90), ("webp", 80)):
+        for mode in ("sync", "async"):
+            workdir = tempfile.mkdtemp(prefix="image_writer_")
+            archive = ImageArchive(workdir)
+            loop, total, blocked = _session(
+                archive, frames, mode, fmt, quality, analysis, write_delay
+            )
+            size = archive.stats()["bytes"] / count / 1024
+            archive.close()
+            shutil.rmtree(workdir)
+            print(
+                f"[BENCH] {fmt:>4} q{quality} {mode:>5}: capture loop {loop:5.2f}s "
+                f"(all stored {total:5.2f}s), loop blocked {blocked.summary()}, "
+                f"{size:.0f} KB/image"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background image writer benchmark")
+    parser.add_argument("-n", "--frames", type=int, default=30)
+    parser.add_argument("--analysis-ms", type=float, default=50)
+    parser.add_argument("--write-delay-ms", type=float, default=80)
+    args = parser.parse_args()
+    benchmark(args.frames, args.analysis_ms / 1000, args.write_delay_ms / 1000)
@@ -0,0 +1,34 @@
+import threading
+from collections import deque
+
+#! ---------------------------- LATENCY ----------------------------
+
+
+class LatencyStats:
+    def __init__(self, size=4096):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    # * Nearest-rank percentiles in milliseconds over the recent samples
+    def percentiles(self, points=(50, 95, 99)):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {p: None for p in points}
+        result = {}
+        for p in points:
+            rank = max(0, min(len(samples) - 1, int(round(p / 100 * len(samples))) - 1))
+            result[p] = samples[rank] * 1000
+        return result
+
+    def summary(self):
+        pct = self.percentiles()
+        if pct[50] is None:
+            return "no samples"
+        return " ".join(f"p{p}={v:.2f}ms" for p, v in pct.items()) + f" n={self.count}"
@@ -0,0 +1,40 @@
+import logging
+import time
+
+#! ---------------------------- RATE LIMITED LOGGING ----------------------------
+
+
+# Lets the first `burst` records of a message through per `interval` seconds and
+# reports how many were suppressed once the window rolls over.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval=10.0, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        start, count, suppressed = self._windows.get(key, (now, 0, 0))
+
+        if now - start >= self.interval:
+            if suppressed:
+                record.msg = f"{record.msg} (+{suppressed} similar suppressed)"
+            start, count, suppressed = now, 0, 0
+
+        if count >= self.burst:
+            self._windows[key] = (start, count, suppressed + 1)
+            return False
+        self._windows[key] = (start, count + 1, suppressed)
+        return True
+
+
+# * Root logging config for the services, e.g. LOG_LEVEL=DEBUG shows every [SAVE]
+def setup_logging(level="INFO", interval=10.0, burst=5):
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    handler.addFilter(RateLimitFilter(interval, burst))
+    logging.basicConfig(level=level.upper(), handlers=[handler])
@@ -1,9 +1,18 @@
+import asyncio
 import os
-import time
+import threading
+from functools import partial
 
 from dotenv import load_dotenv
 
+import actuator_state
+import metrics
+from async_controller import AsyncMQTTController
+from control_engine import ControlEngine
+from logging_utils import setup_logging
 from mqtt_controller import MQTTController
+from telemetry import TelemetrySink
+from zone_rules import default_zones, load_zones
 
 # Load .env file
 load_dotenv(".env")
@@ -30,33 +39,172 @@ TIMER_LIGHTS_OFF_PATH = os.getenv("TIMER_LIGHTS_OFF_PATH")
 TIMER_FANS_ON_PATH = os.getenv("TIMER_FANS_ON_PATH")
 TIMER_FANS_OFF_PATH = os.getenv("TIMER_FANS_OFF_PATH")
 
+# Optional JSON zone table (defaults to the LEFT/RIGHT beds above)
+ZONES_CONFIG = os.getenv("ZONES_CONFIG")
+
+# Sensor history, flushed to Firebase in batches (SQLite spool while offline)
+TELEMETRY_PATH = os.getenv("TELEMETRY_PATH", "/telemetry")
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "200"))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "5"))
+TELEMETRY_CAPACITY = int(os.getenv("TELEMETRY_CAPACITY", "10000"))
+TELEMETRY_SPOOL = os.getenv("TELEMETRY_SPOOL", "data/telemetry.sqlite")
+
+# Fallback polling interval when the Firebase listener can't be opened
+TIMER_POLL_INTERVAL = float(os.getenv("TIMER_POLL_INTERVAL", "30"))
+
+# Local copy of the Firebase config: start from it, sync deltas in the background
+SCHEDULE_SNAPSHOT = os.getenv("SCHEDULE_SNAPSHOT", ".config/schedule.json")
+# Extra Firebase config paths cached with the TIMERs (e.g. thresholds)
+CONFIG_PATHS = [p for p in os.getenv("CONFIG_PATHS", "").split(",") if p]
+STATS_INTERVAL = 60
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# 1 = asyncio controller (reconnect with backoff, queued publishes)
+MQTT_ASYNC = os.getenv("MQTT_ASYNC", "0") == "1"
+
 
 #! ----------------------------------- Main -----------------------------------
 
+TIMER_PATHS = [
+    TIMER_PUMP_ON_PATH,
+    TIMER_PUMP_OFF_PATH,
+    TIMER_LIGHTS_ON_PATH,
+    TIMER_LIGHTS_OFF_PATH,
+    TIMER_FANS_ON_PATH,
+    TIMER_FANS_OFF_PATH,
+]
+FIREBASE_PATHS = TIMER_PATHS + [p for p in CONFIG_PATHS if p not in TIMER_PATHS]
+
+
+# * Rules, telemetry and subscriptions shared by the sync and asyncio modes
+def setup_controller(controller):
+    if ZONES_CONFIG:
+        controller.load_rules(load_zones(ZONES_CONFIG))
+    else:
+        controller.load_rules(default_zones(TOPIC_PUMP_LEFT, TOPIC_PUMP_RIGHT))
+    controller.telemetry = TelemetrySink(
+        TELEMETRY_PATH,
+        batch_size=TELEMETRY_BATCH_SIZE,
+        flush_interval=TELEMETRY_FLUSH_INTERVAL,
+        capacity=TELEMETRY_CAPACITY,
+        spool_path=TELEMETRY_SPOOL,
+    ).start()
+    controller.subscribe_to_topics(
+        TOPICS_SENSOR
+        + [t for t in controller.rules.sensors() if t not in TOPICS_SENSOR]
+    )
+
+
+# * last_executed key -> actuator topic for every pump, the lights and the fans
+def actuator_topics(controller):
+    topics = {f"pump_{zone.name}": zone.pump for zone in controller.rules.zones}
+    topics.update(lights=TOPIC_LIGHTS, fans=TOPIC_FANS)
+    return topics
+
+
+# * Sensor msgs are evaluated as they arrive, TIMERs fire from a deadline heap
+def build_engine(controller):
+    return ControlEngine(
+        controller,
+        TOPIC_PUMP_LEFT,
+        TOPIC_PUMP_RIGHT,
+        TOPIC_LIGHTS,
+        TOPIC_FANS,
+        TIMER_PATHS,
+        stats_interval=STATS_INTERVAL,
+    ).attach()
+
+
+# Engine of the running main(), for the supervisor's stats
+engine = None
+# Set by stop(): main() returns through its finally block (flush + close)
+_stopping = threading.Event()
+
+
+# * Ask a running main() to return (supervisor stop hook)
+def stop():
+    _stopping.set()
+    if engine is not None:
+        engine.stop()
+
+
+def main(client=None):
+    global engine
 
-def main():
     controller = MQTTController(
+        MQTT_HOST, MQTT_POST, KEEP_ALIVE, FIREBASE_KEY_PATH, DB_URL, client=client
+    )
+    setup_controller(controller)
+    actuators = controller.use_actuators(
+        actuator_state.shared(controller.client),
+        actuator_topics(controller),
+        actuator_state.ACTUATOR_STATUS_SUFFIX,
+    )
+    controller.start_schedule(
+        FIREBASE_PATHS,
+        poll_interval=TIMER_POLL_INTERVAL,
+        snapshot_path=SCHEDULE_SNAPSHOT,
+    )
+    engine = build_engine(controller)
+    # stop() may have run before the engine existed
+    if _stopping.is_set():
+        engine.stop()
+    metrics.start(controller.client)
+
+    # A shared client already runs its network loop
+    if client is None:
+        controller.client.loop_start()
+    print("[READY] mqtt")
+    try:
+        engine.run_forever()
+    finally:
+        # Held-back commands go out while the network loop still runs
+        actuators.stop()
+        if client is None:
+            controller.client.loop_stop()
+        if controller.schedule is not None:
+            controller.schedule.stop()
+        controller.telemetry.stop()
+
+
+# * asyncio mode: MQTT I/O on the event loop, Firebase + TIMERs off it
+async def main_async():
+    controller = AsyncMQTTController(
         MQTT_HOST, MQTT_POST, KEEP_ALIVE, FIREBASE_KEY_PATH, DB_URL
     )
-    controller.subscribe_to_topics(TOPICS_SENSOR)
-
-    while True:
-        controller.client.loop()  # Process MQTT messages
-        controller.control_pumps(TOPIC_PUMP_LEFT, TOPIC_PUMP_RIGHT)  # Control pumps
-        controller.check_timer_and_publish(
-            TOPIC_PUMP_LEFT,
-            TOPIC_PUMP_RIGHT,
-            TOPIC_LIGHTS,
-            TOPIC_FANS,
-            TIMER_PUMP_ON_PATH,
-            TIMER_PUMP_OFF_PATH,
-            TIMER_LIGHTS_ON_PATH,
-            TIMER_LIGHTS_OFF_PATH,
-            TIMER_FANS_ON_PATH,
-            TIMER_FANS_OFF_PATH,
+    setup_controller(controller)
+    actuators = controller.use_actuators(
+        actuator_state.shared(controller.client),
+        actuator_topics(controller),
+        actuator_state.ACTUATOR_STATUS_SUFFIX,
+    )
+    mqtt_task = asyncio.create_task(controller.run())
+    await controller.run_blocking(
+        partial(
+            controller.start_schedule,
+            FIREBASE_PATHS,
+            TIMER_POLL_INTERVAL,
+            snapshot_path=SCHEDULE_SNAPSHOT,
         )
-        time.sleep(1)
+    )
+    engine = build_engine(controller)
+    metrics.start()
+    # Scheduled now: the TIMER deadlines fire while the MQTT task runs
+    engine_task = asyncio.ensure_future(controller.run_blocking(engine.run_forever))
+    try:
+        await mqtt_task
+    finally:
+        engine.stop()
+        await engine_task
+        # Held-back commands are queued onto the loop ahead of this await's wakeup
+        await controller.run_blocking(actuators.stop)
+        controller.telemetry.stop()
 
 
 if __name__ == "__main__":
-    main()
+    setup_logging(LOG_LEVEL)
+    if MQTT_ASYNC:
+        asyncio.run(main_async())
+    else:
+        main()
@@ -0,0 +1,720 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as Tally
+from functools import wraps
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Prometheus text endpoint (unset = off). Run as separate processes, each
+# service needs its own port; under the supervisor one port serves all three.
+METRICS_PORT = os.getenv("METRICS_PORT")
+# JSON snapshot published every METRICS_INTERVAL seconds (unset = off)
+METRICS_TOPIC = os.getenv("METRICS_TOPIC")
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "60"))
+# Continuous sampling profiler (otherwise on demand: GET /profile?seconds=N)
+PROFILE = os.getenv("PROFILE", "0") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+
+# Seconds: a 10µs timer check up to a multi-minute capture session
+DEFAULT_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+
+#! ---------------------------- METRICs ----------------------------
+
+
+def _format_labels(labels, quote=True):
+    if not labels:
+        return ""
+    if quote:
+        escaped = (
+            (k, str(v).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+            for k, v in labels
+        )
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+    return "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, fn=None):
+        self.value = 0
+        # Read at scrape time instead of counting on the hot path
+        self.fn = fn
+        self._lock = threading.Lock()
+
+    # acquire/release: about half the cost of a with-block
+    def inc(self, amount=1):
+        lock = self._lock
+        lock.acquire()
+        try:
+            self.value += amount
+        finally:
+            lock.release()
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+    def samples(self, name, labels):
+        yield name, labels, self.get()
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # Last slot: above the largest bucket (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        lock = self._lock
+        lock.acquire()
+        try:
+            self.counts[index] += 1
+            self.sum += value
+        finally:
+            lock.release()
+
+    # * with histogram.time(): ... (observes the block's duration in seconds)
+    def time(self):
+        return _Timer(self)
+
+    def _state(self):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        return counts, total, sum(counts)
+
+    # * Quantile estimated from the buckets (linear inside the matching bucket)
+    def quantile(self, q):
+        counts, _, count = self._state()
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def samples(self, name, labels):
+        counts, total, count = self._state()
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            yield f"{name}_bucket", labels + (("le", _format_value(bound)),), cumulative
+        yield f"{name}_sum", labels, total
+        yield f"{name}_count", labels, count
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+# Stand-in handed out while disabled (METRICS=0): same API, no work
+class _NullMetric:
+    kind = "null"
+    value = 0
+    fn = None
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def get(self):
+        return 0
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return _NULL_TIMER
+
+    def samples(self, name, labels):
+        return ()
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL = _NullMetric()
+_NULL_TIMER = _NullTimer()
+
+
+#! ---------------------------- REGISTRY ----------------------------
+
+
+class Registry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # name -> [kind, help, {label tuple: metric}]
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, *args):
+        if not self.enabled:
+            return NULL
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, [cls.kind, help, {}])
+            if family[0] != cls.kind:
+                raise ValueError(f"metric {name} is a {family[0]}, not a {cls.kind}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = cls(*args)
+            return metric
+
+    # * Monotonic count. fn: read the value at scrape time (e.g. an existing
+    # attribute), re-registering replaces it (restarted worker, new object)
+    def counter(self, name, help="", fn=None, **labels):
+        metric = self._get(Counter, name, help, labels)
+        if fn is not None and metric is not NULL:
+            metric.fn = fn
+        return metric
+
+    def gauge(self, name, help="", fn=None, **labels):
+        metric = self._get(Gauge, name, help, labels)
+        if fn is not None and metric is not NULL:
+            metric.fn = fn
+        return metric
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def _collect(self):
+        with self._lock:
+            families = [
+                (name, kind, help, list(metrics.items()))
+                for name, (kind, help, metrics) in sorted(self._families.items())
+            ]
+        return families
+
+    # * Prometheus text exposition format (version 0.0.4)
+    def render(self):
+        lines = []
+        for name, kind, help, metrics in self._collect():
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                try:
+                    samples = list(metric.samples(name, labels))
+                except Exception as e:
+                    lines.append(f"# {name}{_format_labels(labels)} failed: {e}")
+                    continue
+                for sample, sample_labels, value in samples:
+                    lines.append(
+                        f"{sample}{_format_labels(sample_labels)} "
+                        f"{_format_value(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    # * Compact JSON-able view: counters/gauges as values, histograms as
+    # count/sum plus p50/p95/p99 in milliseconds
+    def snapshot(self):
+        result = {}
+        for name, kind, _, metrics in self._collect():
+            for labels, metric in metrics:
+                key = name + _format_labels(labels, quote=False)
+                try:
+                    if kind != "histogram":
+                        result[key] = metric.get()
+                        continue
+                    _, total, count = metric._state()
+                    entry = {"count": count, "sum": round(total, 6)}
+                    for q in (0.5, 0.95, 0.99):
+                        value = metric.quantile(q)
+                        if value is not None:
+                            entry[f"p{int(q * 100)}_ms"] = round(value * 1000, 3)
+                    result[key] = entry
+                except Exception as e:
+                    result[key] = f"error: {e}"
+        return result
+
+
+REGISTRY = Registry(enabled=os.getenv("METRICS", "1") == "1")
+
+
+def counter(name, help="", fn=None, **labels):
+    return REGISTRY.counter(name, help, fn, **labels)
+
+
+def gauge(name, help="", fn=None, **labels):
+    return REGISTRY.gauge(name, help, fn, **labels)
+
+
+def histogram(name, help="", buckets=DEFAULT_BUCKETS, **labels):
+    return REGISTRY.histogram(name, help, buckets, **labels)
+
+
+# * Decorator: call duration into a histogram (the bare function stays
+# reachable as .__wrapped__)
+def timed(name, help="", buckets=DEFAULT_BUCKETS, **labels):
+    metric = histogram(name, help, buckets, **labels)
+
+    def decorate(func):
+        if metric is NULL:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
+
+
+#! ---------------------------- PROFILER ----------------------------
+
+
+# * Wall-clock sampling profiler: every `interval` seconds it walks every
+# thread's stack (sys._current_frames), nothing is traced between samples.
+# Output is the "folded" format flamegraph.pl / speedscope read.
+class SamplingProfiler:
+    def __init__(self, interval=0.01, depth=48):
+        self.interval = interval
+        self.depth = depth
+        self.stacks = Tally()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self
+
+    def _run(self):
+        me = threading.get_ident()
+        started = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                sampled.append(";".join(reversed(stack)))
+            with self._lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+                self.elapsed = time.perf_counter() - started
+
+    def folded(self):
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    # * Leaf functions with the most samples ("thread;...;file:func" -> leaf)
+    def top(self, limit=10):
+        leaves = Tally()
+        with self._lock:
+            for stack, count in self.stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            samples = self.samples
+        return [
+            (leaf, count / max(1, samples)) for leaf, count in leaves.most_common(limit)
+        ]
+
+
+#! ---------------------------- EXPORTERs ----------------------------
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        registry = self.server.registry
+        if parts.path == "/metrics":
+            self._send(registry.render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif parts.path == "/metrics.json":
+            self._send(json.dumps(registry.snapshot()), "application/json")
+        elif parts.path == "/profile":
+            self._send(self._profile(parse_qs(parts.query)), "text/plain")
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND)
+
+    # Continuous profiler's totals, or a fresh N-second capture
+    def _profile(self, params):
+        profiler = self.server.profiler
+        if profiler is None or "seconds" in params:
+            seconds = min(60.0, float(params.get("seconds", ["5"])[0]))
+            interval = float(params.get("interval", [str(PROFILE_INTERVAL)])[0])
+            profiler = SamplingProfiler(interval).start()
+            time.sleep(seconds)
+            profiler.stop()
+        return profiler.folded()
+
+    def _send(self, text, content_type):
+        body = text.encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, registry=REGISTRY, host="0.0.0.0", port=9108, profiler=None):
+        self.registry = registry
+        self.profiler = profiler
+        super().__init__((host, port), MetricsRequestHandler)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# * Publishes registry.snapshot() as JSON to an MQTT topic every `interval` s
+class MQTTReporter:
+    def __init__(self, client, topic, interval=60.0, registry=REGISTRY):
+        self.client = client
+        self.topic = topic
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-mqtt", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def publish(self):
+        payload = {"ts": round(time.time(), 3), **self.registry.snapshot()}
+        self.client.publish(self.topic, json.dumps(payload, separators=(",", ":")))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                print(f"[METRICS] publish failed: {type(e).__name__}: {e}")
+
+
+# Exporters of this process (every service main() calls start(), first one wins)
+_exporters = {}
+_exporters_lock = threading.Lock()
+_started_at = time.time()
+
+
+# * Start whatever the env enables: /metrics server, MQTT stats topic,
+# continuous profiler. Idempotent: shared by the services of one process.
+def start(client=None):
+    with _exporters_lock:
+        if "process" not in _exporters:
+            gauge("garden_uptime_seconds", "Process uptime", fn=_uptime)
+            counter(
+                "garden_process_cpu_seconds_total",
+                "Process CPU time",
+                fn=time.process_time,
+            )
+            gauge("garden_threads", "Live threads", fn=threading.active_count)
+            _exporters["process"] = True
+        if PROFILE and "profiler" not in _exporters:
+            _exporters["profiler"] = SamplingProfiler(PROFILE_INTERVAL).start()
+            print(f"[METRICS] sampling profiler every {PROFILE_INTERVAL * 1000:g}ms")
+        if METRICS_PORT and "server" not in _exporters:
+            try:
+                _exporters["server"] = MetricsServer(
+                    port=int(METRICS_PORT), profiler=_exporters.get("profiler")
+                ).start()
+                print(f"[METRICS] serving /metrics on port {METRICS_PORT}")
+            except OSError as e:
+                print(f"[METRICS] port {METRICS_PORT}: {e}")
+                _exporters["server"] = None
+        if METRICS_TOPIC and client is not None and "mqtt" not in _exporters:
+            _exporters["mqtt"] = MQTTReporter(
+                client, METRICS_TOPIC, METRICS_INTERVAL
+            ).start()
+            print(
+                f"[METRICS] publishing to {METRICS_TOPIC} every {METRICS_INTERVAL:g}s"
+            )
+    return _exporters
+
+
+def _uptime():
+    return time.time() - _started_at
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+def _per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def _best_of(func, rounds, repeat):
+    return min(_per_call(func, repeat) for _ in range(rounds))
+
+
+# Interleaved rounds, best of each: background noise hits both sides alike
+def _compare(instrumented, bare, rounds, repeat):
+    with_metrics = []
+    without = []
+    for _ in range(rounds):
+        with_metrics.append(_per_call(instrumented, repeat))
+        without.append(_per_call(bare, repeat))
+    return min(with_metrics), min(without)
+
+
+def _report(name, instrumented, bare):
+    overhead = (instrumented - bare) / bare
+    print(
+        f"[BENCH] {name}: {bare * 1000:8.2f}ms bare, "
+        f"{instrumented * 1000:8.2f}ms instrumented, overhead {overhead * 100:+.2f}%"
+    )
+    return overhead
+
+
+# * Per-operation cost, then each instrumented hot path against its bare self
+def benchmark(rounds=9):
+    registry = Registry()
+    c = registry.counter("bench_total")
+    h = registry.histogram("bench_seconds")
+    t = registry.histogram("bench_timer_seconds")
+
+    def timer_block():
+        with t.time():
+            pass
+
+    def noop():
+        pass
+
+    decorated = timed("garden_bench_seconds")(noop)
+    base = _best_of(noop, rounds, 200000)
+    for name, func in (
+        ("counter.inc()", c.inc),
+        ("histogram.observe()", lambda: h.observe(0.0042)),
+        ("with histogram.time()", timer_block),
+        ("@timed wrapper", decorated),
+    ):
+        cost = _best_of(func, rounds, 200000) - base
+        print(f"[BENCH] {name:<22} {cost * 1e9:6.0f}ns per call")
+
+    overheads = {}
+
+    # NDVI: process_frame() + analyze_frame(), 7 stage histograms per frame
+    import ndvi_processor
+    from ndvi_processor import NDVIProcessor, synthetic_frame
+
+    processor = NDVIProcessor()
+    frame = synthetic_frame(640, 480)
+    stage_metrics = ndvi_processor.STAGE_SECONDS
+
+    def ndvi_frame():
+        processor.analyze_frame(processor.process_frame(frame))
+
+    def ndvi_bare():
+        ndvi_processor.STAGE_SECONDS = dict.fromkeys(stage_metrics, NULL)
+        try:
+            ndvi_frame()
+        finally:
+            ndvi_processor.STAGE_SECONDS = stage_metrics
+
+    overheads["ndvi"] = _report(
+        "ndvi 640x480 frame", *_compare(ndvi_frame, ndvi_bare, rounds, 20)
+    )
+
+    # Controller: a simulated day replayed as fast as possible
+    import control_engine
+    import sim_harness
+    from mqtt_controller import MQTTController
+
+    trace = sim_harness.synthetic_day(interval=30.0)
+    check = MQTTController.check_timer_and_publish
+    decision = control_engine.DECISION_SECONDS
+
+    def bare(mode):
+        def run():
+            MQTTController.check_timer_and_publish = check.__wrapped__
+            control_engine.DECISION_SECONDS = NULL
+            try:
+                sim_harness.replay(trace, mode)
+            finally:
+                MQTTController.check_timer_and_publish = check
+                control_engine.DECISION_SECONDS = decision
+
+        return run
+
+    overheads["engine"] = _report(
+        "controller day, engine",
+        *_compare(
+            lambda: sim_harness.replay(trace, "engine"), bare("engine"), rounds, 1
+        ),
+    )
+    # The poll replay squeezes 86400 one-per-second TIMER checks into ~1s, so
+    # the relevant figure is the extra time per check at the real 1/s rate
+    a, b = _compare(lambda: sim_harness.replay(trace, "poll"), bare("poll"), rounds, 1)
+    _report("controller day, poll (86400 checks)", a, b)
+    checks = trace["end"] - trace["start"]
+    per_check = max(0.0, a - b) / checks
+    overheads["poll"] = per_check
+    print(
+        f"[BENCH]   +{per_check * 1e6:.2f}µs per check_timer_and_publish(), "
+        f"{per_check * 100:.5f}% of a CPU at one check per second"
+    )
+
+    # Sampling profiler running vs not, same NDVI frames
+    def profiled():
+        profiler = SamplingProfiler(PROFILE_INTERVAL).start()
+        for _ in range(20):
+            ndvi_frame()
+        profiler.stop()
+
+    def unprofiled():
+        for _ in range(20):
+            ndvi_frame()
+
+    a, b = _compare(profiled, unprofiled, rounds, 1)
+    overheads["profiler"] = _report(
+        f"20 ndvi frames, profiler @{PROFILE_INTERVAL * 1000:g}ms", a, b
+    )
+    profiler = SamplingProfiler(PROFILE_INTERVAL).start()
+    unprofiled()
+    profiler.stop()
+    top = ", ".join(f"{leaf} {share:.0%}" for leaf, share in profiler.top(3))
+    print(f"[BENCH]   {profiler.samples} samples, hottest: {top}")
+
+    worst = max(overheads, key=overheads.get)
+    print(
+        f"[BENCH] worst overhead: {worst} {overheads[worst] * 100:+.2f}% "
+        f"(target < 1%)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Metrics registry / exporters")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="instrumentation overhead")
+    bench.add_argument("--rounds", type=int, default=9)
+    serve = sub.add_parser("serve", help="demo /metrics endpoint")
+    serve.add_argument("--port", type=int, default=9108)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        benchmark(args.rounds)
+    else:
+        server = MetricsServer(port=args.port).start()
+        start()
+        print(f"[METRICS] http://localhost:{args.port}/metrics (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.stop()
@@ -0,0 +1,198 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+IDLE = "idle"
+AWAKE = "awake"
+
+#! ---------------------------- GATE ----------------------------
+
+
+class MotionGate:
+    def __init__(
+        self,
+        size=(80, 60),
+        pixel_threshold=25,
+        wake_fraction=0.01,
+        sleep_fraction=0.003,
+        wake_frames=2,
+        sleep_after=5.0,
+        idle_alpha=0.05,
+        awake_alpha=0.005,
+        clock=time.monotonic,
+    ):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        # Hysteresis: more change is needed to wake up than to stay awake
+        self.wake_fraction = wake_fraction
+        self.sleep_fraction = sleep_fraction
+        self.wake_frames = wake_frames
+        self.sleep_after = sleep_after
+        # The background adapts fast while idle (light changes) and slowly while
+        # awake, so someone standing still at the door does not fade out
+        self.idle_alpha = idle_alpha
+        self.awake_alpha = awake_alpha
+        self.clock = clock
+
+        self.state = IDLE
+        self.motion = 0.0
+        self.background = None
+        self._gray = None
+        self._diff = None
+        self._streak = 0
+        self._last_motion = None
+        self._last_update = None
+
+        self.seconds = {IDLE: 0.0, AWAKE: 0.0}
+        self.frames = {IDLE: 0, AWAKE: 0}
+        self.wakeups = 0
+
+    # * Feed one frame; True while the expensive pipeline should run
+    def update(self, frame, now=None):
+        now = self.clock() if now is None else now
+        self._account(now)
+        self.motion = self._measure(frame)
+
+        if self.state == IDLE:
+            self._streak = self._streak + 1 if self.motion >= self.wake_fraction else 0
+            if self._streak >= self.wake_frames:
+                self.state = AWAKE
+                self.wakeups += 1
+                self._last_motion = now
+        elif self.motion >= self.sleep_fraction:
+            self._last_motion = now
+        elif now - self._last_motion >= self.sleep_after:
+            self.state = IDLE
+            self._streak = 0
+
+        self.frames[self.state] += 1
+        return self.state == AWAKE
+
+    # Fraction of pixels (tiny blurred gray frame) that differ from the background
+    def _measure(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        self._gray = cv2.GaussianBlur(small, (5, 5), 0, dst=self._gray)
+
+        if self.background is None:
+            self.background = self._gray.astype(np.float32)
+            return 0.0
+
+        self._diff = cv2.absdiff(
+            self._gray, cv2.convertScaleAbs(self.background), dst=self._diff
+        )
+        _, mask = cv2.threshold(
+            self._diff, self.pixel_threshold, 255, cv2.THRESH_BINARY
+        )
+        alpha = self.awake_alpha if self.state == AWAKE else self.idle_alpha
+        cv2.accumulateWeighted(self._gray, self.background, alpha)
+        return cv2.countNonZero(mask) / float(mask.size)
+
+    def _account(self, now):
+        if self._last_update is not None:
+            self.seconds[self.state] += now - self._last_update
+        self._last_update = now
+
+    def stats(self):
+        total = sum(self.seconds.values()) or 1.0
+        return {
+            "state": self.state,
+            "wakeups": self.wakeups,
+            "idle_s": round(self.seconds[IDLE], 1),
+            "awake_s": round(self.seconds[AWAKE], 1),
+            "awake_pct": round(100 * self.seconds[AWAKE] / total, 1),
+            "frames": dict(self.frames),
+        }
+
+
+#! ---------------------------- REPLAY BENCHMARK ----------------------------
+
+
+# Empty doorway with sensor noise; someone walks in for `visit` frames
+def synthetic_clip(frames=900, visit=(300, 420), width=320, height=240, seed=0):
+    rng = np.random.default_rng(seed)
+    scene = rng.integers(60, 200, (height, width, 3), dtype=np.uint8)
+    for i in range(frames):
+        frame = cv2.add(scene, rng.integers(0, 6, scene.shape, dtype=np.uint8))
+        if visit[0] <= i < visit[1]:
+            x = int(40 + (i - visit[0]) * 1.5) % (width - 80)
+            cv2.rectangle(frame, (x, 60), (x + 80, 200), (30, 40, 50), cv2.FILLED)
+        yield frame
+
+
+# The door's detector when installed, otherwise a gradient-pyramid stand-in of
+# similar per-frame cost (what HOG spends its time on)
+def _workload():
+    try:
+        import face_recognition
+
+        return lambda frame: face_recognition.face_locations(frame[:, :, ::-1])
+    except ImportError:
+        pass
+
+    def gradients(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(np.float32)
+        for _ in range(4):
+            gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0)
+            gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1)
+            magnitude, angle = cv2.cartToPolar(gx, gy, angleInDegrees=True)
+            np.bincount(
+                (angle // 20).astype(np.int32).ravel() % 9,
+                magnitude.ravel(),
+                minlength=9,
+            )
+            gray = cv2.pyrDown(gray)
+
+    return gradients
+
+
+def replay(frames, fps=30.0, gated=True, **gate_args):
+    workload = _workload()
+    gate = MotionGate(**gate_args)
+    processed = 0
+    cpu = time.process_time()
+    for i, frame in enumerate(frames):
+        # Clip time, so the hysteresis behaves as if played back live
+        if not gated or gate.update(frame, now=i / fps):
+            workload(frame)
+            processed += 1
+    return time.process_time() - cpu, processed, gate
+
+
+def read_clip(path):
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames, fps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Motion gate replay benchmark")
+    parser.add_argument("video", nargs="?", help="recorded clip (default: synthetic)")
+    parser.add_argument("--sleep-after", type=float, default=5.0)
+    parser.add_argument("--wake-fraction", type=float, default=0.01)
+    args = parser.parse_args()
+
+    if args.video:
+        frames, fps = read_clip(args.video)
+    else:
+        frames, fps = list(synthetic_clip()), 30.0
+    gate_args = {"sleep_after": args.sleep_after, "wake_fraction": args.wake_fraction}
+
+    full_cpu, full_frames, _ = replay(frames, fps, gated=False)
+    gated_cpu, gated_frames, gate = replay(frames, fps, gated=True, **gate_args)
+    print(f"[GATE] {len(frames)} frames @ {fps:.0f} fps, {gate.stats()}")
+    print(
+        f"[GATE] ungated {full_cpu:.2f}s CPU ({full_frames} frames processed) | "
+        f"gated {gated_cpu:.2f}s CPU ({gated_frames} frames) -> "
+        f"{100 * (1 - gated_cpu / full_cpu):.0f}% CPU saved"
+    )
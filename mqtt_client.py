@@ -0,0 +1,8 @@
+import paho.mqtt.client as mqtt
+
+
+# * paho-mqtt >= 2.0 needs the callback API version, 1.x does not know it
+def make_client():
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+    return mqtt.Client()
@@ -1,18 +1,50 @@
+import logging
+import math
+import sys
+import time
 from datetime import datetime
 
-import paho.mqtt.client as mqtt
-from firebase_admin import credentials, db, initialize_app
+from firebase_admin import credentials, get_app, initialize_app
+
+import metrics
+from mqtt_client import make_client
+from schedule_cache import ScheduleCache
+from topic_router import TopicRouter
+from zone_rules import RuleTable, default_zones
+
+# Order matters: same order the TIMERs were checked in the original loop
+TIMER_ACTIONS = (
+    "pumps_on",
+    "pumps_off",
+    "lights_on",
+    "lights_off",
+    "fans_on",
+    "fans_off",
+)
+
+log = logging.getLogger("mqtt_controller")
 
 
 class MQTTController:
-    def __init__(self, host, port, keep_alive, firebase_key_path, db_url):
+    def __init__(self, host, port, keep_alive, firebase_key_path, db_url, client=None):
         #! ---------------------------- CONFIGs ----------------------------
-        self.client = mqtt.Client()
-        self.client.connect(host, port, keep_alive)
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        # A shared, already connected client (supervisor) or our own
+        self.client = client or make_client()
+        # No host: offline controller (benchmarks, replay)
+        if host and client is None:
+            self.connect()
 
-        # Authenticate to Firebase
-        cred = credentials.Certificate(firebase_key_path)
-        initialize_app(cred, {"databaseURL": db_url})
+        # Authenticate to Firebase (skipped without a key, e.g. local benchmarks)
+        if firebase_key_path:
+            try:
+                # Already initialized (controller restarted in the same process)
+                get_app()
+            except ValueError:
+                cred = credentials.Certificate(firebase_key_path)
+                initialize_app(cred, {"databaseURL": db_url})
 
         #! ---------------------------- VARIABLEs ----------------------------
 
@@ -33,71 +65,175 @@ class MQTTController:
             "DHT11/Humidity": None,
         }
 
+        # Zone rules (sensor topic -> pump), see zone_rules.py
+        self.rules = None
+
+        # Optional TelemetrySink, gets every saved sensor reading
+        self.telemetry = None
+
+        # Local copy of the TIMERs, kept fresh by a Firebase listener
+        self.schedule = None
+
+        # topic -> handlers, filled by subscribe_to_topics()/add_route()
+        self.router = TopicRouter()
+        self.malformed_payloads = 0
+
+        # Called as (topic, value, received_at) after every saved sensor value
+        self.on_sensor_update = None
+        self.publish_count = 0
+        self.messages = 0
+
+        # Plain attributes on the hot path, read by /metrics at scrape time
+        metrics.counter(
+            "garden_mqtt_messages_total",
+            "MQTT messages received",
+            lambda: self.messages,
+        )
+        metrics.counter(
+            "garden_mqtt_published_total",
+            "MQTT commands published",
+            lambda: self.publish_count,
+        )
+        metrics.counter(
+            "garden_mqtt_malformed_total",
+            "Sensor payloads that were not numbers",
+            lambda: self.malformed_payloads,
+        )
+
+        # Optional ActuatorState: persisted, coalesced, QoS 1 commands
+        self.actuators = None
+
+        # Wall clock for the TIMER poll (a simulated clock in sim_harness.py)
+        self.now = datetime.now
+
         #! ---------------------------- FUNCs ----------------------------
 
-    # * [SAVE] MQTT msg
+    # * Connect to the broker (blocking, the sync main loop drives the socket)
+    def connect(self):
+        self.client.connect(self.host, self.port, self.keep_alive)
+
+    # * Dispatch MQTT msg to the handlers routed for its topic
     def on_message(self, client, userdata, msg):
-        topic = msg.topic
-        payload = msg.payload.decode("utf-8")
+        received_at = time.perf_counter()
+        self.messages += 1
+        for handler in self.router.match(msg.topic):
+            handler(msg.topic, msg.payload, received_at)
+
+    # * [SAVE] sensor value, parsed straight from the payload bytes
+    def save_sensor(self, topic, payload, received_at):
+        try:
+            value = float(payload)
+        except (TypeError, ValueError):
+            value = None
+        # "nan"/"inf" parse as floats but are sensor failures, not readings
+        if value is None or not math.isfinite(value):
+            self.malformed_payloads += 1
+            log.warning("Malformed payload on %s: %.32r", topic, payload)
+            return
+
+        self.sensor_values[topic] = value
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[SAVE] Topic %s: %s", topic, value)
 
-        # Save the value based on the topic
-        if topic in self.sensor_values:
-            self.sensor_values[topic] = float(payload)
-            print(f"[SAVE] Topic {topic}: {self.sensor_values[topic]}")
+        if self.telemetry is not None:
+            self.telemetry.record(topic, value)
+
+        if self.on_sensor_update is not None:
+            self.on_sensor_update(topic, value, received_at)
+
+    # * Route topics (wildcards allowed) to a handler(topic, payload, received_at)
+    def add_route(self, topic_filter, handler):
+        self.router.add(topic_filter, handler)
 
     # * Subscibe TOPIC & [SAVE] MQTT msg
     def subscribe_to_topics(self, topics):
         for topic in topics:
+            self.add_route(topic, self.save_sensor)
             self.client.subscribe(topic)
         # [SAVE] MQTT msg
         self.client.on_message = self.on_message
 
     # * Publish MQTT msg to TOPIC
     def publish_to_topics(self, topic, msg):
-        self.client.publish(topic, msg)
-
-    # * Logic Control PUMPs
-    def control_pumps(self, topic_pump_left, topic_pump_right):
-        moisture_left = self.sensor_values["Soil/Moisture_LEFT"]
-        moisture_right = self.sensor_values["Soil/Moisture_RIGHT"]
-
-        # Pump LEFT
-        if (
-            moisture_left is not None
-            and moisture_left <= 35
-            and self.last_executed["pump_LEFT"] != "ON"
-        ):
-            print("Soil moisture left is low. Turning ON Pump Left.")
-            self.client.publish(topic_pump_left, "ON")
-            self.last_executed["pump_LEFT"] = "ON"
-        elif (
-            moisture_left is not None
-            and moisture_left >= 60
-            and self.last_executed["pump_LEFT"] != "OFF"
-        ):
-            print("Soil moisture left is high. Turning OFF Pump Left.")
-            self.client.publish(topic_pump_left, "OFF")
-            self.last_executed["pump_LEFT"] = "OFF"
-
-        # Pump RIGHT
-        if (
-            moisture_right is not None
-            and moisture_right <= 35
-            and self.last_executed["pump_RIGHT"] != "ON"
-        ):
-            print("Soil moisture right is low. Turning ON Pump Right.")
-            self.client.publish(topic_pump_right, "ON")
-            self.last_executed["pump_RIGHT"] = "ON"
-        elif (
-            moisture_right is not None
-            and moisture_right >= 60
-            and self.last_executed["pump_RIGHT"] != "OFF"
-        ):
-            print("Soil moisture right is high. Turning OFF Pump Right.")
-            self.client.publish(topic_pump_right, "OFF")
-            self.last_executed["pump_RIGHT"] = "OFF"
-
-    # * Logic fot TIMERs
+        if self.actuators is not None:
+            self.actuators.command(topic, msg)
+        else:
+            self.client.publish(topic, msg)
+        self.publish_count += 1
+
+    # * Route commands through an ActuatorState and start from its persisted
+    # state, so a restart does not re-command every device.
+    # topics: last_executed key -> actuator topic, e.g. {"lights": "Lights"}
+    def use_actuators(self, actuators, topics, status_suffix=None):
+        self.actuators = actuators
+        for key, topic in topics.items():
+            state = actuators.state(topic)
+            if state is not None:
+                self.last_executed[key] = state
+            if status_suffix:
+                actuators.watch_status(topic, topic + status_suffix)
+        return actuators
+
+    # * Compile the zone rules (moisture sensor -> pump) into a lookup table
+    def load_rules(self, zones):
+        self.rules = RuleTable(zones)
+        for zone in self.rules.zones:
+            self.sensor_values.setdefault(zone.sensor, None)
+            self.last_executed.setdefault(f"pump_{zone.name}", None)
+        return self.rules
+
+    def ensure_rules(self, topic_pump_left, topic_pump_right):
+        if self.rules is None:
+            self.load_rules(default_zones(topic_pump_left, topic_pump_right))
+
+    def _apply_pump_commands(self, commands, prefix=""):
+        for zone, command in commands:
+            if prefix:
+                print(f"{prefix} Turn {command} Pumps {zone.name}")
+            elif command == "ON":
+                print(f"Soil moisture {zone.name} is low. Turning ON Pump {zone.name}.")
+            else:
+                print(
+                    f"Soil moisture {zone.name} is high. Turning OFF Pump {zone.name}."
+                )
+            self.publish_to_topics(zone.pump, command)
+            self.last_executed[f"pump_{zone.name}"] = command
+
+    # * Logic Control PUMPs (only the zones fed by the changed sensor)
+    def evaluate_sensor(self, topic):
+        if self.rules is None:
+            return
+        self._apply_pump_commands(
+            self.rules.evaluate(
+                topic, self.sensor_values.get(topic), self.last_executed
+            )
+        )
+
+    # * Logic Control PUMPs (every zone)
+    def control_pumps(self, topic_pump_left=None, topic_pump_right=None):
+        self.ensure_rules(topic_pump_left, topic_pump_right)
+        for topic in self.rules.sensors():
+            self.evaluate_sensor(topic)
+
+    # * Load TIMERs once and keep them synced in the background
+    # (reference: Firebase db.reference stand-in, e.g. sim_harness.FakeFirebase;
+    # snapshot_path: start from the last saved copy, offline included)
+    def start_schedule(
+        self, timer_paths, poll_interval=30.0, reference=None, snapshot_path=None
+    ):
+        self.schedule = ScheduleCache(
+            timer_paths,
+            poll_interval=poll_interval,
+            reference=reference,
+            snapshot_path=snapshot_path,
+        )
+        self.schedule.start()
+        return self.schedule
+
+    # * Logic fot TIMERs (polled: fires when a timer matches the current minute)
+    @metrics.timed(
+        "garden_timer_check_seconds", "check_timer_and_publish() duration (poll mode)"
+    )
     def check_timer_and_publish(
         self,
         topic_pump_left,
@@ -111,76 +247,105 @@ class MQTTController:
         timer_fans_on,
         timer_fans_off,
     ):
-        # Moisture values
-        moisture_left = self.sensor_values["Soil/Moisture_LEFT"]
-        moisture_right = self.sensor_values["Soil/Moisture_RIGHT"]
-
-        # Get TIMERs from firebase
-        pumps_ON_time = db.reference(timer_pumps_on).get()
-        pumps_OFF_time = db.reference(timer_pumps_off).get()
-        lights_ON_time = db.reference(timer_lights_on).get()
-        lights_OFF_time = db.reference(timer_lights_off).get()
-        fans_ON_time = db.reference(timer_fans_on).get()
-        fans_OFF_time = db.reference(timer_fans_off).get()
-
-        current_time = datetime.now().strftime("%H:%M")
-
-        # TIMER pumps ON
-        if pumps_ON_time == current_time:
-            if (
-                moisture_left is not None
-                and moisture_left < 55
-                and self.last_executed["pump_LEFT"] != "ON"
-            ):
-                print("[TIMER] Turn ON Pumps LEFT")
-                self.client.publish(topic_pump_left, "ON")
-                self.last_executed["pump_LEFT"] = "ON"
-
-            elif (
-                moisture_left is not None
-                and moisture_right < 55
-                and self.last_executed["pump_RIGHT"] != "ON"
-            ):
-                print("[TIMER] Turn ON Pumps RIGHT")
-                self.client.publish(topic_pump_right, "ON")
-                self.last_executed["pump_RIGHT"] = "ON"
-
-        # TIMER pumps OFF
-        if pumps_OFF_time == current_time:
-            if (
-                moisture_right is not None
-                and moisture_left >= 40
-                and self.last_executed["pump_LEFT"] != "OFF"
-            ):
-                print("[TIMER] Turn OFF Pumps LEFT")
-                self.client.publish(topic_pump_left, "OFF")
-                self.last_executed["pump_LEFT"] = "OFF"
-
-            elif (
-                moisture_right is not None
-                and moisture_right >= 40
-                and self.last_executed["pump_RIGHT"] != "OFF"
-            ):
-                print("[TIMER] Turn OFF Pumps RIGHT")
-                self.client.publish(topic_pump_right, "OFF")
-                self.last_executed["pump_RIGHT"] = "OFF"
-
-        if lights_ON_time == current_time and self.last_executed["lights"] != "ON":
+        timers = {
+            "pumps_on": timer_pumps_on,
+            "pumps_off": timer_pumps_off,
+            "lights_on": timer_lights_on,
+            "lights_off": timer_lights_off,
+            "fans_on": timer_fans_on,
+            "fans_off": timer_fans_off,
+        }
+
+        # Get TIMERs from the local cache (one Firebase GET at startup)
+        if self.schedule is None:
+            self.start_schedule(list(timers.values()))
+
+        current_time = self.now().strftime("%H:%M")
+
+        for action in TIMER_ACTIONS:
+            if self.schedule.get(timers[action]) == current_time:
+                self.run_timer(
+                    action, topic_pump_left, topic_pump_right, topic_lights, topic_fans
+                )
+
+    # * Execute one TIMER action (called by the poll above or the ControlEngine)
+    def run_timer(
+        self, action, topic_pump_left, topic_pump_right, topic_lights, topic_fans
+    ):
+        # TIMER pumps ON / OFF
+        if action in ("pumps_on", "pumps_off"):
+            self.ensure_rules(topic_pump_left, topic_pump_right)
+            self._apply_pump_commands(
+                self.rules.evaluate_timer(
+                    action, self.sensor_values, self.last_executed
+                ),
+                prefix="[TIMER]",
+            )
+
+        elif action == "lights_on" and self.last_executed["lights"] != "ON":
             print("Turn ON LIGHTs")
-            self.client.publish(topic_lights, "ON")
+            self.publish_to_topics(topic_lights, "ON")
             self.last_executed["lights"] = "ON"
 
-        if lights_OFF_time == current_time and self.last_executed["lights"] != "OFF":
+        elif action == "lights_off" and self.last_executed["lights"] != "OFF":
             print("Turn OFF LIGHTs")
-            self.client.publish(topic_lights, "OFF")
+            self.publish_to_topics(topic_lights, "OFF")
             self.last_executed["lights"] = "OFF"
 
-        if fans_ON_time == current_time and self.last_executed["fans"] != "ON":
+        elif action == "fans_on" and self.last_executed["fans"] != "ON":
             print("Turn ON FANs")
-            self.client.publish(topic_fans, "ON")
+            self.publish_to_topics(topic_fans, "ON")
             self.last_executed["fans"] = "ON"
 
-        if fans_OFF_time == current_time and self.last_executed["fans"] != "OFF":
+        elif action == "fans_off" and self.last_executed["fans"] != "OFF":
             print("Turn OFF FANs")
-            self.client.publish(topic_fans, "OFF")
+            self.publish_to_topics(topic_fans, "OFF")
             self.last_executed["fans"] = "OFF"
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+class BenchMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def benchmark(num_messages=500000):
+    controller = MQTTController(None, None, None, None, None)
+    controller.subscribe_to_topics(["Soil/#", "DHT11/+", "Water/Quantity"])
+    controller.load_rules(default_zones("Pump/LEFT", "Pump/RIGHT"))
+    controller.client.publish = lambda topic, msg: None
+
+    topics = [
+        "Soil/Moisture_LEFT",
+        "Soil/Moisture_RIGHT",
+        "DHT11/Temperature",
+        "DHT11/Humidity",
+        "Water/Quantity",
+        "Unrouted/Topic",
+    ]
+    # Every 1000th payload is garbage to exercise the malformed counter
+    messages = [
+        BenchMessage(
+            topics[i % len(topics)],
+            b"n/a" if i % 1000 == 0 else str(20 + (i * 7) % 60).encode(),
+        )
+        for i in range(num_messages)
+    ]
+
+    start = time.perf_counter()
+    for msg in messages:
+        controller.on_message(None, None, msg)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"[BENCH] on_message: {num_messages / elapsed:,.0f} msg/s, "
+        f"malformed={controller.malformed_payloads}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    benchmark(*(int(arg) for arg in sys.argv[1:2]))
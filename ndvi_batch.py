@@ -0,0 +1,230 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import cv2
+
+from ndvi_processor import NDVIProcessor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+CSV_FIELDS = [
+    "path",
+    "mtime",
+    "width",
+    "height",
+    "ndvi_mean",
+    "ndvi_std",
+    "ndvi_min",
+    "ndvi_max",
+    "vegetation_fraction",
+    "num_regions",
+    "num_weak_areas",
+    "regions",
+    "weak_areas",
+    "elapsed_ms",
+    "error",
+]
+
+# One processor per worker process (its buffers are reused across images)
+_processor = None
+_params = None
+
+
+#! ---------------------------- WORKER ----------------------------
+
+
+def _init_worker(params):
+    global _processor, _params
+    # The pool already spreads images over every core
+    cv2.setNumThreads(1)
+    _processor = NDVIProcessor()
+    _params = params
+
+
+def analyze_image(path):
+    try:
+        return _analyze_image(path)
+    except Exception as e:
+        return {"path": path, "mtime": os.path.getmtime(path), "error": str(e)}
+
+
+def _analyze_image(path):
+    start = time.perf_counter()
+    result = {"path": path, "mtime": os.path.getmtime(path)}
+
+    frame = cv2.imread(path, cv2.IMREAD_COLOR)
+    if frame is None:
+        result["error"] = "unreadable image"
+        return result
+
+    # Same analysis as take_pics.capture_images (analyze_frame, same NDVI_MODE)
+    ndvi_values = _processor.process_frame(frame)
+    results = _processor.analyze_frame(
+        ndvi_values,
+        mode=_params["mode"],
+        scale=_params["scale"],
+        min_area=_params["min_area"],
+        weak_threshold=_params["weak_threshold"],
+        min_weak_area=_params["min_weak_area"],
+        threshold=_params["threshold"],
+    )
+    regions = [region for region, _ in results]
+    weak_areas = [area for _, areas in results for area in areas or ()]
+
+    vegetation_mask = ndvi_values > 0.2
+    vegetation = ndvi_values[vegetation_mask]
+    result.update(
+        {
+            "width": int(frame.shape[1]),
+            "height": int(frame.shape[0]),
+            "ndvi_mean": float(vegetation.mean()) if vegetation.size else 0.0,
+            "ndvi_std": float(vegetation.std()) if vegetation.size else 0.0,
+            "ndvi_min": float(vegetation.min()) if vegetation.size else 0.0,
+            "ndvi_max": float(vegetation.max()) if vegetation.size else 0.0,
+            "vegetation_fraction": float(vegetation.size / ndvi_values.size),
+            "num_regions": len(regions),
+            "num_weak_areas": len(weak_areas),
+            "regions": [[int(v) for v in region] for region in regions],
+            "weak_areas": [[int(v) for v in area] for area in weak_areas],
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        }
+    )
+    return result
+
+
+#! ---------------------------- INPUT / OUTPUT ----------------------------
+
+
+def find_images(inputs, recursive=True):
+    for item in inputs:
+        if os.path.isfile(item):
+            yield item
+            continue
+        for root, dirs, files in os.walk(item):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+            if not recursive:
+                break
+
+
+# * (path, mtime) pairs already in the output file, so a rerun skips them
+def load_done(output):
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, newline="") as f:
+        if output.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            if not row.get("error"):
+                done.add((row["path"], float(row["mtime"])))
+    return done
+
+
+class ResultWriter:
+    def __init__(self, output):
+        self.is_csv = output.endswith(".csv")
+        new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        self.file = open(output, "a", newline="")
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, result):
+        if self.is_csv:
+            row = dict(result)
+            row["regions"] = json.dumps(row.get("regions", []))
+            row["weak_areas"] = json.dumps(row.get("weak_areas", []))
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+        # Flushed per image so an interrupted run can resume where it stopped
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+#! ---------------------------- MAIN ----------------------------
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-run NDVI analysis over archived images"
+    )
+    parser.add_argument("inputs", nargs="*", default=["data/yesterday"])
+    parser.add_argument("-o", "--output", default="data/ndvi_results.jsonl")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--min-area", type=int, default=2000)
+    parser.add_argument("--weak-threshold", type=float, default=0.3)
+    parser.add_argument("--min-weak-area", type=int, default=80)
+    # Defaults follow take_pics, so batch and live results agree
+    parser.add_argument(
+        "--mode",
+        choices=("full", "pyramid"),
+        default=os.getenv("NDVI_MODE", "full"),
+        help="region detection (take_pics NDVI_MODE)",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=float(os.getenv("NDVI_PYRAMID_SCALE", "0.25"))
+    )
+    parser.add_argument("--no-recursive", action="store_true")
+    parser.add_argument(
+        "--force", action="store_true", help="reprocess images already in output"
+    )
+    args = parser.parse_args(argv)
+
+    done = set() if args.force else load_done(args.output)
+    pending = [
+        path
+        for path in find_images(args.inputs, recursive=not args.no_recursive)
+        if (path, os.path.getmtime(path)) not in done
+    ]
+    print(f"[BATCH] {len(pending)} images to process ({len(done)} already done)")
+    if not pending:
+        return
+
+    params = {
+        "threshold": args.threshold,
+        "min_area": args.min_area,
+        "weak_threshold": args.weak_threshold,
+        "min_weak_area": args.min_weak_area,
+        "mode": args.mode,
+        "scale": args.scale,
+    }
+    writer = ResultWriter(args.output)
+    start = time.perf_counter()
+    processed = failed = 0
+    try:
+        with Pool(args.workers, initializer=_init_worker, initargs=(params,)) as pool:
+            for result in pool.imap_unordered(analyze_image, pending, chunksize=2):
+                writer.write(result)
+                processed += 1
+                failed += "error" in result
+                if processed % 50 == 0:
+                    rate = processed / (time.perf_counter() - start)
+                    print(f"[BATCH] {processed}/{len(pending)} ({rate:.1f} img/s)")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"[BATCH] Done: {processed} images ({failed} failed) in {elapsed:.1f}s, "
+        f"{processed / elapsed:.1f} images/sec with {args.workers} workers"
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
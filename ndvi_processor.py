@@ -1,14 +1,92 @@
+import argparse
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 
+import metrics
+
+# Per-stage timings: process_frame() stages, then region detection / analysis
+# (analyze_frame) or per-plant statistics (region_stats)
+STAGES = (
+    "percentile",
+    "stretch",
+    "ndvi_blur",
+    "hsv",
+    "mask",
+    "detect",
+    "analyze",
+    "stats",
+)
+STAGE_SECONDS = {
+    stage: metrics.histogram(
+        "garden_ndvi_stage_seconds", "NDVIProcessor stage duration", stage=stage
+    )
+    for stage in STAGES
+}
+
+
+# Same "linear" interpolation np.percentile uses, so results are bit-identical
+def _lerp(a, b, t):
+    if t >= 0.5:
+        return b - (b - a) * (1 - t)
+    return a + (b - a) * t
+
+
+# Several percentiles of a uint8 image from ONE 256-bin histogram (no sort)
+def hist_percentiles(im, qs):
+    if im.size < 2**24:
+        # float32 bins are exact below 2**24 and calcHist is ~6x faster
+        rows = np.ascontiguousarray(im).reshape(im.shape[0] if im.ndim > 1 else 1, -1)
+        hist = cv2.calcHist([rows], [0], None, [256], [0, 256]).ravel()
+        hist = hist.astype(np.int64)
+    else:
+        hist = np.bincount(im.ravel(), minlength=256)
+    cumulative = np.cumsum(hist)
+    n = cumulative[-1]
+    result = []
+    for q in qs:
+        index = (n - 1) * (q / 100)
+        lo = int(np.floor(index))
+        hi = min(lo + 1, n - 1)
+        a, b = np.searchsorted(cumulative, [lo, hi], side="right")
+        result.append(_lerp(float(a), float(b), index - lo))
+    return result
+
+
+# Several percentiles of any image with ONE partial partition (no full sorts)
+def partition_percentiles(im, qs):
+    flat = np.asarray(im).ravel()
+    n = flat.size
+    indexes = [(n - 1) * (q / 100) for q in qs]
+    kth = sorted(
+        {k for i in indexes for k in (int(np.floor(i)), min(int(i) + 1, n - 1))}
+    )
+    part = np.partition(flat, kth)
+    result = []
+    for index in indexes:
+        lo = int(np.floor(index))
+        hi = min(lo + 1, n - 1)
+        result.append(_lerp(float(part[lo]), float(part[hi]), index - lo))
+    return result
+
+
+def percentiles(im, qs):
+    if im.dtype == np.uint8:
+        return hist_percentiles(im, qs)
+    return partition_percentiles(im, qs)
+
 
 class NDVIProcessor:
     def __init__(self):
-        pass
+        # Per-shape work buffers reused by process_frame() between frames
+        self._buffers = {}
+        self.stage_times = {}
 
     def contrast_stretch(self, im):
-        in_min = np.percentile(im, 5)
-        in_max = np.percentile(im, 95)
+        in_min, in_max = percentiles(im, (5, 95))
         out_min, out_max = 0.0, 255.0
         out = (im - in_min) * ((out_max - out_min) / (in_max - in_min)) + out_min
         return out
@@ -42,7 +120,9 @@ class NDVIProcessor:
 
         return ndvi
 
-    def detect_vegetation_regions(self, ndvi_image, threshold=0.2, min_area=2000):
+    # * Connected vegetation components of an NDVI image: (labels, stats,
+    # centroids, keep), keep being the label ids with area >= min_area
+    def label_vegetation(self, ndvi_image, threshold=0.2, min_area=2000):
         # Dynamic threshold
         adaptive_threshold = max(np.mean(ndvi_image) * 0.6, threshold)
         vegetation_mask = (ndvi_image > adaptive_threshold).astype(np.uint8)
@@ -52,30 +132,105 @@ class NDVIProcessor:
         vegetation_mask = cv2.morphologyEx(vegetation_mask, cv2.MORPH_OPEN, kernel)
         vegetation_mask = cv2.morphologyEx(vegetation_mask, cv2.MORPH_CLOSE, kernel)
 
-        # Find connected components
-        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(
+        # Find connected components (label 0 is the background)
+        _, labels, stats, centroids = cv2.connectedComponentsWithStats(
             vegetation_mask, connectivity=8
         )
+        keep = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] >= min_area) + 1
+        return labels, stats, centroids, keep
 
-        regions = []
-        for i in range(1, num_labels):  # Skipping label 0 which is the background
-            if stats[i, cv2.CC_STAT_AREA] >= min_area:
-                x, y, w, h = (
-                    stats[i, cv2.CC_STAT_LEFT],
-                    stats[i, cv2.CC_STAT_TOP],
-                    stats[i, cv2.CC_STAT_WIDTH],
-                    stats[i, cv2.CC_STAT_HEIGHT],
-                )
-                regions.append((x, y, w, h))
+    def detect_vegetation_regions(self, ndvi_image, threshold=0.2, min_area=2000):
+        _, stats, _, keep = self.label_vegetation(ndvi_image, threshold, min_area)
+        return [
+            (
+                stats[i, cv2.CC_STAT_LEFT],
+                stats[i, cv2.CC_STAT_TOP],
+                stats[i, cv2.CC_STAT_WIDTH],
+                stats[i, cv2.CC_STAT_HEIGHT],
+            )
+            for i in keep
+        ]
 
-        return regions
+    # * Per-plant NDVI statistics without a loop over region crops. Returns a
+    # compact label map (0 = background, plant n = label n) and one dict per
+    # plant: bbox, area, NDVI mean / std, weak-pixel fraction and centroid. Weak
+    # pixels use analyze_region's NDVI band, counted over the plant's own pixels.
+    def region_stats(
+        self, ndvi_image, threshold=0.2, min_area=2000, weak_threshold=0.3
+    ):
+        t0 = time.perf_counter()
+        labels, stats, centroids, keep = self.label_vegetation(
+            ndvi_image, threshold, min_area
+        )
+        t1 = time.perf_counter()
+
+        # Renumber kept plants 1..n (16-bit cv2.LUT is a fraction of lut[labels])
+        count = len(keep)
+        if count < 2**16 and len(stats) <= 2**16:
+            lut = np.zeros(2**16, np.uint16)
+            lut[keep] = np.arange(1, count + 1)
+            compact = cv2.LUT(labels.astype(np.uint16), lut)
+        else:
+            lut = np.zeros(len(stats), np.int32)
+            lut[keep] = np.arange(1, count + 1)
+            compact = lut[labels]
+
+        # Sums per run of equal labels (reduceat), then per label over the runs:
+        # far cheaper than bincount over every pixel of the frame
+        flat = compact.ravel()
+        starts = _run_starts(flat)
+        run_labels = flat[starts]
+        values = ndvi_image.ravel().astype(np.float64)
+        bins = count + 1
+        total = np.bincount(
+            run_labels, weights=np.add.reduceat(values, starts), minlength=bins
+        )[1:]
+        np.multiply(values, values, out=values)
+        total_sq = np.bincount(
+            run_labels, weights=np.add.reduceat(values, starts), minlength=bins
+        )[1:]
+
+        ndvi = ndvi_image.ravel()
+        adjusted_weak_threshold = min(weak_threshold + 0.1, 0.5)
+        weak = (ndvi > 0.2) & (ndvi < adjusted_weak_threshold)
+        weak_count = np.bincount(flat[weak], minlength=bins)[1:]
+
+        area = stats[keep, cv2.CC_STAT_AREA]
+        mean = total / area
+        std = np.sqrt(np.maximum(total_sq / area - mean * mean, 0.0))
+        weak_fraction = weak_count / area
+
+        boxes = stats[keep, :4].tolist()
+        area, mean, std = area.tolist(), mean.tolist(), std.tolist()
+        weak_fraction = weak_fraction.tolist()
+        centers = centroids[keep].tolist()
+        plants = [
+            {
+                "label": i + 1,
+                "bbox": tuple(boxes[i]),
+                "area": area[i],
+                "ndvi_mean": mean[i],
+                "ndvi_std": std[i],
+                "weak_fraction": weak_fraction[i],
+                "centroid": tuple(centers[i]),
+            }
+            for i in range(count)
+        ]
+
+        STAGE_SECONDS["detect"].observe(t1 - t0)
+        STAGE_SECONDS["stats"].observe(time.perf_counter() - t1)
+        return compact, plants
 
     def analyze_region(
         self, region, ndvi_image, vegetation_mask, weak_threshold=0.3, min_weak_area=80
     ):
         x, y, w, h = region
         region_ndvi = ndvi_image[y : y + h, x : x + w]
-        region_vegetation_mask = vegetation_mask[y : y + h, x : x + w]
+        if vegetation_mask is None:
+            # ROI-only callers (pyramid mode) skip the full-frame mask
+            region_vegetation_mask = (region_ndvi > 0.2).astype(np.uint8)
+        else:
+            region_vegetation_mask = vegetation_mask[y : y + h, x : x + w]
 
         # Adjust weak threshold considering high light conditions might make NDVI values higher
         adjusted_weak_threshold = min(weak_threshold + 0.1, 0.5)  # Adjust as needed
@@ -102,4 +257,427 @@ class NDVIProcessor:
                 x_cnt, y_cnt, w_cnt, h_cnt = cv2.boundingRect(cnt)
                 weak_areas.append((x + x_cnt, y + y_cnt, w_cnt, h_cnt))
 
-        return weak_areas if weak_areas else None
\ No newline at end of file
+        return weak_areas if weak_areas else None
+
+    # Coarse detection on a downscaled NDVI image, boxes mapped back to full res
+    def detect_vegetation_regions_pyramid(
+        self, ndvi_image, scale=0.25, threshold=0.2, min_area=2000, pad=4
+    ):
+        small = cv2.resize(
+            ndvi_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+        )
+        coarse = self.detect_vegetation_regions(
+            small, threshold=threshold, min_area=max(1, int(min_area * scale * scale))
+        )
+
+        height, width = ndvi_image.shape[:2]
+        regions = []
+        for x, y, w, h in coarse:
+            x0 = max(0, int((x - pad) / scale))
+            y0 = max(0, int((y - pad) / scale))
+            x1 = min(width, int(np.ceil((x + w + pad) / scale)))
+            y1 = min(height, int(np.ceil((y + h + pad) / scale)))
+            regions.append((x0, y0, x1 - x0, y1 - y0))
+        return regions
+
+    # * Regions + weak areas for one NDVI frame ("full" or "pyramid" detection).
+    # workers > 1 analyzes the regions on a thread pool (OpenCV releases the GIL)
+    def analyze_frame(
+        self,
+        ndvi_image,
+        mode="full",
+        scale=0.25,
+        workers=1,
+        min_area=2000,
+        weak_threshold=0.3,
+        min_weak_area=80,
+        threshold=0.2,
+    ):
+        t0 = time.perf_counter()
+        if mode == "pyramid":
+            regions = self.detect_vegetation_regions_pyramid(
+                ndvi_image, scale=scale, threshold=threshold, min_area=min_area
+            )
+            vegetation_mask = None
+        else:
+            regions = self.detect_vegetation_regions(
+                ndvi_image, threshold=threshold, min_area=min_area
+            )
+            vegetation_mask = (ndvi_image > 0.2).astype(np.uint8)
+        t1 = time.perf_counter()
+
+        def analyze(region):
+            return self.analyze_region(
+                region,
+                ndvi_image,
+                vegetation_mask,
+                weak_threshold=weak_threshold,
+                min_weak_area=min_weak_area,
+            )
+
+        if workers > 1 and len(regions) > 1:
+            with ThreadPoolExecutor(workers) as pool:
+                weak = list(pool.map(analyze, regions))
+        else:
+            weak = [analyze(region) for region in regions]
+
+        STAGE_SECONDS["detect"].observe(t1 - t0)
+        STAGE_SECONDS["analyze"].observe(time.perf_counter() - t1)
+        return list(zip(regions, weak))
+
+    def _get_buffers(self, shape):
+        buffers = self._buffers.get(shape)
+        if buffers is None:
+            h, w = shape[:2]
+            buffers = {
+                "channel": np.empty((h, w), np.uint8),
+                "b": np.empty((h, w), np.float32),
+                "g": np.empty((h, w), np.float32),
+                "r": np.empty((h, w), np.float32),
+                "tmp": np.empty((h, w), np.float32),
+                "blur": np.empty((h, w), np.float32),
+                "ndvi": np.empty((h, w), np.float32),
+                "u8": np.empty((h, w, 3), np.uint8),
+                "hsv": np.empty((h, w, 3), np.uint8),
+                "soil": np.empty((h, w), np.uint8),
+                "mask": np.empty((h, w), np.uint8),
+                "cmp": np.empty((h, w), np.uint8),
+            }
+            self._buffers[shape] = buffers
+        return buffers
+
+    # contrast_stretch() + calculate_ndvi() fused for uint8 BGR frames.
+    # The returned array is a reused buffer: copy it to keep it past the next call.
+    def process_frame(self, frame):
+        if frame.dtype != np.uint8 or frame.ndim != 3 or frame.shape[2] != 3:
+            return self.calculate_ndvi(self.contrast_stretch(frame))
+
+        buf = self._get_buffers(frame.shape)
+        t0 = time.perf_counter()
+
+        # Contrast stretch as 256-entry lookup tables (same float64 math, then cast)
+        # A flat frame (lens cap, night) divides by zero like the reference:
+        # NaN NDVI, masked out to 0 below
+        in_min, in_max = hist_percentiles(frame, (5, 95))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lut64 = (np.arange(256, dtype=np.float64) - in_min) * (
+                255.0 / (in_max - in_min)
+            )
+            lut32 = lut64.astype(np.float32).reshape(1, 256)
+            lut_u8 = lut64.astype(np.uint8).reshape(1, 256)
+        t1 = time.perf_counter()
+
+        b, g, r, tmp = buf["b"], buf["g"], buf["r"], buf["tmp"]
+        for index, plane in enumerate((b, g, r)):
+            cv2.extractChannel(frame, index, dst=buf["channel"])
+            cv2.LUT(buf["channel"], lut32, dst=plane)
+        t2 = time.perf_counter()
+
+        # NDVI = (g - r) / (g + r + 1e-6), then blur
+        np.add(g, r, out=tmp)
+        np.add(tmp, 1e-6, out=tmp)
+        np.subtract(g, r, out=buf["ndvi"])
+        np.divide(buf["ndvi"], tmp, out=buf["ndvi"])
+        cv2.GaussianBlur(buf["ndvi"], (5, 5), 0, dst=buf["blur"])
+        t3 = time.perf_counter()
+
+        # Soil: low saturation and value in HSV of the stretched uint8 frame
+        cv2.LUT(frame, lut_u8, dst=buf["u8"])
+        cv2.cvtColor(buf["u8"], cv2.COLOR_BGR2HSV, dst=buf["hsv"])
+        cv2.inRange(buf["hsv"], (0, 0, 0), (255, 49, 49), dst=buf["soil"])
+        t4 = time.perf_counter()
+
+        # Vegetation: g > 1.5 r, g > 1.5 b, g > 50 and not soil
+        mask, cmp = buf["mask"], buf["cmp"]
+        cv2.bitwise_not(buf["soil"], dst=mask)
+        np.multiply(r, 1.5, out=tmp)
+        cv2.compare(g, tmp, cv2.CMP_GT, dst=cmp)
+        cv2.bitwise_and(mask, cmp, dst=mask)
+        np.multiply(b, 1.5, out=tmp)
+        cv2.compare(g, tmp, cv2.CMP_GT, dst=cmp)
+        cv2.bitwise_and(mask, cmp, dst=mask)
+        cv2.compare(g, 50.0, cv2.CMP_GT, dst=cmp)
+        cv2.bitwise_and(mask, cmp, dst=mask)
+
+        ndvi = buf["ndvi"]
+        ndvi.fill(0)
+        cv2.copyTo(buf["blur"], mask, ndvi)
+        t5 = time.perf_counter()
+
+        self.stage_times = {
+            "percentile": t1 - t0,
+            "stretch": t2 - t1,
+            "ndvi_blur": t3 - t2,
+            "hsv": t4 - t3,
+            "mask": t5 - t4,
+        }
+        for stage, seconds in self.stage_times.items():
+            STAGE_SECONDS[stage].observe(seconds)
+        return ndvi
+
+
+#! ---------------------------- LABEL MAPS ----------------------------
+
+
+# * Run-length encoding of a label map in row-major order: (values, lengths),
+# one entry per run of equal labels. Plants are blobs, so a frame of a few
+# million pixels collapses to a few runs per plant per row.
+def _run_starts(flat):
+    if flat.size == 0:
+        return np.zeros(0, np.intp)
+    starts = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    return np.concatenate(([0], starts))
+
+
+def rle_encode(labels):
+    flat = np.ascontiguousarray(labels).ravel()
+    starts = _run_starts(flat)
+    lengths = np.diff(np.append(starts, flat.size)).astype(np.uint32)
+    return flat[starts], lengths
+
+
+def rle_decode(values, lengths, shape):
+    return np.repeat(values, lengths).reshape(shape)
+
+
+def save_label_map(path, labels):
+    values, lengths = rle_encode(labels)
+    np.savez_compressed(
+        path, shape=np.array(labels.shape), values=values, lengths=lengths
+    )
+
+
+def load_label_map(path):
+    with np.load(path) as data:
+        return rle_decode(data["values"], data["lengths"], tuple(data["shape"]))
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+def synthetic_frame(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:, :, 0] = (40 + 30 * np.sin(xx / 37.0)).astype(np.uint8)
+    frame[:, :, 1] = (90 + 80 * np.sin(xx / 53.0) * np.cos(yy / 41.0)).astype(np.uint8)
+    frame[:, :, 2] = (60 + 40 * np.cos(yy / 29.0)).astype(np.uint8)
+    noise = rng.integers(-12, 12, frame.shape)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+# Baseline timed against the fused path: the original two np.percentile
+# sorts, float64 stretch, calculate_ndvi (the tests keep their own oracle)
+def _percentile_ndvi(processor, frame):
+    in_min, in_max = np.percentile(frame, 5), np.percentile(frame, 95)
+    stretched = (frame - in_min) * (255.0 / (in_max - in_min))
+    return processor.calculate_ndvi(stretched)
+
+
+def benchmark_fused(sizes=((640, 480), (1920, 1080)), repeat=10):
+    processor = NDVIProcessor()
+    for width, height in sizes:
+        frame = synthetic_frame(width, height)
+
+        # Reference equivalence against the original np.percentile + split path
+        reference = _percentile_ndvi(processor, frame)
+        assert np.array_equal(
+            processor.calculate_ndvi(processor.contrast_stretch(frame)), reference
+        ), "contrast_stretch differs from np.percentile"
+        fused = processor.process_frame(frame)
+        max_diff = float(np.max(np.abs(reference - fused)))
+        assert np.array_equal(fused, reference), f"NDVI differs by {max_diff}"
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            _percentile_ndvi(processor, frame)
+        ref_time = (time.perf_counter() - start) / repeat
+
+        totals = {}
+        start = time.perf_counter()
+        for _ in range(repeat):
+            processor.process_frame(frame)
+            for stage, seconds in processor.stage_times.items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        fused_time = (time.perf_counter() - start) / repeat
+
+        stages = " ".join(f"{k}={v / repeat * 1000:.1f}ms" for k, v in totals.items())
+        print(
+            f"[BENCH] {width}x{height}: reference {ref_time * 1000:.1f}ms "
+            f"({1 / ref_time:.1f} fps), fused {fused_time * 1000:.1f}ms "
+            f"({1 / fused_time:.1f} fps), max |diff|={max_diff:.2e}"
+        )
+        print(f"[BENCH]   stages: {stages}")
+
+
+# Synthetic NDVI map: healthy plants (ellipses) with weak patches inside
+def synthetic_ndvi(width, height, plants=40, seed=0):
+    rng = np.random.default_rng(seed)
+    ndvi = np.zeros((height, width), np.float32)
+    unit = min(width, height) / 1080
+    for _ in range(plants):
+        cx, cy = int(rng.uniform(0, width)), int(rng.uniform(0, height))
+        axes = (int(rng.uniform(40, 120) * unit), int(rng.uniform(40, 120) * unit))
+        cv2.ellipse(ndvi, (cx, cy), axes, 0, 0, 360, float(rng.uniform(0.5, 0.8)), -1)
+        for _ in range(int(rng.integers(0, 3))):
+            wx = cx + int(rng.uniform(-0.5, 0.5) * axes[0])
+            wy = cy + int(rng.uniform(-0.5, 0.5) * axes[1])
+            cv2.circle(ndvi, (wx, wy), int(rng.uniform(8, 20) * unit), 0.3, -1)
+    ndvi += rng.normal(0, 0.02, ndvi.shape).astype(np.float32)
+    return ndvi
+
+
+def _weak_pixels(shape, results):
+    mask = np.zeros(shape, np.uint8)
+    for _, weak_areas in results:
+        for x, y, w, h in weak_areas or ():
+            mask[y : y + h, x : x + w] = 1
+    return mask
+
+
+def benchmark_pyramid(
+    sizes=((1920, 1080), (3840, 2160)), scales=(0.5, 0.25), workers=4, repeat=3
+):
+    processor = NDVIProcessor()
+    for width, height in sizes:
+        ndvi = synthetic_ndvi(width, height)
+        runs = [("full", 1.0, 1)] + [("pyramid", s, 1) for s in scales]
+        runs += [("pyramid", s, workers) for s in scales]
+
+        reference = None
+        for mode, scale, threads in runs:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                results = processor.analyze_frame(
+                    ndvi, mode=mode, scale=scale, workers=threads
+                )
+            elapsed = (time.perf_counter() - start) / repeat
+
+            weak = _weak_pixels(ndvi.shape, results)
+            if reference is None:
+                reference, ref_time = weak, elapsed
+            union = np.count_nonzero(weak | reference)
+            iou = np.count_nonzero(weak & reference) / union if union else 1.0
+            print(
+                f"[BENCH] {width}x{height} {mode:<7} scale={scale:<4} "
+                f"threads={threads}: {elapsed * 1000:7.1f}ms "
+                f"({ref_time / elapsed:4.1f}x) regions={len(results):3d} "
+                f"weak-area IoU vs full={iou:.3f}"
+            )
+
+
+# Synthetic NDVI map with exactly `plants` separate plants laid out on a grid
+def synthetic_plant_grid(width, height, plants, seed=0):
+    rng = np.random.default_rng(seed)
+    ndvi = np.zeros((height, width), np.float32)
+    cols = int(np.ceil(np.sqrt(plants * width / height)))
+    rows = int(np.ceil(plants / cols))
+    cell_w, cell_h = width / cols, height / rows
+    for index in range(plants):
+        cx = int((index % cols + 0.5) * cell_w)
+        cy = int((index // cols + 0.5) * cell_h)
+        axes = (
+            int(cell_w * rng.uniform(0.25, 0.4)),
+            int(cell_h * rng.uniform(0.25, 0.4)),
+        )
+        cv2.ellipse(ndvi, (cx, cy), axes, 0, 0, 360, float(rng.uniform(0.5, 0.8)), -1)
+        if rng.random() < 0.6:
+            radius = max(2, int(min(axes) * rng.uniform(0.2, 0.4)))
+            cv2.circle(ndvi, (cx, cy), radius, 0.3, -1)
+    ndvi += rng.normal(0, 0.02, ndvi.shape).astype(np.float32)
+    return ndvi, int(cell_w * cell_h * 0.05)
+
+
+# Same statistics as region_stats, one bounding-box crop per plant
+def region_stats_loop(processor, ndvi_image, min_area, weak_threshold=0.3):
+    labels, stats, centroids, keep = processor.label_vegetation(
+        ndvi_image, min_area=min_area
+    )
+    adjusted_weak_threshold = min(weak_threshold + 0.1, 0.5)
+    plants = []
+    for label in keep:
+        x, y, w, h = stats[label, :4]
+        pixels = ndvi_image[y : y + h, x : x + w][labels[y : y + h, x : x + w] == label]
+        weak = (pixels > 0.2) & (pixels < adjusted_weak_threshold)
+        plants.append(
+            {
+                "bbox": (x, y, w, h),
+                "area": pixels.size,
+                "ndvi_mean": float(pixels.mean(dtype=np.float64)),
+                "ndvi_std": float(pixels.std(dtype=np.float64)),
+                "weak_fraction": np.count_nonzero(weak) / pixels.size,
+                "centroid": tuple(centroids[label]),
+            }
+        )
+    return plants
+
+
+def benchmark_region_stats(
+    size=(1920, 1080), counts=(10, 40, 160, 640, 2560), repeat=3
+):
+    processor = NDVIProcessor()
+    width, height = size
+    for plants in counts:
+        ndvi, min_area = synthetic_plant_grid(width, height, plants)
+
+        # Equivalence against the per-region loop
+        labels, fast = processor.region_stats(ndvi, min_area=min_area)
+        slow = region_stats_loop(processor, ndvi, min_area)
+        assert len(fast) == len(slow), f"{len(fast)} != {len(slow)} plants"
+        for a, b in zip(fast, slow):
+            assert a["bbox"] == tuple(int(v) for v in b["bbox"])
+            assert a["area"] == b["area"]
+            assert np.allclose(
+                [a[k] for k in ("ndvi_mean", "ndvi_std", "weak_fraction")],
+                [b[k] for k in ("ndvi_mean", "ndvi_std", "weak_fraction")],
+                atol=1e-6,
+            ), f"plant {a['label']} stats differ"
+            assert np.allclose(a["centroid"], b["centroid"])
+
+        timings = {}
+        for name, run in (
+            ("analyze_frame", lambda: processor.analyze_frame(ndvi, min_area=min_area)),
+            ("stats loop", lambda: region_stats_loop(processor, ndvi, min_area)),
+            ("region_stats", lambda: processor.region_stats(ndvi, min_area=min_area)),
+        ):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                run()
+            timings[name] = (time.perf_counter() - start) / repeat
+
+        # Storage: RLE label map vs raw array vs 16-bit PNG
+        values, lengths = rle_encode(labels)
+        assert np.array_equal(rle_decode(values, lengths, labels.shape), labels)
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer, shape=np.array(labels.shape), values=values, lengths=lengths
+        )
+        png = len(cv2.imencode(".png", labels.astype(np.uint16))[1])
+
+        base = timings["stats loop"]
+        print(
+            f"[BENCH] {width}x{height} plants={len(fast):4d}: "
+            + ", ".join(
+                f"{name} {seconds * 1000:6.1f}ms ({base / seconds:4.1f}x)"
+                for name, seconds in timings.items()
+            )
+        )
+        print(
+            f"[BENCH]   label map: raw {labels.nbytes // 1024} KB, "
+            f"{len(lengths)} runs, rle.npz {buffer.tell() / 1024:.1f} KB, "
+            f"png {png / 1024:.1f} KB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NDVIProcessor benchmarks")
+    parser.add_argument("bench", nargs="?", choices=["fused", "pyramid", "stats"])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.bench in (None, "fused"):
+        benchmark_fused(repeat=args.repeat)
+    if args.bench in (None, "pyramid"):
+        benchmark_pyramid(repeat=max(1, args.repeat // 3))
+    if args.bench in (None, "stats"):
+        benchmark_region_stats(repeat=max(1, args.repeat // 3))
@@ -0,0 +1,342 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+
+from file_utils import write_json
+from image_archive import DEFAULT_ZONES, parse_zones
+
+BINS = 256  # NDVI histogram over [-1, 1]: 0.0078 per bin
+PERCENTILES = (10, 50, 90)
+
+#! ---------------------------- SESSION AGGREGATE ----------------------------
+
+
+# * Per-zone NDVI statistics over every frame of a capture session, kept as
+# mergeable sums + a fixed histogram: one pass per frame, constant memory.
+# Only plant pixels count: NDVI above veg_threshold inside the detected regions.
+class SessionAggregator:
+    def __init__(self, zones=DEFAULT_ZONES, veg_threshold=0.2, weak_threshold=0.3):
+        self.zones = parse_zones(zones) if isinstance(zones, str) else list(zones)
+        self.names = [name for name, _, _ in self.zones]
+        self.veg_threshold = veg_threshold
+        self.weak_threshold = weak_threshold
+        size = len(self.zones) + 1  # last bucket: pixels outside every zone
+        self.hist = np.zeros((size, BINS), np.int64)
+        self.total = np.zeros(size)
+        self.total_sq = np.zeros(size)
+        self.region_px = np.zeros(size, np.int64)
+        self.weak_box_px = np.zeros(size, np.int64)
+        self.frames = 0
+        self._columns = {}
+
+    # Zone index of every image column (cached per frame width)
+    def _column_zones(self, width):
+        columns = self._columns.get(width)
+        if columns is None:
+            centres = (np.arange(width) + 0.5) / width
+            columns = np.full(width, len(self.zones), np.int64)
+            for i, (_, start, end) in reversed(list(enumerate(self.zones))):
+                columns[(centres >= start) & (centres < end)] = i
+            self._columns[width] = columns
+        return columns
+
+    def add_frame(self, ndvi, regions=None, weak_areas=()):
+        height, width = ndvi.shape
+        columns = self._column_zones(width)
+        mask = ndvi > self.veg_threshold
+        if regions is not None:
+            inside = np.zeros(ndvi.shape, bool)
+            for x, y, w, h in regions:
+                inside[y : y + h, x : x + w] = True
+                self._add_box(self.region_px, columns, x, w, h)
+            mask &= inside
+        for x, y, w, h in weak_areas or ():
+            self._add_box(self.weak_box_px, columns, x, w, h)
+
+        values = ndvi[mask]
+        zones = np.broadcast_to(columns, ndvi.shape)[mask]
+        bins = ((values + 1) * (BINS / 2)).astype(np.int64)
+        np.clip(bins, 0, BINS - 1, out=bins)
+        size = len(self.hist)
+        self.hist += np.bincount(zones * BINS + bins, minlength=size * BINS).reshape(
+            size, BINS
+        )
+        self.total += np.bincount(zones, weights=values, minlength=size)
+        self.total_sq += np.bincount(zones, weights=values * values, minlength=size)
+        self.frames += 1
+
+    # Box area split over the zones its columns fall into
+    @staticmethod
+    def _add_box(counter, columns, x, w, h):
+        counter += np.bincount(columns[x : x + w], minlength=len(counter)) * h
+
+    def merge(self, other):
+        self.hist += other.hist
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.region_px += other.region_px
+        self.weak_box_px += other.weak_box_px
+        self.frames += other.frames
+        return self
+
+    #! ---------------------------- SUMMARY ----------------------------
+
+    def zone_summary(self, index):
+        hist = self.hist[index]
+        count = int(hist.sum())
+        if count == 0:
+            return None
+        mean = self.total[index] / count
+        variance = max(0.0, self.total_sq[index] / count - mean * mean)
+        weak_bins = int((self.weak_threshold + 1) * (BINS / 2))
+        summary = {
+            "frames": self.frames,
+            "pixels": count,
+            "mean": round(float(mean), 4),
+            "std": round(float(np.sqrt(variance)), 4),
+            "weak_fraction": round(float(hist[:weak_bins].sum() / count), 4),
+        }
+        for p in PERCENTILES:
+            summary[f"p{p}"] = round(hist_percentile(hist, p), 4)
+        if self.region_px[index]:
+            summary["weak_area_fraction"] = round(
+                float(self.weak_box_px[index] / self.region_px[index]), 4
+            )
+        return summary
+
+    def summary(self):
+        result = {}
+        for index, name in enumerate(self.names):
+            zone = self.zone_summary(index)
+            if zone is not None:
+                result[name] = zone
+        return result
+
+
+# * Percentile from a histogram, interpolating inside the bin
+def hist_percentile(hist, p):
+    cumulative = np.cumsum(hist)
+    target = p / 100 * cumulative[-1]
+    index = int(np.searchsorted(cumulative, target))
+    before = cumulative[index - 1] if index else 0
+    inside = (target - before) / hist[index] if hist[index] else 0.0
+    return float((index + inside) * 2 / BINS - 1)
+
+
+#! ---------------------------- TRENDS ----------------------------
+
+
+# * Per zone and session (morning/evening light differs) daily summaries,
+# persisted as JSON; each new session is compared with the days before it.
+class TrendTracker:
+    def __init__(
+        self,
+        path=".config/ndvi_trends.json",
+        keep_days=60,
+        baseline_days=7,
+        min_days=3,
+        mean_drop=0.05,
+        weak_rise=0.10,
+        slope_per_day=-0.01,
+    ):
+        self.path = path
+        self.keep_days = keep_days
+        self.baseline_days = baseline_days
+        self.min_days = min_days
+        self.mean_drop = mean_drop
+        self.weak_rise = weak_rise
+        self.slope_per_day = slope_per_day
+        self.history = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.history = json.load(f)["history"]
+
+    def save(self):
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            write_json(self.path, {"version": 1, "history": self.history})
+
+    def series(self, zone, session):
+        return self.history.get(zone, {}).get(session, [])
+
+    # * Record one session's summary; returns the alerts it raised
+    def add(self, day, session, summary):
+        day = day.isoformat() if isinstance(day, date) else day
+        alerts = []
+        for zone, stats in summary.items():
+            series = self.history.setdefault(zone, {}).setdefault(session, [])
+            # Retention counts from the newest day: a backfill keeps later days
+            newest = max([day] + [e["day"] for e in series])
+            cutoff = (
+                date.fromisoformat(newest) - timedelta(days=self.keep_days)
+            ).isoformat()
+            # Same day captured twice: the latest session replaces it
+            kept = [e for e in series if e["day"] >= cutoff and e["day"] != day]
+            previous = [e for e in kept if e["day"] < day]
+            alert = self._check(zone, session, day, stats, previous)
+            if alert:
+                alerts.append(alert)
+            entry = {"day": day}
+            entry.update({k: stats[k] for k in ("mean", "p10", "p50", "p90")})
+            entry["weak_fraction"] = stats["weak_fraction"]
+            self.history[zone][session] = sorted(kept + [entry], key=lambda e: e["day"])
+        self.save()
+        return alerts
+
+    def _check(self, zone, session, day, stats, previous):
+        recent = previous[-self.baseline_days :]
+        if len(recent) < self.min_days:
+            return None
+        baseline = float(np.median([e["mean"] for e in recent]))
+        baseline_weak = float(np.median([e["weak_fraction"] for e in recent]))
+        slope = _slope(recent + [{"day": day, "mean": stats["mean"]}])
+
+        reasons = []
+        if stats["mean"] < baseline - self.mean_drop:
+            reasons.append("mean_drop")
+        if stats["weak_fraction"] > baseline_weak + self.weak_rise:
+            reasons.append("weak_rise")
+        # A slope over a handful of noisy days is meaningless: full window only
+        if slope < self.slope_per_day and len(recent) >= self.baseline_days:
+            reasons.append("downtrend")
+        if not reasons:
+            return None
+        return {
+            "zone": zone,
+            "session": session,
+            "day": day,
+            "reasons": reasons,
+            "mean": stats["mean"],
+            "baseline": round(baseline, 4),
+            "weak_fraction": stats["weak_fraction"],
+            "baseline_weak": round(baseline_weak, 4),
+            "slope_per_day": round(slope, 4),
+        }
+
+
+# Least-squares NDVI change per day over the entries
+def _slope(entries):
+    days = np.array([date.fromisoformat(e["day"]).toordinal() for e in entries], float)
+    means = np.array([e["mean"] for e in entries], float)
+    if len(entries) < 2 or np.ptp(days) == 0:
+        return 0.0
+    return float(np.polyfit(days - days[0], means, 1)[0])
+
+
+# * Session summary per zone (retained) + alerts on <topic>/alert
+def publish(client, topic, session, summary, alerts):
+    for zone, stats in summary.items():
+        payload = json.dumps({"session": session, **stats})
+        client.publish(f"{topic}/{zone}", payload, qos=1, retain=True)
+    for alert in alerts:
+        client.publish(f"{topic}/alert", json.dumps(alert), qos=1)
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+def _regions(ndvi, processor):
+    results = processor.analyze_frame(ndvi, min_area=2000)
+    regions = [region for region, _ in results]
+    weak = [area for _, areas in results for area in areas or ()]
+    return regions, weak
+
+
+# Baseline: keep every plant pixel of the session, np.percentile at the end
+def _collect_all(frames, zones, veg_threshold=0.2):
+    kept = {name: [] for name, _, _ in zones}
+    for ndvi, regions, _ in frames:
+        inside = np.zeros(ndvi.shape, bool)
+        for x, y, w, h in regions:
+            inside[y : y + h, x : x + w] = True
+        mask = inside & (ndvi > veg_threshold)
+        centres = (np.arange(ndvi.shape[1]) + 0.5) / ndvi.shape[1]
+        for name, start, end in zones:
+            band = (centres >= start) & (centres < end)
+            kept[name].append(ndvi[:, band][mask[:, band]].copy())
+    result = {}
+    for name, parts in kept.items():
+        values = np.concatenate(parts)
+        result[name] = {
+            "mean": float(values.mean()),
+            **{f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES},
+        }
+    return result
+
+
+def benchmark(sizes=((640, 480), (1920, 1080)), frames=15, sessions=4):
+    from ndvi_processor import NDVIProcessor, synthetic_ndvi
+
+    processor = NDVIProcessor()
+    zones = parse_zones(DEFAULT_ZONES)
+    for width, height in sizes:
+        clip = []
+        for seed in range(frames):
+            ndvi = synthetic_ndvi(width, height, seed=seed)
+            clip.append((ndvi, *_regions(ndvi, processor)))
+
+        for label in ("streaming", "collect all"):
+            tracemalloc.start()
+            start = time.perf_counter()
+            for _ in range(sessions):
+                if label == "streaming":
+                    aggregator = SessionAggregator(zones)
+                    for ndvi, regions, weak in clip:
+                        aggregator.add_frame(ndvi, regions, weak)
+                    result = aggregator.summary()
+                else:
+                    result = _collect_all(clip, zones)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            left = result["LEFT"]
+            print(
+                f"[BENCH] {width}x{height} {label:>11}: "
+                f"{sessions * frames / elapsed:6.1f} frames/s, peak +{peak / 1e6:6.1f}MB, "
+                f"LEFT mean={left['mean']:.4f} p10={left['p10']:.4f} p50={left['p50']:.4f}"
+            )
+
+
+# Three weeks of sessions, LEFT losing vigour from day 14: first alert day
+def simulate(days=21, degrade_from=14, path=None):
+    from ndvi_processor import synthetic_ndvi
+
+    tracker = TrendTracker(path=path)
+    start = date(2026, 5, 1)
+    for day in range(days):
+        ndvi = synthetic_ndvi(640, 480, seed=day)
+        if day >= degrade_from:
+            ndvi[:, :320] -= 0.03 * (day - degrade_from + 1)
+        aggregator = SessionAggregator()
+        aggregator.add_frame(ndvi)
+        alerts = tracker.add(
+            start + timedelta(days=day), "morning", aggregator.summary()
+        )
+        for alert in alerts:
+            print(f"[TREND] day {day}: {alert}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NDVI session stats and trends")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="throughput / memory on synthetic frames")
+    bench.add_argument("--frames", type=int, default=15)
+    sub.add_parser("simulate", help="degrading bed -> alerts")
+    show = sub.add_parser("show", help="print the stored daily series")
+    show.add_argument("--path", default=".config/ndvi_trends.json")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        benchmark(frames=args.frames)
+    elif args.command == "simulate":
+        simulate()
+    else:
+        for zone, sessions in TrendTracker(args.path).history.items():
+            for session, entries in sessions.items():
+                for entry in entries:
+                    print(f"[TREND] {zone} {session} {entry}")
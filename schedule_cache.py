@@ -0,0 +1,440 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from firebase_admin import db
+
+import metrics
+from file_utils import write_json
+
+#! ---------------------------- HELPERs ----------------------------
+
+
+# * Split a Firebase path into its non-empty segments
+def split_path(path):
+    return [part for part in path.strip("/").split("/") if part]
+
+
+# * Deepest path shared by every timer path (one GET covers all of them)
+def common_parent(paths):
+    parts = [split_path(p) for p in paths]
+    if not parts:
+        return "/"
+    common = []
+    for segments in zip(*parts):
+        if any(s != segments[0] for s in segments):
+            break
+        common.append(segments[0])
+    # A path can not be its own parent, otherwise we'd lose the leaf key
+    shortest = min(len(p) for p in parts)
+    if len(common) == shortest:
+        common = common[:-1]
+    return "/" + "/".join(common)
+
+
+def get_in(tree, segments):
+    node = tree
+    for seg in segments:
+        if not isinstance(node, dict) or seg not in node:
+            return None
+        node = node[seg]
+    return node
+
+
+def set_in(tree, segments, value):
+    if not segments:
+        return value
+    if not isinstance(tree, dict):
+        tree = {}
+    head, rest = segments[0], segments[1:]
+    child = set_in(tree.get(head), rest, value)
+    if child is None:
+        tree.pop(head, None)
+    else:
+        tree[head] = child
+    return tree
+
+
+#! ---------------------------- READ COUNTER ----------------------------
+
+
+class RateCounter:
+    def __init__(self, window=60.0):
+        self.window = window
+        self.total = 0
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def hit(self):
+        now = time.monotonic()
+        with self._lock:
+            self.total += 1
+            self._events.append(now)
+            self._trim(now)
+
+    def per_window(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            return len(self._events)
+
+    def _trim(self, now):
+        while self._events and now - self._events[0] > self.window:
+            self._events.popleft()
+
+
+#! ---------------------------- SCHEDULE CACHE ----------------------------
+
+
+# * Timers (and any other Firebase config paths) cached locally. With a
+# snapshot_path the last known tree is kept on disk: start() is served from it
+# instantly, offline included, and Firebase is synced in the background.
+class ScheduleCache:
+    def __init__(
+        self,
+        paths,
+        poll_interval=30.0,
+        use_listener=True,
+        reference=None,
+        snapshot_path=None,
+        retry_min=1.0,
+        retry_max=60.0,
+    ):
+        self.paths = list(paths)
+        self.root = common_parent(self.paths)
+        self.poll_interval = poll_interval
+        self.use_listener = use_listener
+        self.reference = reference or db.reference
+
+        self.remote_reads = RateCounter(60.0)
+
+        self._offsets = {
+            p: split_path(p)[len(split_path(self.root)) :] for p in self.paths
+        }
+        self._tree = None
+        self._etag = None
+        self._values = {p: None for p in self.paths}
+        self._lock = threading.Lock()
+        self._listener = None
+        self._poller = None
+        self._stop = threading.Event()
+        self._subscribers = []
+
+        self.snapshot_path = snapshot_path
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        # "snapshot" or "network": where the first usable schedule came from
+        self.source = None
+        # Seconds from start() to that first usable schedule
+        self.cold_start = None
+        # Set once Firebase has been read (the snapshot may be stale until then)
+        self.synced = threading.Event()
+        self._started = None
+        self._saved = None
+        self._save_lock = threading.Lock()
+        self._sync_thread = None
+        metrics.gauge(
+            "garden_schedule_synced",
+            "1 once the schedule has been read from Firebase",
+            lambda: int(self.synced.is_set()),
+        )
+
+    # * Snapshot on disk: serve it right away and sync in the background.
+    # Otherwise load every timer with ONE request (retried in the background
+    # while Firebase is unreachable), then keep it fresh.
+    def start(self):
+        self._started = time.perf_counter()
+        if self.load_snapshot():
+            self._mark_ready("snapshot")
+            self._start_sync()
+            return self
+        try:
+            self._connect()
+        except Exception as e:
+            print(f"[SCHEDULE] Firebase unreachable ({e}), syncing in the background")
+            self._start_sync()
+        return self
+
+    def _start_sync(self):
+        self._sync_thread = threading.Thread(
+            target=self._sync_loop, name="schedule-sync", daemon=True
+        )
+        self._sync_thread.start()
+
+    # First read, then the listener (or the ETag poller) keeps it fresh
+    def _connect(self):
+        self.refresh()
+        self._mark_ready("network")
+        # Saved before synced is set: waiters find the fresh snapshot on disk
+        self._save()
+        self.synced.set()
+        if self.use_listener:
+            try:
+                self.remote_reads.hit()
+                self._listener = self.reference(self.root).listen(self._on_event)
+                if self._stop.is_set():
+                    # stop() ran while the background sync was connecting
+                    self._listener.close()
+                    self._listener = None
+                    return
+                print(f"[SCHEDULE] Listening for changes on {self.root}")
+                return
+            except Exception as e:
+                print(f"[SCHEDULE] Listener unavailable ({e}), polling instead")
+        self._poller = threading.Thread(target=self._poll_loop, daemon=True)
+        self._poller.start()
+
+    def _sync_loop(self):
+        delay = self.retry_min
+        while not self._stop.is_set():
+            try:
+                self._connect()
+                return
+            except Exception as e:
+                print(f"[SCHEDULE] Sync failed ({e}), retrying in {delay:g}s")
+            if self._stop.wait(delay):
+                return
+            delay = min(delay * 2, self.retry_max)
+
+    def _mark_ready(self, source):
+        if self.source is not None:
+            return
+        self.source = source
+        self.cold_start = time.perf_counter() - self._started
+        metrics.gauge(
+            "garden_schedule_cold_start_seconds",
+            "start() to the first usable schedule",
+            source=source,
+        ).set(self.cold_start)
+        print(f"[SCHEDULE] Ready in {self.cold_start * 1000:.1f}ms from {source}")
+
+    def stop(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    # * Full reload of the timer subtree (also stores the ETag for polling).
+    # With the snapshot's ETag, an unchanged subtree is not downloaded again.
+    def refresh(self):
+        self.remote_reads.hit()
+        reference = self.reference(self.root)
+        if self._etag is not None:
+            changed, tree, etag = reference.get_if_changed(self._etag)
+            if not changed:
+                return False
+        else:
+            tree, etag = reference.get(etag=True)
+        with self._lock:
+            self._etag = etag
+            self._set_tree(tree)
+        return True
+
+    #! ---------------------------- SNAPSHOT ----------------------------
+
+    # * Last saved tree from disk (False: none, unreadable or not covering root)
+    def load_snapshot(self):
+        if not self.snapshot_path:
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f"[SCHEDULE] Ignoring unreadable {self.snapshot_path}: {e}")
+            return False
+        tree = get_in(data.get("tree"), split_path(self.root))
+        if tree is None:
+            return False
+        with self._lock:
+            # The ETag only describes the subtree it was read for
+            if data.get("root") == self.root:
+                self._etag = data.get("etag")
+            self._set_tree(tree)
+            self._saved = self._snapshot_text()
+        age = (time.time() - data.get("saved_at", time.time())) / 3600
+        print(f"[SCHEDULE] Loaded {self.snapshot_path} (saved {age:.1f}h ago)")
+        return True
+
+    # Under the lock. The tree is stored from "/" so a changed root (new
+    # config paths) can still reuse it
+    def _snapshot_text(self):
+        tree = set_in(None, split_path(self.root), self._tree)
+        return json.dumps(
+            {"root": self.root, "etag": self._etag, "tree": tree}, sort_keys=True
+        )
+
+    # * Persist the current tree (only when it changed since the last save)
+    def _save(self):
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            text = self._snapshot_text()
+        with self._save_lock:
+            if text == self._saved:
+                return
+            data = json.loads(text)
+            data["saved_at"] = round(time.time(), 3)
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            write_json(self.snapshot_path, data)
+            self._saved = text
+
+    # * Cached value of a timer path (no network)
+    def get(self, path):
+        with self._lock:
+            return self._values.get(path)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reads_per_minute(self):
+        return self.remote_reads.per_window()
+
+    # * Called with (path, old, new) every time a timer changes remotely
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    #! ---------------------------- INTERNALs ----------------------------
+
+    def _set_tree(self, tree):
+        self._tree = tree
+        changed = []
+        for path, offset in self._offsets.items():
+            value = get_in(tree, offset) if offset else tree
+            if self._values.get(path) != value:
+                changed.append((path, self._values.get(path), value))
+                self._values[path] = value
+        for path, old, new in changed:
+            print(f"[SCHEDULE] {path}: {old} -> {new}")
+            for callback in self._subscribers:
+                callback(path, old, new)
+
+    # Firebase streaming event: path is relative to self.root
+    def _on_event(self, event):
+        segments = split_path(event.path)
+        with self._lock:
+            tree = self._tree
+            if event.event_type == "put":
+                tree = set_in(tree, segments, event.data)
+            elif event.event_type == "patch" and isinstance(event.data, dict):
+                for key, value in event.data.items():
+                    tree = set_in(tree, segments + split_path(key), value)
+            else:
+                return
+            self._set_tree(tree)
+        self._save()
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.remote_reads.hit()
+                changed, tree, etag = self.reference(self.root).get_if_changed(
+                    self._etag
+                )
+                if changed:
+                    with self._lock:
+                        self._etag = etag
+                        self._set_tree(tree)
+                    self._save()
+            except Exception as e:
+                print(f"[SCHEDULE] Poll failed: {e}")
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+# Firebase stand-in with a per-request round trip, switchable offline
+class _Network:
+    def __init__(self, firebase, latency):
+        self.firebase = firebase
+        self.latency = latency
+        self.online = True
+
+    def reference(self, path="/"):
+        return _SlowReference(self, self.firebase.reference(path))
+
+
+class _SlowReference:
+    def __init__(self, network, reference):
+        self.network = network
+        self.reference = reference
+
+    def _request(self):
+        if not self.network.online:
+            raise ConnectionError("network unreachable")
+        time.sleep(self.network.latency)
+
+    def get(self, etag=False):
+        self._request()
+        return self.reference.get(etag=etag)
+
+    def get_if_changed(self, etag):
+        self._request()
+        return self.reference.get_if_changed(etag)
+
+    def listen(self, callback):
+        self._request()
+        return self.reference.listen(callback)
+
+
+# * Cold start (start() -> usable schedule) and time to the first Firebase
+# sync, with/without a snapshot and with/without the network at boot
+def benchmark(latency=0.8, outage=3.0):
+    import shutil
+    import tempfile
+
+    from sim_harness import TIMER_PATHS, FakeFirebase, synthetic_day
+
+    values = synthetic_day(interval=3600)["firebase"]
+    workdir = tempfile.mkdtemp(prefix="schedule_")
+    snapshot = os.path.join(workdir, "schedule.json")
+    try:
+        # A previous run leaves the snapshot behind
+        warm = ScheduleCache(
+            TIMER_PATHS,
+            reference=FakeFirebase(values).reference,
+            snapshot_path=snapshot,
+        ).start()
+        warm.stop()
+
+        for online in (True, False):
+            for path in (None, snapshot):
+                network = _Network(FakeFirebase(values), latency)
+                network.online = online
+                cache = ScheduleCache(
+                    TIMER_PATHS,
+                    reference=network.reference,
+                    snapshot_path=path,
+                    retry_min=0.25,
+                )
+                started = time.perf_counter()
+                if not online:
+                    threading.Timer(outage, setattr, (network, "online", True)).start()
+                cache.start()
+                returned = time.perf_counter() - started
+                cache.synced.wait(outage + 10 * latency + 5)
+                synced = time.perf_counter() - started
+                while cache.cold_start is None:
+                    time.sleep(0.01)
+                cache.stop()
+                print(
+                    f"[BENCH] network {'up  ' if online else 'down'} at boot, "
+                    f"{'snapshot   ' if path else 'no snapshot'}: "
+                    f"schedule usable after {cache.cold_start * 1000:7.1f}ms "
+                    f"({cache.source}), start() returned {returned * 1000:7.1f}ms, "
+                    f"synced {synced:.2f}s, {cache.remote_reads.total} reads"
+                )
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schedule cache cold start")
+    parser.add_argument("--latency", type=float, default=0.8, help="s per request")
+    parser.add_argument("--outage", type=float, default=3.0, help="s offline at boot")
+    args = parser.parse_args()
+    benchmark(args.latency, args.outage)
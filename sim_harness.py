@@ -0,0 +1,487 @@
+import argparse
+import copy
+import json
+import logging
+import math
+import random
+import sys
+import time
+from datetime import datetime
+
+from control_engine import ControlEngine
+from latency import LatencyStats
+from mqtt_controller import BenchMessage, MQTTController
+from schedule_cache import get_in, set_in, split_path
+from topic_router import topic_matches
+from zone_rules import default_zones
+
+# Topic / path names used by synthetic traces (a recorded trace brings its own)
+SENSOR_TOPICS = [
+    "Water/Quantity",
+    "Soil/Moisture_LEFT",
+    "Soil/Moisture_RIGHT",
+    "DHT11/Temperature",
+    "DHT11/Humidity",
+]
+ACTUATORS = {
+    "pump_left": "Pump/LEFT",
+    "pump_right": "Pump/RIGHT",
+    "lights": "Lights",
+    "fans": "Fans",
+}
+TIMER_PATHS = [
+    "/timers/pumps/on",
+    "/timers/pumps/off",
+    "/timers/lights/on",
+    "/timers/lights/off",
+    "/timers/fans/on",
+    "/timers/fans/off",
+]
+
+#! ---------------------------- FAKEs ----------------------------
+
+
+class SimClock:
+    def __init__(self, start):
+        self.t = start
+
+    def time(self):
+        return self.t
+
+    def now(self):
+        return datetime.fromtimestamp(self.t)
+
+    def advance_to(self, t):
+        self.t = max(self.t, t)
+
+
+# * paho-style client + broker in one: keeps the subscriptions, delivers
+# injected messages to on_message and records every publish on the sim clock
+class FakeMQTTClient:
+    def __init__(self, clock):
+        self.clock = clock
+        self.on_message = None
+        self.filters = []
+        self.published = []
+
+    def connect(self, host=None, port=None, keepalive=None):
+        return 0
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def subscribe(self, topic, qos=0):
+        self.filters.append(topic)
+        return 0, len(self.filters)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published.append((self.clock.time(), topic, str(payload)))
+
+    def deliver(self, topic, payload):
+        if self.on_message is None:
+            return False
+        if not any(topic_matches(f, topic) for f in self.filters):
+            return False
+        self.on_message(self, None, BenchMessage(topic, payload))
+        return True
+
+
+class FakeEvent:
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class FakeListener:
+    def __init__(self, database, root, callback):
+        self.database = database
+        self.root = root
+        self.callback = callback
+
+    def close(self):
+        if self in self.database.listeners:
+            self.database.listeners.remove(self)
+
+
+class FakeReference:
+    def __init__(self, database, path):
+        self.database = database
+        self.path = path
+
+    def get(self, etag=False):
+        self.database.reads += 1
+        value = copy.deepcopy(get_in(self.database.tree, split_path(self.path)))
+        return (value, str(self.database.version)) if etag else value
+
+    def get_if_changed(self, etag):
+        value, current = self.get(etag=True)
+        return current != etag, value, current
+
+    def listen(self, callback):
+        listener = FakeListener(self.database, split_path(self.path), callback)
+        self.database.listeners.append(listener)
+        return listener
+
+
+# * In-memory Realtime Database: .reference(path) like firebase_admin.db,
+# set() pushes "put" events to the listeners above the changed path
+class FakeFirebase:
+    def __init__(self, values=None):
+        self.tree = {}
+        self.version = 0
+        self.reads = 0
+        self.listeners = []
+        for path, value in (values or {}).items():
+            self.tree = set_in(self.tree, split_path(path), value)
+
+    def reference(self, path="/"):
+        return FakeReference(self, path)
+
+    def set(self, path, value):
+        segments = split_path(path)
+        self.tree = set_in(self.tree, segments, copy.deepcopy(value))
+        self.version += 1
+        for listener in list(self.listeners):
+            if segments[: len(listener.root)] == listener.root:
+                relative = "/" + "/".join(segments[len(listener.root) :])
+                listener.callback(FakeEvent("put", relative, copy.deepcopy(value)))
+
+
+#! ---------------------------- TRACES ----------------------------
+
+
+# A trace: {"start", "end", "firebase": {path: value}, "events": [...]}, events
+# {"t", "topic", "payload"} (MQTT) or {"t", "firebase", "value"} (timer edit)
+def save_trace(trace, path):
+    with open(path, "w") as f:
+        header = {k: v for k, v in trace.items() if k != "events"}
+        f.write(json.dumps(header) + "\n")
+        for event in trace["events"]:
+            f.write(json.dumps(event) + "\n")
+
+
+def load_trace(path):
+    with open(path) as f:
+        trace = json.loads(f.readline())
+        trace["events"] = [json.loads(line) for line in f if line.strip()]
+    return trace
+
+
+# * A day of greenhouse traffic: every sensor each `interval` seconds, soil
+# drying out and getting watered, a timer moved in the afternoon, a bit of noise
+def synthetic_day(start=None, interval=5.0, seed=0):
+    rng = random.Random(seed)
+    start = start or datetime(2026, 6, 1).timestamp()
+    timers = dict(
+        zip(TIMER_PATHS, ["06:00", "06:20", "07:00", "19:00", "12:00", "16:00"])
+    )
+    events = []
+    moisture = {"LEFT": 58.0, "RIGHT": 50.0}
+    water = 100.0
+    steps = int(86400 / interval)
+    for step in range(steps):
+        # Half-interval offset: sensor messages never tie with timer minutes
+        t = start + step * interval + interval / 2
+        hour = (t - start) / 3600
+        for bed, rate in (("LEFT", 0.0012), ("RIGHT", 0.0009)):
+            moisture[bed] -= rate * interval * (1 + 0.5 * math.sin(hour / 24 * 6.28))
+            if moisture[bed] < 30 + rng.random() * 4:
+                moisture[bed] = 65 + rng.random() * 5  # watered
+        water = max(0.0, water - 0.0002 * interval)
+        values = {
+            "Water/Quantity": water,
+            "Soil/Moisture_LEFT": moisture["LEFT"] + rng.gauss(0, 0.3),
+            "Soil/Moisture_RIGHT": moisture["RIGHT"] + rng.gauss(0, 0.3),
+            "DHT11/Temperature": 24 + 6 * math.sin((hour - 9) / 24 * 6.28),
+            "DHT11/Humidity": 70 - 15 * math.sin((hour - 9) / 24 * 6.28),
+        }
+        for topic in SENSOR_TOPICS:
+            payload = f"{values[topic]:.1f}"
+            if rng.random() < 0.0005:
+                payload = "nan?"  # flaky sensor
+            events.append({"t": t, "topic": topic, "payload": payload})
+    events.append(
+        {"t": start + 13 * 3600 + 7, "firebase": "/timers/fans/off", "value": "15:30"}
+    )
+    events.sort(key=lambda e: e["t"])
+    return {"start": start, "end": start + 86400, "firebase": timers, "events": events}
+
+
+# * Record live traffic (sensor topics from the real broker) into a trace
+def record(path, duration, host, port, keep_alive, topics, header=None):
+    from mqtt_client import make_client
+
+    start = time.time()
+    events = []
+    client = make_client()
+
+    def on_message(client, userdata, msg):
+        payload = msg.payload.decode("utf-8", "replace")
+        events.append({"t": time.time(), "topic": msg.topic, "payload": payload})
+
+    client.on_message = on_message
+    client.connect(host, port, keep_alive)
+    for topic in topics:
+        client.subscribe(topic)
+    client.loop_start()
+    try:
+        time.sleep(duration)
+    except KeyboardInterrupt:
+        pass
+    client.loop_stop()
+    trace = dict(header or {}, start=start, end=time.time(), events=events)
+    trace.setdefault("sensor_topics", list(topics))
+    save_trace(trace, path)
+    return len(events)
+
+
+#! ---------------------------- REPLAY ----------------------------
+
+
+class Replay:
+    def __init__(self, trace, mode="engine"):
+        self.trace = trace
+        self.mode = mode
+        self.clock = SimClock(trace["start"])
+        self.client = FakeMQTTClient(self.clock)
+        self.firebase = FakeFirebase(trace.get("firebase"))
+        self.timer_paths = trace.get("timer_paths", TIMER_PATHS)
+        self.actuators = trace.get("actuators", ACTUATORS)
+        self.topics = (
+            self.actuators["pump_left"],
+            self.actuators["pump_right"],
+            self.actuators["lights"],
+            self.actuators["fans"],
+        )
+
+        # Offline controller: no broker, no Firebase app, simulated wall clock
+        self.controller = MQTTController(None, None, None, None, None, self.client)
+        self.controller.now = self.clock.now
+        self.controller.load_rules(default_zones(*self.topics[:2]))
+        self.controller.subscribe_to_topics(trace.get("sensor_topics", SENSOR_TOPICS))
+        self.controller.start_schedule(
+            self.timer_paths, reference=self.firebase.reference
+        )
+
+        self.engine = None
+        if mode == "engine":
+            self.engine = ControlEngine(
+                self.controller, *self.topics, self.timer_paths, now=self.clock.now
+            ).attach()
+            # Periodic stats run on the real clock: not part of a replay
+            self.engine.scheduler.cancel("stats")
+        self.messages = 0
+        self.elapsed = None
+
+    # * Feed the whole trace; speed=None runs as fast as possible,
+    # speed=1000 paces the replay at 1000x real time
+    def run(self, speed=None):
+        events = self.trace["events"]
+        wall_start = time.perf_counter()
+        tick = math.floor(self.trace["start"])
+        for event in events:
+            t = event["t"]
+            if speed:
+                delay = wall_start + (t - self.trace["start"]) / speed
+                delay -= time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            tick = self._advance(t, tick)
+            if "firebase" in event:
+                self.firebase.set(event["firebase"], event["value"])
+            else:
+                self.client.deliver(event["topic"], event["payload"].encode())
+                self.messages += 1
+        self._advance(self.trace["end"], tick)
+        self.elapsed = time.perf_counter() - wall_start
+        return self
+
+    # Run everything that happens on the clock up to `t`
+    def _advance(self, t, tick):
+        if self.engine is not None:
+            scheduler = self.engine.scheduler
+            while True:
+                deadline = scheduler.next_deadline()
+                if deadline is None or deadline > t:
+                    break
+                self.clock.advance_to(deadline)
+                for key, _, callback in scheduler.pop_due(deadline):
+                    callback(key)
+        else:
+            # The original main loop: pumps + timers once per second
+            while tick + 1 <= t:
+                tick += 1
+                self.clock.advance_to(tick)
+                self._poll()
+        self.clock.advance_to(t)
+        return tick
+
+    def _poll(self):
+        self.controller.control_pumps(*self.topics[:2])
+        self.controller.check_timer_and_publish(*self.topics, *self.timer_paths)
+
+    def commands(self):
+        return [(topic, payload) for _, topic, payload in self.client.published]
+
+    def report(self):
+        latency = self.engine.latency.summary() if self.engine else "n/a (1s poll)"
+        return {
+            "mode": self.mode,
+            "messages": self.messages,
+            "commands": len(self.client.published),
+            "seconds": round(self.elapsed, 3),
+            "msg_per_s": round(self.messages / self.elapsed),
+            "speedup": round((self.trace["end"] - self.trace["start"]) / self.elapsed),
+            "decision_latency": latency,
+            "firebase_reads": self.firebase.reads,
+            "malformed": self.controller.malformed_payloads,
+        }
+
+
+# * First difference between two command sequences, or None
+def diff_commands(expected, actual):
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        if tuple(want) != tuple(got):
+            return i, tuple(want), tuple(got)
+    if len(expected) != len(actual):
+        i = min(len(expected), len(actual))
+        missing = expected[i] if i < len(expected) else None
+        extra = actual[i] if i < len(actual) else None
+        return i, missing, extra
+    return None
+
+
+def replay(trace, mode="engine", speed=None, quiet=True):
+    # The controller prints every command; keep the benchmark output readable
+    stdout = sys.stdout
+    if quiet:
+        sys.stdout = _Discard()
+    try:
+        return Replay(trace, mode).run(speed)
+    finally:
+        sys.stdout = stdout
+
+
+class _Discard:
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+#! ---------------------------- BENCHMARK SUITE ----------------------------
+
+
+def benchmark(speed=1000, slice_hours=1.0):
+    trace = synthetic_day()
+    runs = {}
+    for mode in ("engine", "poll"):
+        runs[mode] = replay(trace, mode)
+        print(f"[SIM] {runs[mode].report()}")
+
+    mismatch = diff_commands(runs["poll"].commands(), runs["engine"].commands())
+    print(
+        f"[SIM] engine vs poll command sequence: "
+        f"{'identical' if mismatch is None else f'differs at {mismatch}'} "
+        f"({len(runs['engine'].commands())} commands)"
+    )
+
+    # Determinism: the same trace twice gives the same commands at the same times
+    again = replay(trace, "engine")
+    same = again.client.published == runs["engine"].client.published
+    print(f"[SIM] engine replay deterministic: {same}")
+
+    # Paced replay of an hour with pump activity (03:30-04:30) at `speed`x
+    start = trace["start"] + 3.5 * 3600
+    end = start + slice_hours * 3600
+    events = [e for e in trace["events"] if start <= e["t"] < end]
+    paced = replay(dict(trace, start=start, end=end, events=events), speed=speed)
+    report = paced.report()
+    print(
+        f"[SIM] {slice_hours:g}h at {speed:g}x: {report['seconds']}s wall "
+        f"(target {slice_hours * 3600 / speed:.2f}s), {report['commands']} commands, "
+        f"latency {report['decision_latency']}"
+    )
+
+    # Raw throughput of the decision path, no pacing, larger trace
+    latency = LatencyStats()
+    for seed in range(3):
+        run = replay(synthetic_day(seed=seed, interval=1.0), "engine")
+        latency.add(run.elapsed / run.messages)
+    print(
+        f"[SIM] throughput: {1 / latency.percentiles((50,))[50] * 1000:,.0f} msg/s "
+        f"(median of 3 days at 1s sensor interval)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay/load-test the MQTT controller")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="write a synthetic day trace")
+    gen.add_argument("trace")
+    gen.add_argument("--interval", type=float, default=5.0)
+    gen.add_argument("--seed", type=int, default=0)
+    rec = sub.add_parser("record", help="record live sensor traffic (uses .env)")
+    rec.add_argument("trace")
+    rec.add_argument("--seconds", type=float, default=3600)
+    run = sub.add_parser("replay")
+    run.add_argument("trace")
+    run.add_argument("--mode", choices=["engine", "poll"], default="engine")
+    run.add_argument("--speed", type=float, help="e.g. 1000 = 1000x real time")
+    run.add_argument("--save-commands", help="write the command sequence (golden)")
+    run.add_argument("--expect", help="golden command sequence to assert against")
+    run.add_argument("-v", "--verbose", action="store_true")
+    bench = sub.add_parser("bench")
+    bench.add_argument("--speed", type=float, default=1000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.command == "generate":
+        trace = synthetic_day(interval=args.interval, seed=args.seed)
+        save_trace(trace, args.trace)
+        print(f"[SIM] {len(trace['events'])} events -> {args.trace}")
+    elif args.command == "record":
+        import main_mqtt  # loads .env
+
+        # Timer values are not recorded: set "firebase" in the header to replay them
+        header = {
+            "timer_paths": main_mqtt.TIMER_PATHS,
+            "actuators": {
+                "pump_left": main_mqtt.TOPIC_PUMP_LEFT,
+                "pump_right": main_mqtt.TOPIC_PUMP_RIGHT,
+                "lights": main_mqtt.TOPIC_LIGHTS,
+                "fans": main_mqtt.TOPIC_FANS,
+            },
+            "firebase": {},
+        }
+        count = record(
+            args.trace,
+            args.seconds,
+            main_mqtt.MQTT_HOST,
+            main_mqtt.MQTT_POST,
+            main_mqtt.KEEP_ALIVE,
+            main_mqtt.TOPICS_SENSOR,
+            header,
+        )
+        print(f"[SIM] recorded {count} messages -> {args.trace}")
+    elif args.command == "replay":
+        result = replay(load_trace(args.trace), args.mode, args.speed, not args.verbose)
+        print(f"[SIM] {result.report()}")
+        if args.save_commands:
+            with open(args.save_commands, "w") as f:
+                json.dump(result.client.published, f)
+        if args.expect:
+            with open(args.expect) as f:
+                expected = [(topic, payload) for _, topic, payload in json.load(f)]
+            mismatch = diff_commands(expected, result.commands())
+            if mismatch is not None:
+                print(f"[SIM] FAIL: command #{mismatch[0]}: {mismatch[1:]}")
+                sys.exit(1)
+            print(f"[SIM] OK: {len(expected)} commands match {args.expect}")
+    else:
+        benchmark(args.speed)
@@ -0,0 +1,441 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+import metrics
+
+#! ---------------------------- /proc HELPERs ----------------------------
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def _status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+# * Proportional set size: shared libraries split between the processes using them
+def pss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return _status_kb(pid, "VmRSS")
+
+
+def rss_kb(pid="self"):
+    return _status_kb(pid, "VmRSS")
+
+
+# CPU seconds of one thread (utime + stime), readable from any other thread
+def thread_cpu(native_id):
+    try:
+        with open(f"/proc/self/task/{native_id}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def process_tree(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+#! ---------------------------- WORKER ----------------------------
+
+
+class Worker:
+    def __init__(
+        self, name, target, stats=None, stop=None, backoff_min=1.0, backoff_max=60.0
+    ):
+        self.name = name
+        self.target = target
+        self.stats_fn = stats
+        # Makes a running target() return (its own cleanup then runs)
+        self.stop_fn = stop
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+
+        self.native_id = None
+        self.thread = None
+        self.state = "stopped"
+        self.starts = 0
+        self.crashes = 0
+        self.last_error = None
+        self.started_at = None
+        self._stop = threading.Event()
+        self._cpu_mark = (0.0, time.monotonic())
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    # * No more restarts, and ask the running target to return
+    def stop(self):
+        self._stop.set()
+        if self.stop_fn is not None:
+            try:
+                self.stop_fn()
+            except Exception as e:
+                print(f"[SUPERVISOR] stopping {self.name}: {type(e).__name__}: {e}")
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+            return not self.thread.is_alive()
+        return True
+
+    # * Run the target; restart it with backoff when it crashes or returns
+    def _run(self):
+        self.native_id = threading.get_native_id()
+        delay = self.backoff_min
+        while not self._stop.is_set():
+            self.state = "running"
+            self.starts += 1
+            self.started_at = time.monotonic()
+            try:
+                self.target()
+                print(f"[SUPERVISOR] {self.name} exited")
+            except Exception as e:
+                self.crashes += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"[SUPERVISOR] {self.name} crashed:")
+                traceback.print_exc()
+
+            if self._stop.is_set():
+                break
+            # A worker that stayed up for a while starts over with a short delay
+            if time.monotonic() - self.started_at > self.backoff_max:
+                delay = self.backoff_min
+            self.state = "backoff"
+            print(f"[SUPERVISOR] restarting {self.name} in {delay:.0f}s")
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.backoff_max)
+        self.state = "stopped"
+
+    def stats(self):
+        cpu = thread_cpu(self.native_id) if self.native_id else 0.0
+        now = time.monotonic()
+        last_cpu, last_time = self._cpu_mark
+        self._cpu_mark = (cpu, now)
+        stats = {
+            "state": self.state,
+            "restarts": max(0, self.starts - 1),
+            "crashes": self.crashes,
+            "cpu_s": round(cpu, 1),
+            "cpu_pct": round(100 * (cpu - last_cpu) / max(now - last_time, 1e-6), 1),
+        }
+        if self.last_error:
+            stats["last_error"] = self.last_error
+        if self.stats_fn is not None:
+            try:
+                stats.update(self.stats_fn() or {})
+            except Exception as e:
+                stats["stats_error"] = str(e)
+        return stats
+
+
+#! ---------------------------- SUPERVISOR ----------------------------
+
+
+class Supervisor:
+    def __init__(self, stats_interval=60.0):
+        self.stats_interval = stats_interval
+        self.workers = {}
+        self.started_at = time.monotonic()
+        self._stop = threading.Event()
+
+    def add(self, name, target, stats=None, stop=None):
+        worker = self.workers[name] = Worker(name, target, stats, stop)
+        metrics.counter(
+            "garden_worker_starts_total",
+            "Worker (re)starts",
+            lambda: worker.starts,
+            worker=name,
+        )
+        metrics.counter(
+            "garden_worker_crashes_total",
+            "Worker crashes",
+            lambda: worker.crashes,
+            worker=name,
+        )
+        return worker
+
+    def start(self):
+        for worker in self.workers.values():
+            worker.start()
+        return self
+
+    # * Stop every worker, then wait for their cleanup (flushes, closes)
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        for worker in self.workers.values():
+            worker.stop()
+        deadline = time.monotonic() + timeout
+        for name, worker in self.workers.items():
+            if not worker.join(max(0.0, deadline - time.monotonic())):
+                print(f"[SUPERVISOR] {name} did not stop within {timeout:.0f}s")
+
+    def stats(self):
+        return {
+            "rss_mb": round(rss_kb() / 1024, 1),
+            "threads": threading.active_count(),
+            "workers": {name: w.stats() for name, w in self.workers.items()},
+        }
+
+    def report(self):
+        stats = self.stats()
+        print(f"[SUPERVISOR] rss={stats['rss_mb']}MB threads={stats['threads']}")
+        for name, worker in stats["workers"].items():
+            print(f"[SUPERVISOR]   {name}: {worker}")
+
+    # Signals only set the flag: workers are stopped and joined from here
+    def run_forever(self):
+        signal.signal(signal.SIGTERM, lambda *_: self._stop.set())
+        signal.signal(signal.SIGINT, lambda *_: self._stop.set())
+        while not self._stop.wait(self.stats_interval):
+            self.report()
+        self.stop()
+        self.report()
+
+
+#! ---------------------------- GARDEN STACK ----------------------------
+
+
+def _reader_stats(grabber, name):
+    def stats():
+        reader = grabber.readers.get(name)
+        return {"loop": reader.stats()} if reader is not None else {}
+
+    return stats
+
+
+def _engine_stats():
+    import main_mqtt
+
+    engine = main_mqtt.engine
+    if engine is None:
+        return {}
+    return {"evaluations": engine.evaluations, "latency": engine.latency.summary()}
+
+
+# * main_mqtt + face_recog_door + take_pics as threads of one process:
+# one MQTT connection and one camera owner shared by the door and NDVI workers.
+# The camera is a worker too: when it fails it is reopened with backoff, and
+# the door / NDVI workers resume on the same grabber.
+def build_garden(supervisor, names=("mqtt", "door", "ndvi")):
+    # No OpenCV windows from worker threads
+    os.environ.setdefault("HEADLESS", "1")
+    import main_mqtt  # loads .env
+    from camera_capture import FrameGrabber
+    from mqtt_client import make_client
+
+    client = make_client()
+    client.connect(main_mqtt.MQTT_HOST, main_mqtt.MQTT_POST, main_mqtt.KEEP_ALIVE)
+    client.loop_start()
+    # One registry / endpoint for the three workers of this process
+    metrics.start(client)
+
+    grabber = None
+    if "door" in names or "ndvi" in names:
+        camera = int(os.getenv("CAMERA_INDEX", "2"))
+        grabber = FrameGrabber(camera, name="camera")
+        supervisor.add("camera", grabber.run, grabber.stats, grabber.stop)
+
+    if "mqtt" in names:
+        supervisor.add(
+            "mqtt",
+            lambda: main_mqtt.main(client=client),
+            _engine_stats,
+            main_mqtt.stop,
+        )
+    if "door" in names:
+        import face_recog_door
+
+        supervisor.add(
+            "door",
+            lambda: face_recog_door.main(grabber=grabber, mqtt=client),
+            _reader_stats(grabber, "door"),
+            face_recog_door.stop,
+        )
+    if "ndvi" in names:
+        import take_pics
+
+        supervisor.add(
+            "ndvi",
+            lambda: take_pics.main(grabber=grabber, mqtt=client),
+            _reader_stats(grabber, "ndvi"),
+            take_pics.stop,
+        )
+    return client, grabber
+
+
+#! ---------------------------- COMPARISON ----------------------------
+
+
+# Start command(s), wait for every "[READY] <name>" line, then sample memory
+def _measure(commands, expected, duration):
+    start = time.monotonic()
+    procs = [
+        subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+        )
+        for cmd in commands
+    ]
+    ready, lock = {}, threading.Lock()
+
+    def watch(proc):
+        for line in proc.stdout:
+            if line.startswith("[READY]"):
+                with lock:
+                    ready.setdefault(line.split()[1], time.monotonic() - start)
+
+    for proc in procs:
+        threading.Thread(target=watch, args=(proc,), daemon=True).start()
+
+    deadline = start + duration
+    peak_rss = peak_pss = 0
+    while time.monotonic() < deadline:
+        pids = [pid for proc in procs for pid in process_tree(proc.pid)]
+        peak_rss = max(peak_rss, sum(rss_kb(pid) for pid in pids))
+        peak_pss = max(peak_pss, sum(pss_kb(pid) for pid in pids))
+        time.sleep(0.5)
+
+    for proc in procs:
+        for pid in reversed(process_tree(proc.pid)):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        proc.wait(10)
+    startup = max(ready.values()) if set(ready) >= set(expected) else None
+    return startup, peak_rss / 1024, peak_pss / 1024, sorted(ready)
+
+
+def compare(duration):
+    python = sys.executable
+    names = ["mqtt", "door", "ndvi"]
+    scripts = ["main_mqtt.py", "face_recog_door.py", "take_pics.py"]
+    rows = [
+        ("run_scripts.sh", [[python, script] for script in scripts]),
+        ("supervisor", [[python, __file__, "--stats-interval", "3600"]]),
+    ]
+    for label, commands in rows:
+        startup, rss, pss, ready = _measure(commands, names, duration)
+        startup = f"{startup:.1f}s" if startup is not None else f"n/a (ready: {ready})"
+        print(
+            f"[COMPARE] {label:>14}: startup {startup}, "
+            f"peak RSS {rss:.0f}MB, peak PSS {pss:.0f}MB"
+        )
+
+
+#! ---------------------------- SELF-CHECK ----------------------------
+
+
+def _selftest(seconds=5):
+    from camera_capture import FakeFrameSource, FrameGrabber
+
+    supervisor = Supervisor(stats_interval=seconds)
+    crashes = {"left": 2}
+    stopping = threading.Event()
+    cleaned = []
+
+    def flaky():
+        time.sleep(0.2)
+        if crashes["left"]:
+            crashes["left"] -= 1
+            raise RuntimeError("simulated crash")
+        stopping.wait(seconds * 2)
+        cleaned.append("flaky")
+
+    def busy():
+        end = time.monotonic() + seconds * 2
+        while time.monotonic() < end and not stopping.is_set():
+            sum(range(10000))
+        cleaned.append("busy")
+
+    # A camera that dies every 50 frames: restarted, the reader keeps going
+    grabber = FrameGrabber(FakeFrameSource(64, 48, fps=100, limit=50))
+    original_run = grabber.run
+
+    def camera():
+        grabber.source.count = 0
+        original_run()
+
+    reader = grabber.reader("consumer")
+
+    def consumer():
+        while not stopping.is_set():
+            ok, _ = reader.read(timeout=0.5)
+            if not ok and grabber.ended:
+                return
+
+    supervisor.add("camera", camera, grabber.stats, grabber.stop)
+    supervisor.add("consumer", consumer, reader.stats, stopping.set)
+    supervisor.add("flaky", flaky, stop=stopping.set)
+    supervisor.add("busy", busy, stop=stopping.set)
+    for worker in supervisor.workers.values():
+        worker.backoff_min = 0.1
+    supervisor.start()
+    time.sleep(seconds)
+    supervisor.report()
+    start = time.monotonic()
+    supervisor.stop()
+    print(
+        f"[SUPERVISOR] stopped in {time.monotonic() - start:.2f}s, "
+        f"cleanup ran for {sorted(cleaned)}, camera frames {grabber.frames_captured}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the garden workers")
+    parser.add_argument("--workers", default="mqtt,door,ndvi")
+    parser.add_argument("--stats-interval", type=float, default=60.0)
+    parser.add_argument(
+        "--compare",
+        type=float,
+        metavar="SECONDS",
+        help="measure startup/memory against run_scripts.sh-style processes",
+    )
+    parser.add_argument("--selftest", action="store_true")
+    args = parser.parse_args()
+
+    if args.selftest:
+        _selftest()
+    elif args.compare:
+        compare(args.compare)
+    else:
+        supervisor = Supervisor(stats_interval=args.stats_interval)
+        client, grabber = build_garden(supervisor, args.workers.split(","))
+        supervisor.start().run_forever()
+        client.loop_stop()
@@ -1,48 +1,114 @@
 import os
 import signal
-import subprocess
 import sys
+import threading
 import time
 from datetime import datetime
 
 import cv2
-import numpy as np
 
+import metrics
+from camera_capture import FrameGrabber
+from image_archive import ImageArchive, ndvi_stats
+from image_server import ImageServer
+from image_writer import ImageWriter
+from latency import LatencyStats
+from mqtt_client import make_client
 from ndvi_processor import NDVIProcessor
+from ndvi_trends import SessionAggregator, TrendTracker, publish
 
-# Cấu hình thư mục lưu ảnh
+# Cấu hình thư mục lưu ảnh: data/archive/<ngày>/<buổi>/ + chỉ mục SQLite.
+# today_morning / today_evening / yesterday là symlink vào kho lưu trữ.
 BASE_DIR = "data"
-MORNING_DIR = os.path.join(BASE_DIR, "today_morning")
-EVENING_DIR = os.path.join(BASE_DIR, "today_evening")
-YESTERDAY_DIR = os.path.join(BASE_DIR, "yesterday")
+ARCHIVE_DIR = os.path.join(BASE_DIR, "archive")
+HTTP_PORT = int(os.getenv("HTTP_PORT", "8080"))
 
-# Tạo thư mục nếu chưa tồn tại
-os.makedirs(MORNING_DIR, exist_ok=True)
-os.makedirs(EVENING_DIR, exist_ok=True)
-os.makedirs(YESTERDAY_DIR, exist_ok=True)
+# Camera USB (có thể thay đổi nếu cần)
+CAMERA_INDEX = int(os.getenv("CAMERA_INDEX", "2"))
+
+# Chế độ NDVI: "full" (toàn ảnh) hoặc "pyramid" (dò vùng trên ảnh thu nhỏ)
+NDVI_MODE = os.getenv("NDVI_MODE", "full")
+NDVI_PYRAMID_SCALE = float(os.getenv("NDVI_PYRAMID_SCALE", "0.25"))
+NDVI_WORKERS = int(os.getenv("NDVI_WORKERS", "1"))
+
+# Ghi ảnh nền: định dạng "jpg" / "webp", chất lượng, số luồng, độ dài hàng đợi
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpg")
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "90"))
+WRITER_THREADS = int(os.getenv("WRITER_THREADS", "2"))
+WRITER_QUEUE = int(os.getenv("WRITER_QUEUE", "8"))
+
+# Thống kê NDVI theo luống qua các ngày; cảnh báo qua MQTT khi luống xấu đi
+NDVI_TRENDS = os.getenv("NDVI_TRENDS", ".config/ndvi_trends.json")
+TOPIC_NDVI = os.getenv("TOPIC_NDVI", "Garden/NDVI")
+trends = TrendTracker(NDVI_TRENDS)
+client = None  # MQTT: dùng chung từ supervisor, tự kết nối nếu có MQTT_HOST
+
+# Không mở cửa sổ OpenCV (chạy dưới supervisor / service)
+HEADLESS = os.getenv("HEADLESS", "0") == "1"
+
+# Thời gian lưu: ảnh giữ N ngày (hoặc tới khi vượt dung lượng), chỉ số giữ lâu hơn
+ARCHIVE_KEEP_IMAGES_DAYS = float(os.getenv("ARCHIVE_KEEP_IMAGES_DAYS", "30"))
+ARCHIVE_KEEP_INDEX_DAYS = float(os.getenv("ARCHIVE_KEEP_INDEX_DAYS", "365"))
+ARCHIVE_MAX_MB = os.getenv("ARCHIVE_MAX_MB")
+
+# Kho ảnh: chỉ mở trong main() / open_archive(), import module không đụng tới đĩa
+archive = None
+
+
+# Hàm mở kho ảnh; lần đầu chuyển ảnh từ các thư mục cũ (nếu có) rồi tạo symlink
+def open_archive():
+    global archive
+    if archive is None:
+        os.makedirs(BASE_DIR, exist_ok=True)
+        archive = ImageArchive(ARCHIVE_DIR)
+        archive.import_legacy(BASE_DIR)
+        archive.link_views(BASE_DIR)
+    return archive
+
+
+# Số liệu cho /metrics: thời gian đọc camera / NDVI mỗi khung hình, số ảnh đã lưu
+FRAME_SECONDS = {
+    stage: metrics.histogram(
+        "garden_capture_frame_seconds", "Capture loop stage per frame", stage=stage
+    )
+    for stage in ("grab", "ndvi")
+}
+IMAGES_SAVED = metrics.counter("garden_capture_images_total", "Images queued to store")
+
+
+# HTTP server chạy trong tiến trình (luồng nền), dùng chung khi main() khởi động lại
+http_server = None
+
+# Đặt bởi stop(): vòng lặp chính / phiên chụp dừng lại, ảnh trong hàng đợi vẫn được ghi
+_stopping = threading.Event()
+
+
+# Hàm yêu cầu main() đang chạy dừng lại (hook dừng của supervisor)
+def stop():
+    _stopping.set()
 
 
 # Hàm dừng HTTP server
-def stop_http_server(port=8080):
-    result = subprocess.run(["lsof", "-i", f":{port}"], capture_output=True, text=True)
-    if result.stdout:
-        for line in result.stdout.splitlines():
-            if "LISTEN" in line:
-                pid = int(line.split()[1])  # PID ở cột thứ hai
-                os.kill(pid, 9)
-                print(f"Stopped process {pid} on port {port}")
+def stop_http_server():
+    global http_server
+    if http_server is not None:
+        http_server.stop()
+        http_server = None
 
 
-# Hàm khởi động HTTP server
-def start_http_server():
-    stop_http_server(8080)  # Dừng server đang chạy trên cổng 8080 nếu có
-    subprocess.Popen(["python3", "-m", "http.server", "8080"], cwd=BASE_DIR)
+# Hàm khởi động HTTP server (ảnh, thumbnail, /api/weak)
+def start_http_server(port=HTTP_PORT):
+    global http_server
+    if http_server is None:
+        http_server = ImageServer(BASE_DIR, port=port, archive=open_archive()).start()
+        print(f"[HTTP] Serving {BASE_DIR} on port {port}")
+    return http_server
 
 
 # Hàm xử lý ngắt (Ctrl+C)
 def signal_handler(sig, frame):
     print("Cleaning up resources...")
-    stop_http_server(8080)
+    stop_http_server()
     sys.exit(0)
 
 
@@ -51,40 +117,51 @@ signal.signal(signal.SIGINT, signal_handler)
 
 
 # Hàm chụp ảnh
-def capture_images(save_dir, num_images=15):
-    camera = cv2.VideoCapture(2)  # Sử dụng camera USB (có thể thay đổi nếu cần)
-    if not camera.isOpened():
-        print("Error: Could not open webcam.")
-        return None
-
+@metrics.timed("garden_capture_session_seconds", "capture_images() session duration")
+def capture_images(session, num_images=15, grabber=None):
+    # Dùng grabber dùng chung nếu có, nếu không tự mở camera USB
+    own_grabber = grabber is None
+    if own_grabber:
+        grabber = FrameGrabber(CAMERA_INDEX, name="ndvi")
+        if not grabber.isOpened():
+            print("Error: Could not open webcam.")
+            return None
+        grabber.start()
+    reader = grabber.reader("ndvi")
+
+    archive = open_archive()
     processor = NDVIProcessor()
     weak_plant_count = 0  # Đếm số lượng ảnh đã lưu
 
-    # Lấy thời gian bắt đầu
-    start_time = time.time()
-    last_capture_time = None  # Thời điểm chụp ảnh cuối cùng
+    # Mã hoá + ghi đĩa chạy nền, vòng chụp không bị thẻ SD làm chậm
+    writer = ImageWriter(
+        archive, WRITER_THREADS, WRITER_QUEUE, IMAGE_FORMAT, IMAGE_QUALITY
+    )
+    timings = {"capture": LatencyStats(), "ndvi": LatencyStats()}
+    # Gộp NDVI của mọi khung hình trong phiên (theo luống, bộ nhớ cố định)
+    aggregator = SessionAggregator(archive.zones)
 
     print("Chờ 5 giây trước khi chụp ảnh đầu tiên...")
+    next_capture_time = time.time() + 5
 
     while weak_plant_count < num_images:
-        current_time = time.time()
-        elapsed_time = current_time - start_time
-
-        # Kiểm tra nếu đủ 5 giây để chụp ảnh đầu tiên
-        if last_capture_time is None and elapsed_time < 5:
-            continue
-
-        # Kiểm tra nếu đủ 1 giây kể từ lần chụp gần nhất
-        if last_capture_time is not None and (current_time - last_capture_time) < 1:
-            continue
+        # Ngủ tới lần chụp kế tiếp thay vì vòng lặp bận (busy-wait)
+        delay = next_capture_time - time.time()
+        if _stopping.wait(max(0, delay)):
+            break
 
-        ret, frame = camera.read()
+        # Luôn lấy khung hình mới nhất từ luồng camera
+        start = time.perf_counter()
+        ret, frame = reader.read()
+        elapsed = time.perf_counter() - start
+        timings["capture"].add(elapsed)
+        FRAME_SECONDS["grab"].observe(elapsed)
         if not ret:
             print("Failed to grab frame")
             break
 
-        # Cập nhật thời gian chụp ảnh cuối cùng
-        last_capture_time = current_time
+        # Lần chụp tiếp theo sau 1 giây
+        next_capture_time = time.time() + 1
 
         # Convert frame to correct color format if necessary
         if len(frame.shape) == 2:
@@ -93,44 +170,59 @@ def capture_images(save_dir, num_images=15):
             frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
 
         # Tính NDVI và phân tích vùng thực vật
-        new_frame = processor.contrast_stretch(frame)
-        ndvi_values = processor.calculate_ndvi(new_frame)
-        vegetation_mask = (ndvi_values > 0.2).astype(np.uint8)
-
-        # Tìm các vùng thực vật
-        regions = processor.detect_vegetation_regions(ndvi_values, min_area=2000)
+        start = time.perf_counter()
+        ndvi_values = processor.process_frame(frame)
+
+        # Tìm các vùng thực vật và vùng cây yếu
+        results = processor.analyze_frame(
+            ndvi_values,
+            mode=NDVI_MODE,
+            scale=NDVI_PYRAMID_SCALE,
+            workers=NDVI_WORKERS,
+            min_area=2000,
+            weak_threshold=0.3,
+            min_weak_area=80,
+        )
+        aggregator.add_frame(
+            ndvi_values,
+            [region for region, _ in results],
+            [area for _, areas in results for area in areas or ()],
+        )
+        elapsed = time.perf_counter() - start
+        timings["ndvi"].add(elapsed)
+        FRAME_SECONDS["ndvi"].observe(elapsed)
 
         # Kiểm tra và lưu ảnh
         highlighted_frame = frame.copy()
-        if regions:
-            for region in regions:
-                x, y, w, h = region
-                region_frame = frame[y : y + h, x : x + w]
-
-                weak_areas = processor.analyze_region(
-                    region,
-                    ndvi_values,
-                    vegetation_mask,
-                    weak_threshold=0.3,
-                    min_weak_area=80,
-                )
-
-                if weak_areas:
-                    for weak_area in weak_areas:
-                        wx, wy, ww, wh = weak_area
-                        cv2.rectangle(
-                            highlighted_frame,
-                            (x + wx, y + wy),
-                            (x + wx + ww, y + wy + wh),
-                            (0, 0, 255),
-                            2,
-                        )
-
-            # Lưu ảnh vào thư mục chỉ định
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            image_path = os.path.join(save_dir, f"image_{weak_plant_count + 1}.jpg")
-            cv2.imwrite(image_path, highlighted_frame)
+        if results:
+            for region, weak_areas in results:
+                # Toạ độ vùng yếu đã là toạ độ trên toàn ảnh
+                for wx, wy, ww, wh in weak_areas or ():
+                    cv2.rectangle(
+                        highlighted_frame,
+                        (wx, wy),
+                        (wx + ww, wy + wh),
+                        (0, 0, 255),
+                        2,
+                    )
+
+            # Lưu ảnh vào kho (ảnh + NDVI + vùng phát hiện vào chỉ mục) ở luồng nền
+            ndvi_mean, vegetation = ndvi_stats(ndvi_values)
+            writer.submit(
+                highlighted_frame,
+                session,
+                width=frame.shape[1],
+                ndvi_mean=ndvi_mean,
+                vegetation=vegetation,
+                regions=[region for region, _ in results],
+                weak_areas=[area for _, areas in results for area in areas or ()],
+            )
             weak_plant_count += 1
+            IMAGES_SAVED.inc()
+
+        reader.done()
+        if HEADLESS:
+            continue
 
         # Hiển thị ảnh
         cv2.imshow("Captured Frame", highlighted_frame)
@@ -140,42 +232,84 @@ def capture_images(save_dir, num_images=15):
             print("Nhấn phím 'q' để thoát.")
             break
 
-    camera.release()
-    cv2.destroyAllWindows()  # Đóng tất cả cửa sổ OpenCV
-
-
-# Hàm xóa ảnh cũ và di chuyển ảnh vào thư mục hôm qua
-def clear_and_move_images():
-    # Di chuyển ảnh từ thư mục sáng và chiều vào thư mục hôm qua
-    for file in os.listdir(EVENING_DIR):
-        os.rename(os.path.join(EVENING_DIR, file), os.path.join(YESTERDAY_DIR, file))
-
-    for file in os.listdir(MORNING_DIR):
-        os.remove(os.path.join(MORNING_DIR, file))
-
-
-# Hàm xử lý lịch chụp ảnh
-def main():
+    # Chờ ghi xong ảnh còn trong hàng đợi
+    writer.close()
+    print(f"[CAMERA] {reader.stats()}")
+    print(
+        f"[TIMING] capture {timings['capture'].summary()} | "
+        f"ndvi {timings['ndvi'].summary()}"
+    )
+    print(f"[WRITER] {writer.stats()}")
+    report_trends(session, aggregator)
+    if own_grabber:
+        grabber.stop()
+    if not HEADLESS:
+        cv2.destroyAllWindows()  # Đóng tất cả cửa sổ OpenCV
+
+
+# Hàm lưu thống kê phiên, so sánh với các ngày trước và gửi cảnh báo
+def report_trends(session, aggregator):
+    summary = aggregator.summary()
+    if not summary:
+        return
+    alerts = trends.add(datetime.now().date(), session, summary)
+    for zone, stats in summary.items():
+        print(f"[NDVI] {session} {zone}: {stats}")
+    for alert in alerts:
+        print(f"[ALERT] {alert}")
+    if client is not None:
+        publish(client, TOPIC_NDVI, session, summary, alerts)
+
+
+# Hàm dọn kho ảnh theo thời gian lưu / dung lượng và cập nhật symlink ngày mới
+def compact_archive():
+    archive = open_archive()
+    max_bytes = int(float(ARCHIVE_MAX_MB) * 1e6) if ARCHIVE_MAX_MB else None
+    result = archive.compact(
+        ARCHIVE_KEEP_IMAGES_DAYS, ARCHIVE_KEEP_INDEX_DAYS, max_bytes=max_bytes
+    )
+    archive.link_views(BASE_DIR)
+    print(f"[ARCHIVE] {result}")
+
+
+# Hàm xử lý lịch chụp ảnh (grabber / mqtt: camera và MQTT dùng chung từ supervisor)
+def main(grabber=None, mqtt=None):
+    global client
+    client = mqtt
+    if client is None and os.getenv("MQTT_HOST"):
+        client = make_client()
+        client.connect(
+            os.getenv("MQTT_HOST"),
+            int(os.getenv("MQTT_POST", "1883")),
+            int(os.getenv("KEEP_ALIVE", "60")),
+        )
+        client.loop_start()
+    metrics.start(client)
+
+    open_archive()
     start_http_server()  # Khởi động HTTP Server
+    print("[READY] ndvi")
 
-    while True:
+    while not _stopping.is_set():
         now = datetime.now()
         current_time = now.strftime("%H:%M")
 
         if current_time == "19:23":  # Chụp ảnh sáng
             print("Chụp ảnh buổi sáng...")
-            capture_images(MORNING_DIR)
+            capture_images("morning", grabber=grabber)
 
         elif current_time == "18:00":  # Chụp ảnh chiều
             print("Chụp ảnh buổi chiều...")
-            capture_images(EVENING_DIR)
+            capture_images("evening", grabber=grabber)
+
+        elif current_time == "00:00":  # Sang ngày mới: dọn kho, đổi symlink
+            print("Dọn kho ảnh và cập nhật thư mục hôm nay / hôm qua...")
+            compact_archive()
 
-        elif current_time == "23:59":  # Xóa ảnh sáng và chuyển ảnh chiều vào hôm qua
-            print("Xóa ảnh buổi sáng và lưu ảnh hôm qua...")
-            clear_and_move_images()
+        _stopping.wait(60)  # Kiểm tra mỗi phút
 
-        time.sleep(60)  # Kiểm tra mỗi phút
+    stop_http_server()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
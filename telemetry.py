@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from firebase_admin import db
+
+#! ---------------------------- TELEMETRY SINK ----------------------------
+
+
+class TelemetrySink:
+    def __init__(
+        self,
+        root="/telemetry",
+        batch_size=200,
+        flush_interval=5.0,
+        capacity=10000,
+        spool_path="data/telemetry.sqlite",
+        reference=None,
+    ):
+        self.root = root.rstrip("/") or "/"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.reference = reference or db.reference
+
+        # Bounded ring buffer: when full, the OLDEST reading is dropped
+        self._buffer = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+        self._spool = None
+        self._spool_pending = os.path.exists(spool_path)
+
+        self.metrics = {
+            "enqueued": 0,
+            "dropped": 0,
+            "flushed": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "spooled": 0,
+            "replayed": 0,
+            "high_watermark": 0,
+            "last_flush_ms": 0.0,
+        }
+
+    # * Non-blocking: safe to call from the paho network thread
+    def record(self, topic, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.metrics["dropped"] += 1
+            self._buffer.append((topic, value, timestamp))
+            self.metrics["enqueued"] += 1
+            depth = len(self._buffer)
+            if depth > self.metrics["high_watermark"]:
+                self.metrics["high_watermark"] = depth
+        if depth >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        return self
+
+    # * Stop the worker after a last flush of whatever is buffered
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["queue_depth"] = len(self._buffer)
+        return stats
+
+    #! ---------------------------- WORKER ----------------------------
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+        if self._spool is not None:
+            self._spool.close()
+
+    def _drain(self):
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                return
+            if not self._flush(batch):
+                # Offline: keep everything that's left on disk, retry next round
+                self._spool_rows(batch + self._take(len(self._buffer)))
+                return
+            self._replay_spool()
+
+    def _take(self, count):
+        with self._lock:
+            return [
+                self._buffer.popleft() for _ in range(min(count, len(self._buffer)))
+            ]
+
+    # * One multi-path update per batch: {"<topic>/<ts_ms>": value, ...}
+    def _flush(self, batch):
+        update = {}
+        for topic, value, timestamp in batch:
+            update[f"{topic.strip('/')}/{int(timestamp * 1000)}"] = value
+
+        start = time.perf_counter()
+        try:
+            self.reference(self.root).update(update)
+        except Exception as e:
+            with self._lock:
+                self.metrics["failed_batches"] += 1
+            print(f"[TELEMETRY] Flush of {len(batch)} readings failed: {e}")
+            return False
+
+        with self._lock:
+            self.metrics["flushed"] += len(batch)
+            self.metrics["batches"] += 1
+            self.metrics["last_flush_ms"] = (time.perf_counter() - start) * 1000
+        return True
+
+    #! ---------------------------- OFFLINE SPOOL ----------------------------
+
+    def _open_spool(self):
+        if self._spool is None:
+            os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+            self._spool = sqlite3.connect(self.spool_path)
+            self._spool.execute(
+                "CREATE TABLE IF NOT EXISTS readings ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "topic TEXT NOT NULL, value REAL, ts REAL NOT NULL)"
+            )
+        return self._spool
+
+    def _spool_rows(self, rows):
+        if not rows:
+            return
+        spool = self._open_spool()
+        with spool:
+            spool.executemany(
+                "INSERT INTO readings (topic, value, ts) VALUES (?, ?, ?)", rows
+            )
+        self._spool_pending = True
+        with self._lock:
+            self.metrics["spooled"] += len(rows)
+
+    # * Back online: push the readings stored while offline, oldest first
+    def _replay_spool(self):
+        if not self._spool_pending:
+            return
+        spool = self._open_spool()
+        while True:
+            rows = spool.execute(
+                "SELECT id, topic, value, ts FROM readings ORDER BY id LIMIT ?",
+                (self.batch_size,),
+            ).fetchall()
+            if not rows:
+                self._spool_pending = False
+                return
+            if not self._flush([row[1:] for row in rows]):
+                return
+            with spool:
+                spool.execute("DELETE FROM readings WHERE id <= ?", (rows[-1][0],))
+            with self._lock:
+                self.metrics["replayed"] += len(rows)
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+# Test oracle: the NDVI pipeline as it was before the fused process_frame,
+# kept here so the tests do not compare the module against itself
+
+
+def contrast_stretch(im):
+    in_min = np.percentile(im, 5)
+    in_max = np.percentile(im, 95)
+    out_min, out_max = 0.0, 255.0
+    return (im - in_min) * ((out_max - out_min) / (in_max - in_min)) + out_min
+
+
+def calculate_ndvi(frame):
+    frame_float32 = frame.astype(np.float32)
+    b, g, r = cv2.split(frame_float32)
+    ndvi = (g - r) / (g + r + 1e-6)
+    ndvi = cv2.GaussianBlur(ndvi, (5, 5), 0)
+
+    hsv = cv2.cvtColor(frame.astype(np.uint8), cv2.COLOR_BGR2HSV)
+    h, s, v = cv2.split(hsv)
+    soil_mask = (s < 50) & (v < 50)
+    vegetation_mask = ((g > r * 1.5) & (g > b * 1.5) & (g > 50) & ~soil_mask).astype(
+        np.uint8
+    )
+    return cv2.bitwise_and(ndvi, ndvi, mask=vegetation_mask)
+
+
+def reference_ndvi(frame):
+    return calculate_ndvi(contrast_stretch(frame))
+
+
+# Smooth colour bands with green patches plus sensor noise
+def plant_frame(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:, :, 0] = (40 + 30 * np.sin(xx / 37.0)).astype(np.uint8)
+    frame[:, :, 1] = (90 + 80 * np.sin(xx / 53.0) * np.cos(yy / 41.0)).astype(np.uint8)
+    frame[:, :, 2] = (60 + 40 * np.cos(yy / 29.0)).astype(np.uint8)
+    noise = rng.integers(-12, 12, frame.shape)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
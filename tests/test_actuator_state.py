@@ -0,0 +1,146 @@
+import pytest
+
+from actuator_state import ActuatorState, _Clock, _flapping_commands, _RecordingClient
+
+
+class StatusClient(_RecordingClient):
+    def __init__(self):
+        super().__init__()
+        self.callbacks = {}
+
+    def message_callback_add(self, topic, callback):
+        self.callbacks[topic] = callback
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+
+def _manager(client=None, path=None, **kwargs):
+    clock = _Clock()
+    kwargs.setdefault("qos", 0)
+    manager = ActuatorState(
+        client or _RecordingClient(), path=path, clock=clock, **kwargs
+    )
+    return manager, clock
+
+
+def test_window_defers_and_coalesces():
+    manager, clock = _manager(window=2.0)
+    assert manager.command("Pump/LEFT", "ON") == "sent"
+    assert manager.command("Pump/LEFT", "ON") == "duplicate"
+
+    clock.t = 1.0
+    assert manager.command("Pump/LEFT", "OFF") == "deferred"
+    assert manager.poll(1.5) == 2.0
+    # Flapping back inside the window: the OFF never goes out
+    clock.t = 1.8
+    assert manager.command("Pump/LEFT", "ON") == "coalesced"
+    assert manager.poll(10) is None
+    assert manager.client.published == [("Pump/LEFT", "ON")]
+
+    clock.t = 10.5
+    assert manager.command("Pump/LEFT", "OFF") == "sent"
+    clock.t = 11.0
+    assert manager.command("Pump/LEFT", "ON") == "deferred"
+    assert manager.poll(12.5) is None
+    assert manager.client.published[-2:] == [("Pump/LEFT", "OFF"), ("Pump/LEFT", "ON")]
+    assert manager.stats()["coalesced"] == 1
+    assert manager.stats()["duplicate"] == 1
+
+
+def test_window_is_per_topic():
+    manager, clock = _manager(window=5.0)
+    assert manager.command("Lights", "ON") == "sent"
+    assert manager.command("Fans", "ON") == "sent"
+    assert manager.command("Lights", "OFF", window=0) == "sent"
+
+
+def test_flapping_pump_ends_in_rule_state():
+    commands = list(_flapping_commands(3600, 1.0))
+    published = {}
+    for window in (0.0, 30.0):
+        manager, clock = _manager(window=window)
+        for t, topic, value in commands:
+            manager.poll(t)
+            clock.t = t
+            manager.command(topic, value)
+        manager.poll(float("inf"))
+        published[window] = manager.client.published
+        assert manager.states()[commands[-1][1]] == commands[-1][2]
+        assert published[window][-1][1] == commands[-1][2]
+    assert len(published[0.0]) == len(commands)
+    assert len(published[30.0]) < len(commands) / 2
+
+
+def test_restart_does_not_recommand(tmp_path):
+    path = str(tmp_path / "actuators.json")
+    topics = ("Pump/LEFT", "Pump/RIGHT", "Lights", "Fans")
+    first, _ = _manager(path=path)
+    for topic in topics:
+        first.command(topic, "ON")
+    first.command("Fans", "OFF", window=0)
+
+    restarted, _ = _manager(path=path)
+    assert restarted.states() == {**dict.fromkeys(topics, "ON"), "Fans": "OFF"}
+    for topic in topics[:3]:
+        assert restarted.command(topic, "ON") == "duplicate"
+    assert restarted.command("Fans", "ON") == "sent"
+    assert restarted.client.published == [("Fans", "ON")]
+
+
+def test_unreadable_state_file_starts_empty(tmp_path):
+    path = tmp_path / "actuators.json"
+    path.write_text("{not json")
+    manager, _ = _manager(path=str(path))
+    assert manager.states() == {}
+    assert manager.command("Lights", "ON") == "sent"
+
+
+def test_status_confirms_then_drift_is_resent():
+    client = StatusClient()
+    manager, clock = _manager(client, window=0, confirm_timeout=15)
+    manager.watch_status("Lights", "Lights/status")
+    manager.command("Lights", "ON")
+    assert manager.stats()["awaiting"] == 1
+
+    clock.t = 0.5
+    manager.on_status("Lights", b"on\n")
+    assert manager.stats()["confirmed"] == 1 and manager.stats()["awaiting"] == 0
+
+    # A mismatch right after a send is a late echo, not drift
+    clock.t = 5
+    manager.on_status("Lights", "OFF")
+    assert manager.stats()["drift"] == 0
+
+    # Later: the device switched on its own, re-command the last state
+    clock.t = 20
+    manager.on_status("Lights", "OFF")
+    assert manager.stats()["drift"] == 1
+    assert client.published == [("Lights", "ON"), ("Lights", "ON")]
+
+
+def test_unconfirmed_command_gives_up_after_max_resends():
+    client = StatusClient()
+    manager, clock = _manager(client, window=0, confirm_timeout=10, max_resends=2)
+    manager.watch_status("Fans", "Fans/status")
+    manager.command("Fans", "ON")
+
+    deadline = manager.poll(0)
+    assert deadline == 10
+    for expected in (20, 30, None):
+        clock.t = deadline
+        deadline = manager.poll(deadline)
+        assert deadline == expected
+    assert client.published == [("Fans", "ON")] * 3
+    assert manager.stats()["resent"] == 2
+    assert manager.stats()["awaiting"] == 0
+
+
+@pytest.mark.parametrize("status", ["ON", "on", b" ON "])
+def test_status_payloads_are_normalised(status):
+    client = StatusClient()
+    manager, clock = _manager(client, window=0)
+    manager.watch_status("Pump/LEFT", "Pump/LEFT/status")
+    manager.command("Pump/LEFT", "ON")
+    manager.on_status("Pump/LEFT", status)
+    assert manager.stats()["confirmed"] == 1
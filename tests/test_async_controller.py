@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from async_controller import AsyncMQTTController, controller_connected
+from fake_broker import FakeBroker
+
+
+def test_blocking_connect_does_not_stall_the_loop():
+    async def scenario():
+        broker = await FakeBroker().start()
+        controller = AsyncMQTTController(
+            "127.0.0.1", broker.port, 60, None, None, backoff_min=0.01
+        )
+        connect = controller.client.connect
+        attempts = []
+
+        # Unreachable broker: a slow DNS/TCP failure, then the real thing
+        def slow_connect(*args):
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                time.sleep(0.3)
+                raise OSError("no route to host")
+            return connect(*args)
+
+        controller.client.connect = slow_connect
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        tick_task = asyncio.create_task(ticker())
+        task = asyncio.create_task(controller.run())
+        await controller_connected(controller)
+        tick_task.cancel()
+
+        assert len(attempts) == 2
+        during = [t for t in ticks if attempts[0] <= t <= attempts[0] + 0.3]
+        assert len(during) > 10, "event loop was blocked by connect()"
+
+        start = time.monotonic()
+        await controller.stop()
+        await asyncio.wait_for(task, 1)
+        assert time.monotonic() - start < 0.2
+        await broker.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stop_interrupts_backoff():
+    async def scenario():
+        controller = AsyncMQTTController(
+            "127.0.0.1", 1, 60, None, None, backoff_min=30, backoff_max=30
+        )
+
+        def refused(*args):
+            raise ConnectionRefusedError("connection refused")
+
+        controller.client.connect = refused
+        task = asyncio.create_task(controller.run())
+        await asyncio.sleep(0.1)
+        start = time.monotonic()
+        await controller.stop()
+        await asyncio.wait_for(task, 1)
+        assert time.monotonic() - start < 0.5
+
+    asyncio.run(scenario())
@@ -0,0 +1,155 @@
+import queue
+import time
+
+import numpy as np
+
+from camera_capture import FakeFrameSource, FrameGrabber
+
+
+# FakeFrameSource burns the frame number into channels 0/1 of every pixel
+def frame_number(frame):
+    assert np.all(frame[:, :, 0] == frame[0, 0, 0]), "frame mixes two captures"
+    assert np.all(frame[:, :, 1] == frame[0, 0, 1]), "frame mixes two captures"
+    return int(frame[0, 0, 0]) + 256 * int(frame[0, 0, 1])
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+# Frames only when the test asks for them, so the ring position is exact
+class StepSource(FakeFrameSource):
+    def __init__(self, width=64, height=48):
+        super().__init__(width, height, fps=0)
+        self.steps = queue.Queue()
+
+    def step(self, frames=1):
+        for _ in range(frames):
+            self.steps.put(True)
+
+    def read(self):
+        if not self.steps.get():
+            return False, None
+        return super().read()
+
+    def release(self):
+        super().release()
+        self.steps.put(False)
+
+
+def test_returns_newest_frame():
+    source = StepSource()
+    grabber = FrameGrabber(source, slots=4).start()
+    reader = grabber.reader("test")
+    try:
+        source.step(5)
+        wait_until(lambda: grabber.frames_captured == 5)
+        ok, frame = reader.read(timeout=1)
+        assert ok
+        assert reader.last_seq == 5
+        assert frame_number(frame) == 4
+
+        source.step(3)
+        wait_until(lambda: grabber.frames_captured == 8)
+        ok, frame = reader.read(timeout=1)
+        assert ok and frame_number(frame) == 7
+        assert reader.dropped == 2
+    finally:
+        source.release()
+        grabber.stop()
+
+
+def test_drop_count_matches_seq_gaps():
+    grabber = FrameGrabber(FakeFrameSource(64, 48, fps=200, limit=150)).start()
+    reader = grabber.reader("slow")
+    seqs = []
+    while True:
+        ok, frame = reader.read(timeout=2)
+        if not ok:
+            break
+        assert frame_number(frame) == reader.last_seq - 1
+        seqs.append(reader.last_seq)
+        time.sleep(0.02)
+    grabber.stop()
+
+    assert seqs == sorted(set(seqs))
+    gaps = sum(b - a - 1 for a, b in zip(seqs, seqs[1:]))
+    assert reader.frames == len(seqs)
+    assert reader.dropped == gaps
+    assert reader.dropped > 0, "consumer was not slow enough to drop frames"
+
+
+def test_readers_see_end_of_source():
+    grabber = FrameGrabber(FakeFrameSource(64, 48, fps=0, limit=10)).start()
+    reader = grabber.reader("test")
+    wait_until(lambda: grabber.ended)
+
+    ok, frame = reader.read(timeout=1)
+    assert ok and frame_number(frame) == 9
+
+    start = time.monotonic()
+    ok, frame = reader.read(timeout=5)
+    assert not ok and frame is None
+    # Woken by the end of the source, not by the timeout
+    assert time.monotonic() - start < 1
+    assert grabber.stats()["ended"]
+    grabber.stop()
+
+
+def test_frames_intact_under_slow_consumer():
+    grabber = FrameGrabber(FakeFrameSource(320, 240, fps=300, limit=300)).start()
+    fast, slow = grabber.reader("fast"), grabber.reader("slow")
+    reads = 0
+    while True:
+        ok, frame = slow.read(timeout=2)
+        if not ok:
+            break
+        seq = slow.last_seq
+        # Meanwhile the grabber and another reader keep going
+        for _ in range(3):
+            fast.read(timeout=0.1)
+        time.sleep(0.015)
+        # Whole frame from one capture, and not rewritten after read() returned
+        assert frame_number(frame) == seq - 1
+        reads += 1
+    grabber.stop()
+
+    assert reads > 5
+    assert slow.dropped > 0
+
+
+def test_reader_preempted_past_slot_reuse_takes_newer_frame():
+    source = StepSource()
+    grabber = FrameGrabber(source, slots=3).start()
+    reader = grabber.reader("preempted")
+    wait_latest = grabber.wait_latest
+    preempted = []
+
+    # The lock is released, then the reader stalls while the grabber runs
+    # far enough to reuse the slot it was handed
+    def stalled_wait_latest(after_seq, timeout=None):
+        latest = wait_latest(after_seq, timeout)
+        if latest is not None and not preempted:
+            preempted.append(latest[0])
+            captured = grabber.frames_captured
+            source.step(grabber.slots)
+            wait_until(lambda: grabber.frames_captured == captured + grabber.slots)
+        return latest
+
+    grabber.wait_latest = stalled_wait_latest
+    try:
+        source.step()
+        wait_until(lambda: grabber.frames_captured == 1)
+        ok, frame = reader.read(timeout=1)
+        assert ok
+        assert preempted == [1]
+        # The copied pixels belong to the frame read() reports
+        assert frame_number(frame) == reader.last_seq - 1
+        assert reader.last_seq == 1 + grabber.slots
+        assert reader.overruns == 1
+    finally:
+        source.release()
+        grabber.stop()
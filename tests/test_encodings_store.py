@@ -0,0 +1,120 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from encodings_store import EncodingStore, StoreError, convert_pickle
+
+
+def _encodings(count, seed=0, dim=128):
+    return np.random.default_rng(seed).normal(0, 0.1, (count, dim)).astype(np.float32)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "encodings.bin")
+
+
+def test_enroll_reopen_and_read_back(path):
+    encodings = _encodings(3)
+    store = EncodingStore.create(path)
+    assert store.enroll_many(
+        ["alice", "bob", "alice"], encodings, ["a:0", "b:0", "a:1"]
+    ) == [0, 1, 2]
+    assert store.enroll("carol", encodings[0] * 2, "c:0") == 3
+    store.close()
+
+    store = EncodingStore.open(path)
+    rows, names = store.gallery()
+    assert names == ["alice", "bob", "alice", "carol"]
+    assert np.array_equal(rows[:3], encodings)
+    assert np.array_equal(rows[3], encodings[0] * 2)
+    assert store.keys() == {"a:0": 0, "b:0": 1, "a:1": 2, "c:0": 3}
+    with pytest.raises(StoreError):
+        store.enroll("dave", encodings[0])
+    store.close()
+
+
+def test_removed_slots_read_as_unknown_and_are_reused(path):
+    store = EncodingStore.create(path)
+    store.enroll_many(
+        ["alice", "bob", "alice", "carol"], _encodings(4), ["a:0", "b:0", "a:1", "c:0"]
+    )
+    assert store.remove_name("alice") == 2
+    assert store.remove_keys(["c:0", "missing"]) == 1
+    store.close()
+
+    store = EncodingStore.open(path, writable=True)
+    rows, names = store.gallery()
+    assert names == ["Unknown", "bob", "Unknown", "Unknown"]
+    assert not rows[[0, 2, 3]].any()
+    assert len(store) == 1
+    # Lowest free slot first
+    assert store.enroll("dave", _encodings(1, seed=1)[0], "d:0") == 0
+    assert store.gallery()[1] == ["dave", "bob", "Unknown", "Unknown"]
+    store.close()
+
+
+def test_truncated_log_line_is_ignored(path):
+    store = EncodingStore.create(path)
+    store.enroll_many(["alice", "bob"], _encodings(2), ["a:0", "b:0"])
+    store.remove_keys(["a:0"])
+    store.close()
+    # Crash mid-append of a third enroll: half a record, header count unchanged
+    with open(path + ".names.log", "a") as f:
+        f.write('[2, "car')
+
+    store = EncodingStore.open(path)
+    assert store.gallery()[1] == ["Unknown", "bob"]
+    assert store.count == 2
+    store.close()
+
+    # A writable open compacts the torn log away
+    store = EncodingStore.open(path, writable=True)
+    assert os.path.getsize(path + ".names.log") == 0
+    assert store.enroll("carol", _encodings(1)[0], "c:0") == 0
+    store.close()
+    assert EncodingStore.open(path).gallery()[1] == ["carol", "bob"]
+
+
+def test_log_compaction_keeps_entries(path, monkeypatch):
+    monkeypatch.setattr("encodings_store.LOG_COMPACT_MIN", 4)
+    store = EncodingStore.create(path)
+    for i in range(10):
+        store.enroll(f"p{i}", _encodings(1, seed=i)[0], f"k{i}")
+    store.remove_keys(["k3"])
+    assert store.log_records <= 10
+    store.close()
+    names = EncodingStore.open(path).gallery()[1]
+    assert names == [f"p{i}" if i != 3 else "Unknown" for i in range(10)]
+
+
+def test_grow_keeps_existing_rows(path):
+    first, second = _encodings(3, seed=1), _encodings(6, seed=2)
+    store = EncodingStore.create(path, capacity=4)
+    store.enroll_many(["a", "b", "c"], first)
+    store.enroll_many([f"n{i}" for i in range(6)], second)
+    assert store.capacity == 16
+    assert np.array_equal(store.rows[:3], first)
+    store.close()
+
+    store = EncodingStore.open(path)
+    assert store.capacity == 16 and store.count == 9
+    assert np.array_equal(store.gallery()[0], np.vstack([first, second]))
+    store.close()
+
+
+def test_convert_pickle_round_trip(tmp_path, path):
+    encodings = list(_encodings(5).astype(np.float64))
+    names = ["alice", "bob", "alice", "carol", "bob"]
+    pickle_path = str(tmp_path / "encodings.pickle")
+    with open(pickle_path, "wb") as f:
+        f.write(pickle.dumps({"encodings": encodings, "names": names}))
+
+    assert convert_pickle(pickle_path, path) == 5
+    store = EncodingStore.open(path)
+    rows, got_names = store.gallery()
+    assert got_names == names
+    assert np.array_equal(rows, np.asarray(encodings, np.float32))
+    store.close()
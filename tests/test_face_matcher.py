@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from face_matcher import ENCODING_DIM, FaceMatcher, synthetic_gallery
+
+
+def _face(seed):
+    return np.random.default_rng(seed).normal(0, 0.09, ENCODING_DIM)
+
+
+def test_empty_gallery_matches_unknown():
+    for encodings in ([], np.zeros((0, ENCODING_DIM), np.float32)):
+        matcher = FaceMatcher(encodings, [])
+        assert len(matcher) == 0
+        assert matcher.matrix.shape == (0, ENCODING_DIM)
+        assert matcher.match([_face(0), _face(1)]) == [
+            ("Unknown", float("inf"), -1),
+            ("Unknown", float("inf"), -1),
+        ]
+        assert matcher.match([]) == []
+
+
+def test_single_person_gallery():
+    alice = _face(0)
+    matcher = FaceMatcher([alice], ["alice"], tolerance=0.45)
+    assert matcher.matrix.shape == (1, ENCODING_DIM)
+
+    ((name, distance, index),) = matcher.match([alice + 0.001])
+    assert (name, index) == ("alice", 0)
+    assert distance < 0.45
+
+    ((name, distance, index),) = matcher.match([alice + 1.0])
+    assert name == "Unknown" and distance > 0.45
+
+
+def test_gallery_emptied_by_set_gallery():
+    matcher = FaceMatcher([_face(0)], ["alice"])
+    matcher.set_gallery([], [])
+    assert matcher.match([_face(0)]) == [("Unknown", float("inf"), -1)]
+
+
+def test_mismatched_names_rejected():
+    with pytest.raises(ValueError):
+        FaceMatcher([_face(0), _face(1)], ["alice"])
+
+
+def test_flat_and_ivf_agree():
+    encodings, names, centers = synthetic_gallery(2000)
+    flat = FaceMatcher(encodings, names, index="flat")
+    ivf = FaceMatcher(encodings, names, index="ivf", nprobe=16)
+    queries = centers[:10]
+    assert [m[0] for m in flat.match(queries)] == [m[0] for m in ivf.match(queries)]
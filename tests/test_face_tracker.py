@@ -0,0 +1,81 @@
+import numpy as np
+
+from face_tracker import FaceTracker, synthetic_clip
+
+BOX = (40, 80, 80, 40)
+
+
+def _frame(face_seed, seed):
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 40, (120, 160, 3), dtype=np.uint8)
+    face = np.random.default_rng(face_seed).integers(0, 255, (40, 40, 3), np.uint8)
+    top, right, bottom, left = BOX
+    frame[top:bottom, left:right] = face
+    return frame
+
+
+# The "encoding" is the face crop itself; only Alice's crop matches
+def _pipeline(alice):
+    encoded = []
+
+    def detect(rgb):
+        return [BOX]
+
+    def encode(rgb, boxes):
+        encoded.extend(boxes)
+        return [rgb[b[0] : b[2], b[3] : b[1]].copy() for b in boxes]
+
+    def match(encodings):
+        return [
+            ("Alice", 0.3, 0) if np.array_equal(e, alice) else ("Unknown", 0.9, -1)
+            for e in encodings
+        ]
+
+    return detect, encode, match, encoded
+
+
+def test_stranger_in_same_box_does_not_inherit_name():
+    alice_frame = _frame(face_seed=0, seed=1)
+    top, right, bottom, left = BOX
+    detect, encode, match, encoded = _pipeline(alice_frame[top:bottom, left:right])
+    tracker = FaceTracker(detect, encode, match, detect_every=5)
+
+    for i in range(5):
+        boxes, names = tracker.update(_frame(face_seed=0, seed=i))
+        assert names == ["Alice"]
+    track_id = tracker.tracks[0].id
+
+    # Same box, different face, from the very next frame on
+    for i in range(20):
+        boxes, names = tracker.update(_frame(face_seed=99, seed=10 + i))
+        if tracker.last_detection == tracker.frame_index:
+            # Re-associated with Alice's track, but identified afresh
+            assert names == ["Unknown"]
+            assert tracker.tracks[0].id == track_id
+    assert names == ["Unknown"]
+    assert tracker.detections >= 4
+    assert len(encoded) == tracker.detections
+
+
+def test_followed_frames_skip_detection_and_encoding():
+    clip = synthetic_clip(frames=100)
+
+    def detect(rgb):
+        gray = rgb.max(axis=2)
+        ys, xs = np.nonzero(gray > 60)
+        return [(ys.min(), xs.max() + 1, ys.max() + 1, xs.min())]
+
+    def encode(rgb, boxes):
+        return [np.zeros(128, np.float32) for _ in boxes]
+
+    def match(encodings):
+        return [("Alice", 0.3, 0) for _ in encodings]
+
+    tracker = FaceTracker(detect, encode, match, detect_every=10)
+    for frame in clip:
+        boxes, names = tracker.update(frame)
+        assert names == ["Alice"]
+    stats = tracker.stats()
+    assert stats["detections"] <= 15
+    assert stats["encoded_faces"] == stats["detections"]
+    assert stats["followed"] > 80
@@ -0,0 +1,103 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from image_archive import ImageArchive
+
+DAY = 86400
+NOW = datetime(2026, 3, 20, 12).timestamp()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = ImageArchive(str(tmp_path / "archive"))
+    yield archive
+    archive.close()
+
+
+def _files(archive):
+    return sorted(
+        os.path.relpath(os.path.join(folder, name), archive.root)
+        for folder, _, names in os.walk(archive.root)
+        for name in names
+        if name.startswith("image_")
+    )
+
+
+def test_reserve_numbers_per_day_and_session(archive):
+    day = datetime(2026, 3, 1, 7).timestamp()
+    paths = [archive.add(b"x", "morning", taken_at=day + i) for i in range(3)]
+    paths.append(archive.add(b"x", "evening", taken_at=day + 36000))
+    paths.append(archive.add(b"x", "morning", taken_at=day + DAY))
+    rel = [os.path.relpath(p, archive.root) for p in paths]
+    assert rel == [
+        "2026-03-01/morning/image_1.jpg",
+        "2026-03-01/morning/image_2.jpg",
+        "2026-03-01/morning/image_3.jpg",
+        "2026-03-01/evening/image_1.jpg",
+        "2026-03-02/morning/image_1.jpg",
+    ]
+
+    # A second run the same day continues the numbering instead of overwriting
+    reopened = ImageArchive(archive.root)
+    path = reopened.add(b"y", "morning", taken_at=day + 60)
+    assert os.path.basename(path) == "image_4.jpg"
+    reopened.close()
+
+
+def test_compact_by_age_keeps_index_rows(archive):
+    for age in (40, 20, 5):
+        archive.add(b"x" * 100, "morning", taken_at=NOW - age * DAY, ndvi_mean=0.3)
+    result = archive.compact(keep_images_days=30, keep_index_days=365, now=NOW)
+    assert result == {"removed_images": 1, "freed_bytes": 100, "removed_rows": 0}
+    assert len(_files(archive)) == 2
+
+    captures = archive.captures()
+    assert [c["path"] is None for c in captures] == [True, False, False]
+    # Stats outlive the image
+    assert captures[0]["ndvi_mean"] == 0.3
+
+    result = archive.compact(keep_images_days=30, keep_index_days=10, now=NOW)
+    assert result["removed_rows"] == 2
+    assert len(archive.captures()) == 1
+
+
+def test_compact_by_size_drops_oldest_first(archive):
+    for age in (4, 3, 2, 1):
+        archive.add(b"x" * 1000, "evening", taken_at=NOW - age * DAY)
+    result = archive.compact(
+        keep_images_days=None, keep_index_days=None, max_bytes=2500, now=NOW
+    )
+    assert result["removed_images"] == 2 and result["freed_bytes"] == 2000
+    assert archive.stats()["bytes"] == 2000
+    kept = [c["taken_at"] for c in archive.captures() if c["path"]]
+    assert kept == [NOW - 2 * DAY, NOW - DAY]
+    assert len(_files(archive)) == 2
+
+
+def test_import_legacy_moves_leftovers_aside(tmp_path, archive):
+    base = str(tmp_path)
+    folder = os.path.join(base, "today_morning")
+    os.makedirs(folder)
+    with open(os.path.join(folder, "a.jpg"), "wb") as f:
+        f.write(b"jpeg")
+    with open(os.path.join(folder, "notes.txt"), "w") as f:
+        f.write("keep me")
+    os.makedirs(os.path.join(base, "today_evening.old"))
+    evening = os.path.join(base, "today_evening")
+    os.makedirs(evening)
+    with open(os.path.join(evening, "b.jpg"), "wb") as f:
+        f.write(b"jpeg")
+    with open(os.path.join(evening, "notes.txt"), "w") as f:
+        f.write("and me")
+
+    assert archive.import_legacy(base) == 2
+    with open(os.path.join(base, "today_morning.old", "notes.txt")) as f:
+        assert f.read() == "keep me"
+    # .old taken: numbered instead
+    assert os.listdir(os.path.join(base, "today_evening.old1")) == ["notes.txt"]
+    assert sorted(c["session"] for c in archive.captures()) == ["evening", "morning"]
+
+    archive.link_views(base)
+    assert os.path.islink(folder) and os.path.islink(evening)
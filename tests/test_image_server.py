@@ -0,0 +1,170 @@
+import http.client
+import os
+from datetime import datetime
+
+import cv2
+import numpy as np
+import pytest
+
+import image_server
+from image_archive import ImageArchive
+from image_server import ArchiveDetections, ImageServer, LRUBytes, parse_range
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = ImageArchive(str(tmp_path / "archive"))
+    yield archive
+    archive.close()
+
+
+def _at(day, hour=12):
+    return datetime(2026, 3, day, hour).timestamp()
+
+
+class _Now(datetime):
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+def test_days_window_etag_changes_at_midnight(archive, monkeypatch):
+    archive.add(b"x", "morning", taken_at=_at(1), weak_areas=[(1, 1, 5, 5)])
+    archive.add(b"x", "morning", taken_at=_at(3), weak_areas=[(1, 1, 5, 5)])
+    detections = ArchiveDetections(archive, os.path.dirname(archive.root))
+    monkeypatch.setattr(image_server, "datetime", _Now)
+    params = {"days": "2"}
+
+    _Now.current = datetime(2026, 3, 3, 23, 59)
+    records, before = detections.query(params)
+    assert len(records) == 2
+    _Now.current = datetime(2026, 3, 3, 23, 59, 30)
+    assert detections.query(params)[1] == before
+
+    # Same data, next day: the capture of the 1st falls out of the window
+    _Now.current = datetime(2026, 3, 4, 0, 1)
+    records, after = detections.query(params)
+    assert len(records) == 1
+    assert after != before
+
+
+@pytest.fixture
+def server(tmp_path):
+    folder = tmp_path / "today_morning"
+    folder.mkdir()
+    frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), np.uint8)
+    cv2.imwrite(str(folder / "image_1.jpg"), frame)
+    (folder / "notes.txt").write_text("not an image")
+    server = ImageServer(str(tmp_path), host="127.0.0.1", port=0).start()
+    yield server
+    server.stop()
+
+
+def _get(server, path, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    conn.request("GET", path, headers=headers or {})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, body
+
+
+IMAGE = "/today_morning/image_1.jpg"
+
+
+def test_etag_revalidation(server):
+    response, body = _get(server, IMAGE)
+    assert response.status == 200
+    assert response.getheader("Accept-Ranges") == "bytes"
+    assert response.getheader("Cache-Control") == "no-cache"
+    assert int(response.getheader("Content-Length")) == len(body)
+    etag = response.getheader("ETag")
+
+    response, body = _get(server, IMAGE, {"If-None-Match": etag})
+    assert response.status == 304 and body == b""
+    assert response.getheader("ETag") == etag
+
+    response, _ = _get(server, IMAGE, {"If-None-Match": '"other", ' + etag})
+    assert response.status == 304
+    response, _ = _get(server, IMAGE, {"If-None-Match": '"other"'})
+    assert response.status == 200
+
+    modified = response.getheader("Last-Modified")
+    response, _ = _get(server, IMAGE, {"If-Modified-Since": modified})
+    assert response.status == 304
+    response, _ = _get(server, IMAGE, {"If-Modified-Since": "not a date"})
+    assert response.status == 200
+
+
+def test_range_requests(server):
+    _, full = _get(server, IMAGE)
+    size = len(full)
+
+    response, body = _get(server, IMAGE, {"Range": "bytes=0-99"})
+    assert response.status == 206
+    assert response.getheader("Content-Range") == f"bytes 0-99/{size}"
+    assert body == full[:100]
+
+    response, body = _get(server, IMAGE, {"Range": "bytes=-10"})
+    assert response.status == 206 and body == full[-10:]
+
+    response, body = _get(server, IMAGE, {"Range": f"bytes={size - 5}-"})
+    assert response.status == 206 and body == full[-5:]
+
+    response, body = _get(server, IMAGE, {"Range": f"bytes={size}-"})
+    assert response.status == 416
+    assert response.getheader("Content-Range") == f"bytes */{size}"
+
+    # If-Range with a stale validator: the whole file instead of a slice
+    response, body = _get(server, IMAGE, {"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert response.status == 200 and body == full
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-0", 10) == (0, 0)
+    assert parse_range("bytes=5-100", 10) == (5, 9)
+    assert parse_range("bytes=-3", 10) == (7, 9)
+    assert parse_range("bytes=-", 10) is None
+    assert parse_range("bytes=9-2", 10) is None
+    assert parse_range("items=0-1", 10) is None
+    assert parse_range("bytes=0-1", 0) is None
+
+
+def test_thumbnails_are_cached(server):
+    path = "/thumb" + IMAGE
+    response, body = _get(server, path + "?w=300")
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "image/jpeg"
+    # Snapped to the nearest fixed width
+    assert cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR).shape == (
+        240,
+        320,
+        3,
+    )
+    assert (server.thumbnails.hits, server.thumbnails.misses) == (0, 1)
+
+    response, again = _get(server, path + "?w=320")
+    assert again == body
+    assert (server.thumbnails.hits, server.thumbnails.misses) == (1, 1)
+
+    response, _ = _get(server, path, {"If-None-Match": response.getheader("ETag")})
+    assert response.status == 304
+
+    assert _get(server, path + "?w=big")[0].status == 400
+    assert _get(server, "/thumb/today_morning/missing.jpg")[0].status == 404
+    assert _get(server, "/thumb/today_morning/notes.txt")[0].status == 415
+
+
+def test_lru_evicts_least_recently_used_by_bytes():
+    cache = LRUBytes(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+    cache.put("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.size == 8
+    cache.put("huge", b"x" * 11)
+    assert cache.get("huge") is None
@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+import pytest
+
+from ndvi_processor import NDVIProcessor
+from ndvi_reference import plant_frame, reference_ndvi
+
+
+def _random_frame(width, height, seed):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (height, width, 3), np.uint8)
+
+
+def _gray_frame(width, height, seed):
+    gray = cv2.cvtColor(plant_frame(width, height, seed), cv2.COLOR_BGR2GRAY)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+FRAMES = {
+    "random-640x480": lambda: _random_frame(640, 480, 0),
+    "random-odd-size": lambda: _random_frame(333, 197, 1),
+    "random-single-row": lambda: _random_frame(257, 1, 2),
+    "plant-seed-0": lambda: plant_frame(320, 240, 0),
+    "plant-seed-7": lambda: plant_frame(641, 359, 7),
+    "all-zero": lambda: np.zeros((120, 160, 3), np.uint8),
+    "saturated": lambda: np.full((120, 160, 3), 255, np.uint8),
+    "saturated-green": lambda: np.dstack(
+        [np.zeros((90, 70), np.uint8), np.full((90, 70), 255, np.uint8)] * 2
+    )[:, :, :3],
+    "grayscale-converted": lambda: _gray_frame(320, 240, 3),
+    "two-levels": lambda: np.where(
+        _random_frame(200, 100, 4) > 127, np.uint8(200), np.uint8(20)
+    ).astype(np.uint8),
+}
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("name", sorted(FRAMES))
+def test_process_frame_matches_reference(name):
+    frame = FRAMES[name]()
+    processor = NDVIProcessor()
+    assert np.array_equal(processor.process_frame(frame), reference_ndvi(frame))
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("name", sorted(FRAMES))
+def test_contrast_stretch_matches_np_percentile(name):
+    frame = FRAMES[name]()
+    processor = NDVIProcessor()
+    stretched = processor.calculate_ndvi(processor.contrast_stretch(frame))
+    assert np.array_equal(stretched, reference_ndvi(frame))
+
+
+def test_synthetic_frames_have_vegetation():
+    # Guards the equivalence tests against comparing two all-zero images
+    processor = NDVIProcessor()
+    ndvi = processor.process_frame(FRAMES["plant-seed-0"]())
+    assert np.count_nonzero(ndvi) > 0
+
+
+def test_non_uint8_frames_fall_back_to_reference_path():
+    frame = plant_frame(160, 120, 5).astype(np.float32)
+    processor = NDVIProcessor()
+    assert np.array_equal(processor.process_frame(frame), reference_ndvi(frame))
+
+
+def test_buffers_reused_across_changing_shapes():
+    processor = NDVIProcessor()
+    small = plant_frame(320, 240, 1)
+    large = _random_frame(641, 359, 2)
+
+    first = processor.process_frame(small)
+    assert np.array_equal(first, reference_ndvi(small))
+    assert np.array_equal(processor.process_frame(large), reference_ndvi(large))
+    # Back to the first shape: same work buffer, fresh correct contents
+    again = processor.process_frame(small)
+    assert again is first
+    assert np.array_equal(again, reference_ndvi(small))
+    assert len(processor._buffers) == 2
+
+
+def test_returned_buffer_is_overwritten_by_next_frame():
+    processor = NDVIProcessor()
+    a, b = plant_frame(320, 240, 1), plant_frame(320, 240, 2)
+    kept = processor.process_frame(a).copy()
+    view = processor.process_frame(a)
+    processor.process_frame(b)
+    assert np.array_equal(kept, reference_ndvi(a))
+    assert np.array_equal(view, reference_ndvi(b))
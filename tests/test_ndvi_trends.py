@@ -0,0 +1,152 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from ndvi_trends import BINS, SessionAggregator, TrendTracker
+
+BIN_WIDTH = 2 / BINS
+
+
+def _stats(mean, weak=0.1):
+    return {
+        "mean": mean,
+        "p10": mean - 0.1,
+        "p50": mean,
+        "p90": mean + 0.1,
+        "weak_fraction": weak,
+    }
+
+
+def _day(n):
+    return date(2026, 5, 1) + timedelta(days=n)
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    return TrendTracker(path=str(tmp_path / "trends.json"), baseline_days=7, min_days=3)
+
+
+#! ---------------------------- SESSION AGGREGATE ----------------------------
+
+
+def test_percentiles_match_np_percentile_within_a_bin():
+    rng = np.random.default_rng(0)
+    aggregator = SessionAggregator("LEFT:0-0.5,RIGHT:0.5-1", veg_threshold=0.2)
+    frames = [
+        np.clip(rng.normal(0.5, 0.15, (60, 80)), -1, 1).astype(np.float32)
+        for _ in range(5)
+    ]
+    for ndvi in frames:
+        aggregator.add_frame(ndvi)
+
+    summary = aggregator.summary()
+    for name, columns in (("LEFT", slice(0, 40)), ("RIGHT", slice(40, 80))):
+        values = np.concatenate([f[:, columns].ravel() for f in frames])
+        values = values[values > 0.2]
+        zone = summary[name]
+        assert zone["frames"] == 5
+        assert zone["pixels"] == values.size
+        assert zone["mean"] == pytest.approx(values.mean(), abs=1e-4)
+        assert zone["std"] == pytest.approx(values.std(), abs=1e-3)
+        for p in (10, 50, 90):
+            assert abs(zone[f"p{p}"] - np.percentile(values, p)) <= BIN_WIDTH
+        assert zone["weak_fraction"] == pytest.approx(
+            np.mean(values < 0.3), abs=BIN_WIDTH
+        )
+
+
+def test_only_pixels_inside_regions_count():
+    ndvi = np.full((10, 20), 0.6, np.float32)
+    aggregator = SessionAggregator("ALL:0-1")
+    aggregator.add_frame(ndvi, regions=[(0, 0, 5, 4)], weak_areas=[(0, 0, 2, 2)])
+    zone = aggregator.summary()["ALL"]
+    assert zone["pixels"] == 20
+    assert zone["weak_area_fraction"] == pytest.approx(4 / 20)
+
+
+def test_merge_equals_one_aggregate():
+    rng = np.random.default_rng(1)
+    frames = [rng.uniform(-1, 1, (30, 40)).astype(np.float32) for _ in range(4)]
+    whole, first, second = SessionAggregator(), SessionAggregator(), SessionAggregator()
+    for i, ndvi in enumerate(frames):
+        whole.add_frame(ndvi)
+        (first if i % 2 else second).add_frame(ndvi)
+    assert first.merge(second).summary() == whole.summary()
+
+
+def test_empty_zone_left_out():
+    aggregator = SessionAggregator("LEFT:0-0.5,RIGHT:0.5-1")
+    ndvi = np.zeros((10, 20), np.float32)
+    ndvi[:, :10] = 0.5
+    aggregator.add_frame(ndvi)
+    assert list(aggregator.summary()) == ["LEFT"]
+
+
+#! ---------------------------- TRENDS ----------------------------
+
+
+def test_backfill_keeps_later_days(tracker):
+    for n in (0, 1, 2, 5):
+        tracker.add(_day(n), "morning", {"LEFT": _stats(0.5)})
+    # A re-run of day 3 after day 5 was stored
+    tracker.add(_day(3), "morning", {"LEFT": _stats(0.4)})
+    days = [e["day"] for e in tracker.series("LEFT", "morning")]
+    assert days == [_day(n).isoformat() for n in (0, 1, 2, 3, 5)]
+
+    # Same day again: replaced, not duplicated
+    tracker.add(_day(3), "morning", {"LEFT": _stats(0.45)})
+    series = tracker.series("LEFT", "morning")
+    assert [e["mean"] for e in series] == [0.5, 0.5, 0.5, 0.45, 0.5]
+
+    reloaded = TrendTracker(path=tracker.path)
+    assert reloaded.series("LEFT", "morning") == series
+
+
+def test_retention_counts_from_newest_day(tmp_path):
+    tracker = TrendTracker(path=None, keep_days=10)
+    tracker.add(_day(0), "evening", {"LEFT": _stats(0.5)})
+    tracker.add(_day(20), "evening", {"LEFT": _stats(0.5)})
+    tracker.add(_day(15), "evening", {"LEFT": _stats(0.5)})
+    assert [e["day"] for e in tracker.series("LEFT", "evening")] == [
+        _day(15).isoformat(),
+        _day(20).isoformat(),
+    ]
+
+
+def _fill(tracker, means, weak=0.1):
+    for n, mean in enumerate(means):
+        tracker.add(_day(n), "morning", {"LEFT": _stats(mean, weak)})
+    return len(means)
+
+
+def test_no_alert_before_min_days(tracker):
+    n = _fill(tracker, [0.6, 0.6])
+    assert tracker.add(_day(n), "morning", {"LEFT": _stats(0.1, 0.9)}) == []
+
+
+def test_mean_drop_threshold(tracker):
+    n = _fill(tracker, [0.6, 0.6, 0.6])
+    # Exactly mean_drop below the baseline is not an alert yet
+    assert tracker.add(_day(n), "morning", {"LEFT": _stats(0.55)}) == []
+    alerts = tracker.add(_day(n + 1), "morning", {"LEFT": _stats(0.5)})
+    assert [a["reasons"] for a in alerts] == [["mean_drop"]]
+    assert alerts[0]["baseline"] == 0.6
+
+
+def test_weak_rise_threshold(tracker):
+    n = _fill(tracker, [0.6] * 3, weak=0.1)
+    assert tracker.add(_day(n), "morning", {"LEFT": _stats(0.6, 0.19)}) == []
+    alerts = tracker.add(_day(n + 1), "morning", {"LEFT": _stats(0.6, 0.25)})
+    assert [a["reasons"] for a in alerts] == [["weak_rise"]]
+
+
+def test_downtrend_needs_full_window(tracker):
+    # -0.012/day: never a 0.05 drop from the median of the last days
+    means = [0.7 - 0.012 * n for n in range(8)]
+    for n, mean in enumerate(means[:7]):
+        alerts = tracker.add(_day(n), "morning", {"LEFT": _stats(mean)})
+        assert alerts == [], n
+    alerts = tracker.add(_day(7), "morning", {"LEFT": _stats(means[7])})
+    assert [a["reasons"] for a in alerts] == [["downtrend"]]
+    assert alerts[0]["slope_per_day"] == pytest.approx(-0.012, abs=1e-3)
@@ -0,0 +1,215 @@
+import json
+import threading
+import time
+
+from schedule_cache import ScheduleCache, common_parent
+from sim_harness import FakeFirebase
+
+PATHS = ["/timers/pumps/on", "/timers/pumps/off", "/timers/lights/on"]
+VALUES = {
+    "/timers/pumps/on": "06:00",
+    "/timers/pumps/off": "06:20",
+    "/timers/lights/on": "07:00",
+}
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+# Counts round trips per call, fails the first `failures` of them
+class FlakyFirebase:
+    def __init__(self, firebase, failures=0):
+        self.firebase = firebase
+        self.failures = failures
+        self.calls = []
+
+    def reference(self, path="/"):
+        return _FlakyReference(self, self.firebase.reference(path))
+
+
+class _FlakyReference:
+    def __init__(self, owner, reference):
+        self.owner = owner
+        self.reference = reference
+
+    def _call(self, name, *args, **kwargs):
+        self.owner.calls.append(name)
+        if self.owner.failures > 0:
+            self.owner.failures -= 1
+            raise ConnectionError("network unreachable")
+        return getattr(self.reference, name)(*args, **kwargs)
+
+    def get(self, etag=False):
+        return self._call("get", etag=etag)
+
+    def get_if_changed(self, etag):
+        return self._call("get_if_changed", etag)
+
+    def listen(self, callback):
+        return self._call("listen", callback)
+
+
+def test_common_parent():
+    assert common_parent(PATHS) == "/timers"
+    assert common_parent(["/a/b"]) == "/a"
+    assert common_parent([]) == "/"
+
+
+def test_refresh_downloads_only_when_changed():
+    firebase = FakeFirebase(VALUES)
+    network = FlakyFirebase(firebase)
+    cache = ScheduleCache(PATHS, reference=network.reference)
+    changes = []
+    cache.subscribe(lambda path, old, new: changes.append((path, old, new)))
+
+    assert cache.refresh()
+    assert network.calls == ["get"]
+    assert cache.snapshot() == VALUES
+    assert len(changes) == 3
+
+    # Same ETag: nothing new, nothing re-parsed
+    changes.clear()
+    assert not cache.refresh()
+    assert network.calls == ["get", "get_if_changed"]
+    assert changes == []
+
+    firebase.set("/timers/pumps/on", "05:30")
+    assert cache.refresh()
+    assert cache.get("/timers/pumps/on") == "05:30"
+    assert changes == [("/timers/pumps/on", "06:00", "05:30")]
+
+
+def test_poll_fallback_picks_up_changes():
+    firebase = FakeFirebase(VALUES)
+    cache = ScheduleCache(
+        PATHS, poll_interval=0.01, use_listener=False, reference=firebase.reference
+    ).start()
+    try:
+        assert cache.source == "network"
+        firebase.set("/timers/lights/on", "08:00")
+        wait_until(lambda: cache.get("/timers/lights/on") == "08:00")
+    finally:
+        cache.stop()
+
+
+def test_listener_events_update_values():
+    firebase = FakeFirebase(VALUES)
+    cache = ScheduleCache(PATHS, reference=firebase.reference).start()
+    firebase.set("/timers/pumps/off", "07:45")
+    assert cache.get("/timers/pumps/off") == "07:45"
+    cache.stop()
+    assert firebase.listeners == []
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "schedule.json")
+    firebase = FakeFirebase(VALUES)
+    ScheduleCache(
+        PATHS, reference=firebase.reference, snapshot_path=path
+    ).start().stop()
+
+    network = FlakyFirebase(firebase)
+    cache = ScheduleCache(PATHS, reference=network.reference, snapshot_path=path)
+    assert cache.load_snapshot()
+    assert cache.snapshot() == VALUES
+    # The saved ETag spares the download
+    assert not cache.refresh()
+    assert network.calls == ["get_if_changed"]
+
+
+def test_corrupt_snapshot_falls_back_to_firebase(tmp_path):
+    path = tmp_path / "schedule.json"
+    path.write_text('{"root": "/timers", "tree": {"tim')
+    firebase = FakeFirebase(VALUES)
+    cache = ScheduleCache(PATHS, reference=firebase.reference, snapshot_path=str(path))
+    assert not cache.load_snapshot()
+
+    cache.start()
+    cache.stop()
+    assert cache.source == "network"
+    assert cache.snapshot() == VALUES
+    # Rewritten with the fresh tree
+    assert json.loads(path.read_text())["tree"]["timers"]["pumps"]["on"] == "06:00"
+
+
+class _RecordingStop(threading.Event):
+    def __init__(self):
+        super().__init__()
+        self.waits = []
+
+    def wait(self, timeout=None):
+        self.waits.append(timeout)
+        return self.is_set()
+
+
+def test_sync_backs_off_exponentially_until_firebase_answers():
+    network = FlakyFirebase(FakeFirebase(VALUES), failures=5)
+    cache = ScheduleCache(PATHS, reference=network.reference, retry_min=1, retry_max=5)
+    cache._stop = _RecordingStop()
+    cache._started = time.perf_counter()
+
+    cache._sync_loop()
+    assert cache._stop.waits == [1, 2, 4, 5, 5]
+    assert cache.synced.is_set()
+    assert cache.snapshot() == VALUES
+    assert network.calls == ["get"] * 6 + ["listen"]
+    cache.stop()
+
+
+def test_unreachable_at_start_syncs_in_background():
+    network = FlakyFirebase(FakeFirebase(VALUES), failures=2)
+    cache = ScheduleCache(PATHS, reference=network.reference, retry_min=0.01).start()
+    try:
+        assert cache.get("/timers/pumps/on") is None
+        assert cache.synced.wait(5)
+        assert cache.source == "network"
+        assert cache.snapshot() == VALUES
+    finally:
+        cache.stop()
+
+
+# Firebase that only answers once the test opens the gate
+class GatedFirebase:
+    def __init__(self, firebase):
+        self.firebase = firebase
+        self.gate = threading.Event()
+
+    def reference(self, path="/"):
+        assert self.gate.wait(5), "gate never opened"
+        return self.firebase.reference(path)
+
+
+def test_start_schedule_serves_snapshot_before_firebase(tmp_path):
+    from mqtt_controller import MQTTController
+
+    path = str(tmp_path / "schedule.json")
+    firebase = FakeFirebase(VALUES)
+    ScheduleCache(
+        PATHS, reference=firebase.reference, snapshot_path=path
+    ).start().stop()
+    # Changed remotely while the controller was down
+    firebase.set("/timers/pumps/on", "05:00")
+
+    network = GatedFirebase(firebase)
+    controller = MQTTController(None, None, None, None, None)
+    schedule = controller.start_schedule(
+        PATHS, reference=network.reference, snapshot_path=path
+    )
+    try:
+        # Usable straight away, from the snapshot, while Firebase hangs
+        assert schedule.source == "snapshot"
+        assert not schedule.synced.is_set()
+        assert schedule.get("/timers/pumps/on") == "06:00"
+        assert schedule.snapshot() == VALUES
+
+        network.gate.set()
+        assert schedule.synced.wait(5)
+        assert schedule.get("/timers/pumps/on") == "05:00"
+        assert json.loads(open(path).read())["tree"]["timers"]["pumps"]["on"] == "05:00"
+    finally:
+        network.gate.set()
+        schedule.stop()
@@ -0,0 +1,96 @@
+from telemetry import TelemetrySink
+
+
+# Firebase stand-in: records every multi-path update, fails while offline
+class FakeWriter:
+    def __init__(self):
+        self.online = True
+        self.updates = []
+
+    def reference(self, path="/"):
+        return self
+
+    def update(self, values):
+        if not self.online:
+            raise ConnectionError("network unreachable")
+        self.updates.append(dict(values))
+
+    def written(self):
+        return [key for update in self.updates for key in update]
+
+
+def _key(i):
+    return f"Soil/Moisture_LEFT/{1000 * (1000 + i)}"
+
+
+def _sink(tmp_path, writer, **kwargs):
+    kwargs.setdefault("batch_size", 4)
+    kwargs.setdefault("capacity", 10)
+    return TelemetrySink(
+        spool_path=str(tmp_path / "telemetry.sqlite"),
+        reference=writer.reference,
+        **kwargs,
+    )
+
+
+def test_ring_overflow_spools_and_replays_in_order(tmp_path):
+    writer = FakeWriter()
+    writer.online = False
+    sink = _sink(tmp_path, writer)
+    for i in range(15):
+        sink.record("Soil/Moisture_LEFT", float(i), 1000 + i)
+    stats = sink.stats()
+    assert stats["dropped"] == 5 and stats["queue_depth"] == 10
+    assert stats["high_watermark"] == 10
+
+    # Offline: the whole ring goes to the spool, nothing is lost past this point
+    sink._drain()
+    stats = sink.stats()
+    assert stats["failed_batches"] == 1 and stats["spooled"] == 10
+    assert stats["queue_depth"] == 0
+
+    for i in range(15, 18):
+        sink.record("Soil/Moisture_LEFT", float(i), 1000 + i)
+    writer.online = True
+    sink._drain()
+
+    stats = sink.stats()
+    assert stats["replayed"] == 10
+    assert stats["flushed"] == 13
+    # Live batch first, then the spool oldest first, in batch_size chunks
+    assert [len(update) for update in writer.updates] == [3, 4, 4, 2]
+    assert writer.written() == [_key(i) for i in range(15, 18)] + [
+        _key(i) for i in range(5, 15)
+    ]
+    assert writer.updates[1][_key(5)] == 5.0
+
+    # Nothing replayed twice
+    sink._drain()
+    assert len(writer.updates) == 4
+
+
+def test_spool_survives_restart(tmp_path):
+    writer = FakeWriter()
+    writer.online = False
+    sink = _sink(tmp_path, writer)
+    for i in range(6):
+        sink.record("Soil/Moisture_LEFT", float(i), 1000 + i)
+    sink._drain()
+    sink._spool.close()
+
+    writer.online = True
+    restarted = _sink(tmp_path, writer).start()
+    restarted.record("Soil/Moisture_LEFT", 6.0, 1006)
+    restarted.stop()
+    assert writer.written() == [_key(6)] + [_key(i) for i in range(6)]
+    assert restarted.stats()["replayed"] == 6
+
+
+def test_stop_flushes_what_is_buffered(tmp_path):
+    writer = FakeWriter()
+    sink = _sink(tmp_path, writer, batch_size=100, flush_interval=60).start()
+    for i in range(7):
+        sink.record("Soil/Moisture_LEFT", float(i), 1000 + i)
+    sink.stop()
+    assert writer.written() == [_key(i) for i in range(7)]
+    assert sink.stats()["spooled"] == 0
@@ -0,0 +1,74 @@
+import pytest
+
+from mqtt_controller import BenchMessage, MQTTController
+from topic_router import TopicRouter, is_wildcard, topic_matches
+
+
+@pytest.mark.parametrize(
+    "topic_filter, topic, expected",
+    [
+        ("Soil/Moisture_LEFT", "Soil/Moisture_LEFT", True),
+        ("Soil/Moisture_LEFT", "Soil/Moisture_RIGHT", False),
+        ("Soil/+", "Soil/Moisture_LEFT", True),
+        ("Soil/+", "Soil", False),
+        ("Soil/+", "Soil/a/b", False),
+        ("+/Humidity", "DHT11/Humidity", True),
+        ("+/+", "DHT11/Humidity", True),
+        ("Soil/#", "Soil", True),
+        ("Soil/#", "Soil/a/b/c", True),
+        ("Soil/#", "Water/Quantity", False),
+        ("#", "anything/at/all", True),
+        ("Soil/+/raw", "Soil/LEFT/raw", True),
+        ("Soil/+/raw", "Soil/LEFT/avg", False),
+        ("Soil", "Soil/LEFT", False),
+    ],
+)
+def test_topic_matches(topic_filter, topic, expected):
+    assert topic_matches(topic_filter, topic) is expected
+
+
+def test_is_wildcard():
+    assert is_wildcard("Soil/+") and is_wildcard("#")
+    assert not is_wildcard("Soil/Moisture_LEFT")
+
+
+def test_router_exact_and_wildcard_handlers():
+    router = TopicRouter()
+    exact, soil, any_sensor = object(), object(), object()
+    router.add("Soil/Moisture_LEFT", exact)
+    router.add("Soil/#", soil)
+    router.add("+/+", any_sensor)
+    # The same handler routed twice is called once
+    router.add("Soil/+", soil)
+
+    assert router.match("Soil/Moisture_LEFT") == (exact, soil, any_sensor)
+    assert router.match("Soil/a/b") == (soil,)
+    assert router.match("Water/Quantity") == (any_sensor,)
+    assert router.match("Water") == ()
+
+    router.remove("+/+")
+    assert router.match("Water/Quantity") == ()
+    assert router.match("Soil/Moisture_LEFT") == (exact, soil)
+
+
+def test_dispatch_cache_is_bounded():
+    router = TopicRouter(cache_size=4)
+    router.add("#", object())
+    for i in range(10):
+        router.match(f"topic/{i}")
+    assert len(router._dispatch) <= 4
+
+
+@pytest.mark.parametrize(
+    "payload", [b"", b"nan", b"inf", b"wet", b"\xff\xfe", b"12,5", None, "x" * 100]
+)
+def test_malformed_payload_is_counted_not_raised(payload):
+    controller = MQTTController(None, None, None, None, None)
+    controller.subscribe_to_topics(["Soil/#"])
+    controller.on_message(None, None, BenchMessage("Soil/Moisture_LEFT", payload))
+    assert controller.malformed_payloads == 1
+    assert controller.sensor_values["Soil/Moisture_LEFT"] is None
+
+    controller.on_message(None, None, BenchMessage("Soil/Moisture_LEFT", b" 42.5\n"))
+    assert controller.malformed_payloads == 1
+    assert controller.sensor_values["Soil/Moisture_LEFT"] == 42.5
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+from zone_rules import RuleTable, default_zones, load_zones, make_zone
+
+
+def _commands(commands):
+    return [(zone.name, command) for zone, command in commands]
+
+
+def test_hysteresis_at_thresholds():
+    table = RuleTable([make_zone("BED", "Soil/1", "Pump/1", on_below=35, off_above=60)])
+    state = {}
+    expected = [
+        (50, []),
+        (35.01, []),
+        (35, [("BED", "ON")]),
+        (20, []),
+        (59.99, []),
+        (60, [("BED", "OFF")]),
+        (80, []),
+        (40, []),
+        (10, [("BED", "ON")]),
+    ]
+    for value, commands in expected:
+        got = table.evaluate("Soil/1", value, state)
+        assert _commands(got) == commands, value
+        for zone, command in got:
+            state[f"pump_{zone.name}"] = command
+
+
+def test_no_command_without_value_or_for_unknown_sensor():
+    table = RuleTable(default_zones("Pump/LEFT", "Pump/RIGHT"))
+    assert table.evaluate("Soil/Moisture_LEFT", None, {}) == []
+    assert table.evaluate("Soil/Other", 0, {}) == []
+
+
+@pytest.mark.parametrize("on_below, off_above", [(60, 60), (70, 60)])
+def test_make_zone_rejects_inverted_thresholds(on_below, off_above):
+    with pytest.raises(ValueError):
+        make_zone("BED", "Soil/1", "Pump/1", on_below=on_below, off_above=off_above)
+
+
+def test_zone_names_must_be_unique():
+    with pytest.raises(ValueError):
+        RuleTable(
+            [make_zone("A", "Soil/1", "Pump/1"), make_zone("A", "Soil/2", "Pump/2")]
+        )
+
+
+def test_by_sensor_only_touches_zones_of_that_sensor():
+    zones = [
+        make_zone("A", "Soil/shared", "Pump/A", on_below=30, off_above=50),
+        make_zone("B", "Soil/shared", "Pump/B", on_below=20, off_above=40),
+        make_zone("C", "Soil/other", "Pump/C"),
+    ]
+    table = RuleTable(zones)
+    assert table.sensors() == ["Soil/shared", "Soil/other"]
+    assert [z.name for z in table.by_sensor["Soil/shared"]] == ["A", "B"]
+
+    assert _commands(table.evaluate("Soil/shared", 25, {})) == [("A", "ON")]
+    assert _commands(table.evaluate("Soil/shared", 10, {})) == [
+        ("A", "ON"),
+        ("B", "ON"),
+    ]
+    assert _commands(table.evaluate("Soil/shared", 45, {})) == [("B", "OFF")]
+    assert _commands(table.evaluate("Soil/other", 0, {})) == [("C", "ON")]
+
+
+def test_timer_acts_on_every_zone():
+    # The old if/elif only ever switched one pump per TIMER; every dry zone now
+    table = RuleTable(default_zones("Pump/LEFT", "Pump/RIGHT"))
+    values = {"Soil/Moisture_LEFT": 30, "Soil/Moisture_RIGHT": 50}
+    assert _commands(table.evaluate_timer("pumps_on", values, {})) == [
+        ("LEFT", "ON"),
+        ("RIGHT", "ON"),
+    ]
+    # Already on / too wet for the TIMER / no reading yet
+    state = {"pump_LEFT": "ON"}
+    values = {"Soil/Moisture_LEFT": 30, "Soil/Moisture_RIGHT": 55}
+    assert table.evaluate_timer("pumps_on", values, state) == []
+    assert table.evaluate_timer("pumps_on", {}, {}) == []
+
+    values = {"Soil/Moisture_LEFT": 40, "Soil/Moisture_RIGHT": 70}
+    assert _commands(table.evaluate_timer("pumps_off", values, {})) == [
+        ("LEFT", "OFF"),
+        ("RIGHT", "OFF"),
+    ]
+    values = {"Soil/Moisture_LEFT": 39, "Soil/Moisture_RIGHT": 70}
+    assert (
+        _commands(table.evaluate_timer("pumps_off", values, {"pump_RIGHT": "OFF"}))
+        == []
+    )
+
+
+def test_load_zones_applies_defaults(tmp_path):
+    path = tmp_path / "zones.json"
+    path.write_text(
+        json.dumps(
+            {
+                "defaults": {"on_below": 20},
+                "zones": [
+                    {"name": "A", "sensor": "Soil/A", "pump": "Pump/A"},
+                    {"name": "B", "sensor": "Soil/B", "pump": "Pump/B", "on_below": 30},
+                ],
+            }
+        )
+    )
+    a, b = load_zones(str(path))
+    assert (a.on_below, a.off_above) == (20, 60)
+    assert (b.on_below, b.off_above) == (30, 60)
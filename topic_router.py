@@ -0,0 +1,55 @@
+#! ---------------------------- HELPERs ----------------------------
+
+
+# * MQTT topic filter matching with "+" and "#" wildcards
+def topic_matches(topic_filter, topic):
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def is_wildcard(topic_filter):
+    return "+" in topic_filter or "#" in topic_filter
+
+
+#! ---------------------------- ROUTER ----------------------------
+
+
+class TopicRouter:
+    def __init__(self, cache_size=4096):
+        self.cache_size = cache_size
+        self._exact = {}
+        self._wildcards = []
+        # topic -> handlers, so wildcard filters are only matched once per topic
+        self._dispatch = {}
+
+    def add(self, topic_filter, handler):
+        if is_wildcard(topic_filter):
+            self._wildcards.append((topic_filter, handler))
+        else:
+            self._exact.setdefault(topic_filter, []).append(handler)
+        self._dispatch.clear()
+
+    def remove(self, topic_filter):
+        self._exact.pop(topic_filter, None)
+        self._wildcards = [(f, h) for f, h in self._wildcards if f != topic_filter]
+        self._dispatch.clear()
+
+    # * Handlers for a concrete topic (empty tuple when nothing is routed)
+    def match(self, topic):
+        handlers = self._dispatch.get(topic)
+        if handlers is None:
+            handlers = list(self._exact.get(topic, ()))
+            handlers += [h for f, h in self._wildcards if topic_matches(f, topic)]
+            handlers = tuple(dict.fromkeys(handlers))
+            if len(self._dispatch) >= self.cache_size:
+                self._dispatch.clear()
+            self._dispatch[topic] = handlers
+        return handlers
@@ -0,0 +1,165 @@
+import json
+import random
+import sys
+import time
+from collections import namedtuple
+
+#! ---------------------------- ZONEs ----------------------------
+
+# Thresholds are moisture %, the gap between on_below/off_above is the hysteresis
+Zone = namedtuple(
+    "Zone",
+    [
+        "name",
+        "sensor",
+        "pump",
+        "on_below",
+        "off_above",
+        "timer_on_below",
+        "timer_off_above",
+    ],
+)
+
+DEFAULT_THRESHOLDS = {
+    "on_below": 35,
+    "off_above": 60,
+    "timer_on_below": 55,
+    "timer_off_above": 40,
+}
+
+
+def make_zone(name, sensor, pump, **thresholds):
+    values = dict(DEFAULT_THRESHOLDS, **thresholds)
+    if values["on_below"] >= values["off_above"]:
+        raise ValueError(
+            f"Zone {name}: on_below ({values['on_below']}) must be lower than "
+            f"off_above ({values['off_above']})"
+        )
+    return Zone(name, sensor, pump, **values)
+
+
+# * The two beds this controller was originally written for
+def default_zones(topic_pump_left, topic_pump_right):
+    return [
+        make_zone("LEFT", "Soil/Moisture_LEFT", topic_pump_left),
+        make_zone("RIGHT", "Soil/Moisture_RIGHT", topic_pump_right),
+    ]
+
+
+# * Load zones from JSON: {"defaults": {...}, "zones": [{"name", "sensor", "pump", ...}]}
+def load_zones(path):
+    with open(path) as f:
+        config = json.load(f)
+
+    defaults = config.get("defaults", {})
+    zones = []
+    for entry in config["zones"]:
+        entry = dict(defaults, **entry)
+        zones.append(
+            make_zone(
+                entry.pop("name"), entry.pop("sensor"), entry.pop("pump"), **entry
+            )
+        )
+    return zones
+
+
+#! ---------------------------- RULE TABLE ----------------------------
+
+
+class RuleTable:
+    def __init__(self, zones):
+        self.zones = list(zones)
+
+        names = [zone.name for zone in self.zones]
+        if len(names) != len(set(names)):
+            raise ValueError("Zone names must be unique")
+
+        # sensor topic -> zones it drives, so a message only touches its own rules
+        self.by_sensor = {}
+        for zone in self.zones:
+            self.by_sensor.setdefault(zone.sensor, []).append(zone)
+
+    def sensors(self):
+        return list(self.by_sensor)
+
+    # * Commands for ONE changed sensor: [(zone, "ON"|"OFF"), ...]
+    def evaluate(self, topic, value, state):
+        commands = []
+        if value is None:
+            return commands
+        for zone in self.by_sensor.get(topic, ()):
+            if value <= zone.on_below:
+                command = "ON"
+            elif value >= zone.off_above:
+                command = "OFF"
+            else:
+                continue
+            if state.get(f"pump_{zone.name}") != command:
+                commands.append((zone, command))
+        return commands
+
+    # * Commands for a TIMER action across every zone
+    def evaluate_timer(self, action, sensor_values, state):
+        commands = []
+        for zone in self.zones:
+            value = sensor_values.get(zone.sensor)
+            if value is None:
+                continue
+            key = f"pump_{zone.name}"
+            if action == "pumps_on" and value < zone.timer_on_below:
+                if state.get(key) != "ON":
+                    commands.append((zone, "ON"))
+            elif action == "pumps_off" and value >= zone.timer_off_above:
+                if state.get(key) != "OFF":
+                    commands.append((zone, "OFF"))
+        return commands
+
+
+#! ---------------------------- BENCHMARK ----------------------------
+
+
+def benchmark(num_zones=5000, num_messages=200000):
+    zones = [
+        make_zone(f"BED_{i}", f"Soil/Moisture_{i}", f"Pump/{i}")
+        for i in range(num_zones)
+    ]
+    table = RuleTable(zones)
+    state = {}
+    rng = random.Random(0)
+    messages = [
+        (f"Soil/Moisture_{rng.randrange(num_zones)}", rng.uniform(0, 100))
+        for _ in range(num_messages)
+    ]
+
+    start = time.perf_counter()
+    commands = 0
+    for topic, value in messages:
+        for zone, command in table.evaluate(topic, value, state):
+            state[f"pump_{zone.name}"] = command
+            commands += 1
+    elapsed = time.perf_counter() - start
+
+    # Old behaviour for comparison: re-check every zone on each message
+    values = {}
+    scan_messages = messages[: max(1, num_messages // num_zones * 10)]
+    start = time.perf_counter()
+    for topic, value in scan_messages:
+        values[topic] = value
+        for zone in table.zones:
+            table.evaluate(zone.sensor, values.get(zone.sensor), state)
+    scan_elapsed = time.perf_counter() - start
+
+    print(f"[BENCH] zones={num_zones} messages={num_messages} commands={commands}")
+    # Both in messages/sec: a full-scan message evaluates every zone
+    indexed_rate = num_messages / elapsed
+    scan_rate = len(scan_messages) / scan_elapsed
+    print(f"[BENCH] indexed  : {indexed_rate:,.0f} messages/sec")
+    print(
+        f"[BENCH] full scan: {scan_rate:,.0f} messages/sec "
+        f"({scan_rate * num_zones:,.0f} zone evaluations/sec), "
+        f"indexed is {indexed_rate / scan_rate:,.0f}x faster"
+    )
+
+
+if __name__ == "__main__":
+    benchmark(*(int(arg) for arg in sys.argv[1:3]))